@@ -28,6 +28,53 @@ def config_loggers(*args, **kwargs):
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
 
+# Colas y enrutado de tareas
+# ------------------------------------------------------------------------------
+# Cada tipo de trabajo tiene su propia cola para que un ciclo lento de cuotas no
+# retrase las respuestas a los usuarios:
+#
+#   ingest             Ingesta de datos de fútbol (update_live_fixtures, update_live_odds,
+#                      enrich_hot_fixtures, execute_api_request...). Intensiva en BD.
+#   webhook            Payloads de webhook de WhatsApp encolados sin procesar por la vista
+#                      (receive_whatsapp_webhook), que los reparte en los carriles inbound_<plan>.
+#   inbound_<plan>     Mensajes entrantes y runs del asistente (process_whatsapp_message,
+#                      run_debounced_assistant, stream_assistant_run), un carril por plan
+#                      (inbound_pro, inbound_premium, inbound_free; ver whatsapp/plan_lanes.py).
+#   assistant_polling  Sondeo de runs (process_assistant_run, track_assistant_runs).
+#   outbound           Envío de respuestas y mensajes a WhatsApp (handle_tracked_run_event,
+#                      deliver_outbound_step; ver whatsapp/outbound.py).
+#   admin              Cola por defecto: planificadores, mantenimiento
+#                      (refresh_conversation_summary) y el resto de tareas.
+#
+# Perfiles de worker (compose/production/django/celery/worker/start, variables
+# CELERY_WORKER_QUEUES, CELERY_WORKER_POOL y CELERY_WORKER_CONCURRENCY):
+#
+#   - ingest,admin: pool prefork, concurrencia baja (trabajo de CPU/BD).
+#   - webhook,inbound_*,assistant_polling,outbound: pool threads con concurrencia alta
+#     (las tareas esperan a Meta y OpenAI casi todo el tiempo).
+#   - inbound_pro: worker propio (pool threads), de modo que los usuarios PRO no
+#     esperan detrás de una avalancha de mensajes de los carriles gratuitos.
+#
+# Las tareas "fire-and-forget" se declaran con ignore_result=True para no escribir
+# resultados en Redis que nadie consulta.
+app.conf.task_default_queue = "admin"
+app.conf.task_routes = (
+    # Carril del plan del usuario para el trabajo del asistente
+    "deep90_app.apps.whatsapp.plan_lanes.route_to_lane",
+    {
+        "deep90_app.apps.sports_data.tasks.schedule_periodic_tasks": {"queue": "admin"},
+        "deep90_app.apps.sports_data.live_tasks.schedule_live_tasks": {"queue": "admin"},
+        "deep90_app.apps.sports_data.live_tasks.check_and_reset_stalled_tasks": {"queue": "admin"},
+        "deep90_app.apps.sports_data.*": {"queue": "ingest"},
+        "deep90_app.apps.whatsapp.tasks.receive_whatsapp_webhook": {"queue": "webhook"},
+        "deep90_app.apps.whatsapp.tasks.process_assistant_run": {"queue": "assistant_polling"},
+        "deep90_app.apps.whatsapp.tasks.track_assistant_runs": {"queue": "assistant_polling"},
+        "deep90_app.apps.whatsapp.tasks.process_assistant_response": {"queue": "assistant_polling"},
+        "deep90_app.apps.whatsapp.tasks.handle_tracked_run_event": {"queue": "outbound"},
+        "deep90_app.apps.whatsapp.tasks.deliver_outbound_step": {"queue": "outbound"},
+    },
+)
+
 # Configure periodic tasks
 app.conf.beat_schedule = {
     # Tarea para programar la ejecución de tareas API de fútbol
@@ -46,4 +93,47 @@ app.conf.beat_schedule = {
         "schedule": crontab(minute="*/3"),  # Cada 3 minutos
         "options": {"expires": 60},  # La tarea expira a los 60 segundos si no se ejecuta
     },
+    # Calendario diario de partidos de las ligas seguidas
+    "sync-fixture-calendar": {
+        "task": "deep90_app.apps.sports_data.tasks.sync_fixture_calendar",
+        "schedule": crontab(hour="4", minute="0"),  # Cada día a las 4:00
+    },
+    # Limpieza de los partidos terminados hace más de FIXTURE_RETENTION_DAYS
+    "purge-finished-fixtures": {
+        "task": "deep90_app.apps.sports_data.tasks.purge_old_fixtures",
+        "schedule": crontab(hour="4", minute="30"),  # Cada día a las 4:30
+    },
+    # Enriquecimiento (alineaciones, estadísticas, eventos) de partidos con demanda
+    "enrich-hot-fixtures": {
+        "task": "deep90_app.apps.sports_data.live_tasks.enrich_hot_fixtures",
+        "schedule": 30.0,  # Cada 30 segundos (más frecuente que la consulta básica)
+        "options": {"expires": 30},
+    },
+    # Limpieza del enriquecimiento de partidos que ya terminaron
+    "purge-live-fixture-enrichments": {
+        "task": "deep90_app.apps.sports_data.live_tasks.purge_live_fixture_enrichments",
+        "schedule": crontab(minute="20"),  # Cada hora, en el minuto 20
+    },
+    # Red de seguridad del tracker central de runs del asistente (normalmente se lanza bajo demanda)
+    "track-assistant-runs": {
+        "task": "deep90_app.apps.whatsapp.tasks.track_assistant_runs",
+        "schedule": crontab(minute="*"),  # Cada minuto
+        "options": {"expires": 60},
+    },
+    # Limpieza de los IDs de mensajes entrantes usados para descartar reintentos del webhook
+    "purge-inbound-messages": {
+        "task": "deep90_app.apps.whatsapp.tasks.purge_inbound_messages",
+        "schedule": crontab(hour="3", minute="30"),  # Cada día a las 3:30
+    },
+    # Mensajes entrantes pendientes de usuarios que ningún worker atiende (caída de un worker)
+    "drain-stalled-users": {
+        "task": "deep90_app.apps.whatsapp.tasks.drain_stalled_users",
+        "schedule": crontab(minute="*"),  # Cada minuto
+        "options": {"expires": 60},
+    },
+    # Corrección de los contadores diarios de mensajes de Redis con la base de datos
+    "reconcile-daily-message-counters": {
+        "task": "deep90_app.apps.whatsapp.tasks.reconcile_daily_message_counters",
+        "schedule": crontab(minute="*/15"),  # Cada 15 minutos
+    },
 }
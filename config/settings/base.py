@@ -301,13 +301,17 @@ CELERY_TASK_TIME_LIMIT = 5 * 60
 # TODO: set to whatever value is adequate in your circumstances
 CELERY_TASK_SOFT_TIME_LIMIT = 60
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html#beat-scheduler
-CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
+# DatabaseScheduler con elección de líder para la ingesta en vivo (ver sports_data/schedulers.py)
+CELERY_BEAT_SCHEDULER = "deep90_app.apps.sports_data.schedulers:LeaderDatabaseScheduler"
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html#worker-send-task-events
 CELERY_WORKER_SEND_TASK_EVENTS = True
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html#std-setting-task_send_sent_event
 CELERY_TASK_SEND_SENT_EVENT = True
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html#worker-hijack-root-logger
 CELERY_WORKER_HIJACK_ROOT_LOGGER = False
+# https://docs.celeryq.dev/en/stable/userguide/configuration.html#worker-prefetch-multiplier
+# Sin prefetch un worker no acapara tareas de un carril mientras otro espera
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
 # django-allauth
 # ------------------------------------------------------------------------------
 ACCOUNT_ALLOW_REGISTRATION = env.bool("DJANGO_ACCOUNT_ALLOW_REGISTRATION", True)
@@ -363,6 +367,8 @@ WHATSAPP_VERIFY_TOKEN = env("WHATSAPP_VERIFY_TOKEN")
 WHATSAPP_ACCESS_TOKEN = env("WHATSAPP_ACCESS_TOKEN")
 WHATSAPP_PHONE_NUMBER_ID = env("WHATSAPP_PHONE_NUMBER_ID")
 WHATSAPP_VERSION_API = env("WHATSAPP_VERSION_API", default="v22.0")  # Añadida esta línea con un valor por defecto
+# Secreto de la app de Meta con el que se firman los webhooks (X-Hub-Signature-256); vacío = sin verificación
+WHATSAPP_APP_SECRET = env("WHATSAPP_APP_SECRET", default="")
 
 # WhatsApp Flows Configuration
 # ------------------------------------------------------------------------------
@@ -456,4 +462,115 @@ WHATSAPP_ERROR_UNSUPPORTED = env(
 # Use production values in production environment
 LIVE_FIXTURES_INTERVAL = env.int("LIVE_FIXTURES_INTERVAL", default=60)  # 1 minute LIVE_FIXTURES_INTERVAL
 LIVE_ODDS_INTERVAL = env.int("LIVE_ODDS_INTERVAL", default=60)  # 1 minute LIVE_ODDS_INTERVAL
-MONITOR_INTERVAL = env.int("MONITOR_INTERVAL", default=30)  # 30 seconds MONITOR_INTERVAL  
\ No newline at end of file
+MONITOR_INTERVAL = env.int("MONITOR_INTERVAL", default=30)  # 30 seconds MONITOR_INTERVAL  
+# Vigencia de los payloads precalculados de consultar_partido_en_vivo (se sobrescriben en cada ingesta)
+LIVE_PAYLOAD_TTL = env.int("LIVE_PAYLOAD_TTL", default=300)  # 5 minutes LIVE_PAYLOAD_TTL
+# Respuesta de consultar_partido_en_vivo para el asistente: "compact" (presupuesto de tokens) o "full"
+LIVE_TOOL_PAYLOAD_MODE = env("LIVE_TOOL_PAYLOAD_MODE", default="compact")
+LIVE_TOOL_TOKEN_BUDGET = env.int("LIVE_TOOL_TOKEN_BUDGET", default=600)  # approx. tokens LIVE_TOOL_TOKEN_BUDGET
+# Tiempo (segundos) que un partido se considera "caliente" tras abrir su detalle en un Flow
+HOT_FIXTURE_TTL = env.int("HOT_FIXTURE_TTL", default=900)  # 15 minutes HOT_FIXTURE_TTL
+# Horas que se conserva el enriquecimiento (alineaciones, estadísticas) de un partido que ya no está en vivo
+LIVE_ENRICHMENT_RETENTION_HOURS = env.int("LIVE_ENRICHMENT_RETENTION_HOURS", default=24)
+
+# FIXTURE CALENDAR
+# ------------------------------------------------------------------------------
+# Ligas seguidas por el calendario diario (además de las favoritas de los usuarios)
+FIXTURE_CALENDAR_LEAGUES = env.list("FIXTURE_CALENDAR_LEAGUES", default=[])
+FIXTURE_CALENDAR_DAYS = env.int("FIXTURE_CALENDAR_DAYS", default=7)  # 7 days FIXTURE_CALENDAR_DAYS
+# Días que se conservan en FixtureData los partidos ya terminados
+FIXTURE_RETENTION_DAYS = env.int("FIXTURE_RETENTION_DAYS", default=30)
+LIVE_KICKOFF_LEAD_MINUTES = env.int("LIVE_KICKOFF_LEAD_MINUTES", default=15)  # start polling 15 minutes before kickoff
+LIVE_MATCH_WINDOW_MINUTES = env.int("LIVE_MATCH_WINDOW_MINUTES", default=150)  # a match is considered live up to 150 minutes after kickoff
+# Sin partidos de ligas seguidas la consulta live=all se espacia como mucho este tiempo: es lo que
+# puede tardar en aparecer un partido en juego de una liga no seguida
+LIVE_IDLE_MAX_SLEEP = env.int("LIVE_IDLE_MAX_SLEEP", default=300)  # 5 minutes LIVE_IDLE_MAX_SLEEP
+
+# LIVE INGEST LEADER ELECTION
+# ------------------------------------------------------------------------------
+# Duración del lease del beat líder; un beat en espera lo releva cuando expira (ver sports_data/leader.py)
+LIVE_LEADER_LEASE_SECONDS = env.int("LIVE_LEADER_LEASE_SECONDS", default=15)
+# Cada cuánto renueva el líder su lease (y lo reclaman los beats en espera); menor que el lease
+LIVE_LEADER_HEARTBEAT_SECONDS = env.int("LIVE_LEADER_HEARTBEAT_SECONDS", default=5)
+# Prefijo del identificador de cada proceso candidato (por defecto, el hostname)
+LIVE_LEADER_NODE_ID = env("LIVE_LEADER_NODE_ID", default="")
+
+# ASSISTANT TOOLS
+# ------------------------------------------------------------------------------
+# Hilos para ejecutar en paralelo las tool calls de un mismo requires_action
+ASSISTANT_TOOL_WORKERS = env.int("ASSISTANT_TOOL_WORKERS", default=4)
+# Modo de ejecución de los runs: "stream" (eventos en el mismo worker), "tracker"
+# (sondeo central con asyncio, ver run_tracker.py) o "poll" (re-encolado por run)
+ASSISTANT_RUN_MODE = env("ASSISTANT_RUN_MODE", default="stream")
+ASSISTANT_POLL_INTERVAL = env.int("ASSISTANT_POLL_INTERVAL", default=3)  # seconds between polls in "poll" mode
+# Ventana para agrupar ráfagas de mensajes de un usuario en un único run (0 = desactivado)
+ASSISTANT_DEBOUNCE_SECONDS = env.float("ASSISTANT_DEBOUNCE_SECONDS", default=2.0)
+# Tiempo durante el que un hilo verificado se considera existente sin volver a consultarlo
+THREAD_ALIVE_TTL = env.int("THREAD_ALIVE_TTL", default=60 * 60 * 6)  # 6 hours THREAD_ALIVE_TTL
+
+# ASSISTANT RUN TRACKER
+# ------------------------------------------------------------------------------
+RUN_TRACKER_TICK = env.float("RUN_TRACKER_TICK", default=0.25)  # seconds between tracker passes
+RUN_TRACKER_CONCURRENCY = env.int("RUN_TRACKER_CONCURRENCY", default=50)  # concurrent runs.retrieve calls
+RUN_TRACKER_LIFETIME = env.int("RUN_TRACKER_LIFETIME", default=55)  # seconds a tracker task runs before handing over
+RUN_TRACKER_MAX_AGE = env.int("RUN_TRACKER_MAX_AGE", default=600)  # a run still pending after 10 minutes is reported as failed
+
+# OPENAI CLIENT
+# ------------------------------------------------------------------------------
+# Un cliente por proceso (ver whatsapp/openai_client.py)
+OPENAI_POOL_MAX_CONNECTIONS = env.int("OPENAI_POOL_MAX_CONNECTIONS", default=20)
+OPENAI_POOL_MAX_KEEPALIVE = env.int("OPENAI_POOL_MAX_KEEPALIVE", default=10)
+OPENAI_KEEPALIVE_EXPIRY = env.float("OPENAI_KEEPALIVE_EXPIRY", default=60.0)  # seconds an idle connection is kept open
+OPENAI_TIMEOUT = env.float("OPENAI_TIMEOUT", default=60.0)  # read/write timeout in seconds
+OPENAI_CONNECT_TIMEOUT = env.float("OPENAI_CONNECT_TIMEOUT", default=5.0)
+OPENAI_MAX_RETRIES = env.int("OPENAI_MAX_RETRIES", default=2)
+
+# ASSISTANT ANSWER CACHE
+# ------------------------------------------------------------------------------
+# Tipos de conversación cuyas respuestas se reutilizan para la misma pregunta, partido y datos
+ANSWER_CACHE_TYPES = env.list("ANSWER_CACHE_TYPES", default=["PREDICTIONS"])
+ANSWER_CACHE_TTL = env.int("ANSWER_CACHE_TTL", default=60)  # 1 minute ANSWER_CACHE_TTL
+
+# MANAGED CONVERSATION CONTEXT
+# ------------------------------------------------------------------------------
+# Tipos de conversación cuyo historial se gestiona desde la tabla Message (ver whatsapp/context_manager.py)
+MANAGED_CONTEXT_TYPES = env.list("MANAGED_CONTEXT_TYPES", default=[])
+CONTEXT_WINDOW_MESSAGES = env.int("CONTEXT_WINDOW_MESSAGES", default=12)  # recent messages sent verbatim
+CONTEXT_SUMMARY_BATCH = env.int("CONTEXT_SUMMARY_BATCH", default=6)  # messages outside the window before refreshing the summary
+CONTEXT_SUMMARY_MAX_WORDS = env.int("CONTEXT_SUMMARY_MAX_WORDS", default=200)
+CONTEXT_SUMMARY_MODEL = env("CONTEXT_SUMMARY_MODEL", default="gpt-4o-mini")
+
+# PLAN PRIORITY LANES
+# ------------------------------------------------------------------------------
+# Llamadas simultáneas a OpenAI repartidas entre planes según su peso (ver whatsapp/plan_lanes.py)
+ASSISTANT_OPENAI_CONCURRENCY = env.int("ASSISTANT_OPENAI_CONCURRENCY", default=60)
+PLAN_LANE_WEIGHTS = {
+    "pro": env.int("PLAN_LANE_WEIGHT_PRO", default=3),
+    "premium": env.int("PLAN_LANE_WEIGHT_PREMIUM", default=2),
+    "free": env.int("PLAN_LANE_WEIGHT_FREE", default=1),
+}
+PLAN_LANE_RETRY_SECONDS = env.float("PLAN_LANE_RETRY_SECONDS", default=1.0)  # delay for runs deferred by a full lane
+PLAN_SLOT_MAX_AGE = env.int("PLAN_SLOT_MAX_AGE", default=180)  # seconds before an unreleased slot is reclaimed
+
+# OUTBOUND SEQUENCER
+# ------------------------------------------------------------------------------
+# Pausa entre mensajes consecutivos a un mismo usuario (ver whatsapp/outbound.py)
+OUTBOUND_STEP_DELAY = env.float("OUTBOUND_STEP_DELAY", default=1.0)
+
+# ORDERED INBOUND PROCESSING
+# ------------------------------------------------------------------------------
+# Tiempo que un worker retiene los mensajes de un usuario sin renovar el lock (ver whatsapp/inbound_queue.py)
+INBOUND_LOCK_TTL = env.int("INBOUND_LOCK_TTL", default=300)
+
+# WEBHOOK IDEMPOTENCY
+# ------------------------------------------------------------------------------
+# Ventana en la que Redis recuerda un message.id para descartar reintentos de Meta (ver whatsapp/dedup.py)
+WEBHOOK_DEDUP_TTL = env.int("WEBHOOK_DEDUP_TTL", default=24 * 60 * 60)
+INBOUND_MESSAGE_RETENTION_DAYS = env.int("INBOUND_MESSAGE_RETENTION_DAYS", default=7)  # rows kept in InboundMessage
+
+# USER PROFILE CACHE
+# ------------------------------------------------------------------------------
+# Perfil y configuración del asistente de cada usuario cacheados en Redis y en memoria (ver whatsapp/user_cache.py)
+USER_CACHE_TTL = env.int("USER_CACHE_TTL", default=300)  # seconds an entry lives in Redis
+USER_CACHE_LOCAL_TTL = env.float("USER_CACHE_LOCAL_TTL", default=5.0)  # seconds an entry lives in process memory
+USER_CACHE_LOCAL_SIZE = env.int("USER_CACHE_LOCAL_SIZE", default=5000)  # entries kept per process
@@ -5,7 +5,7 @@ from django.http import JsonResponse
 from .models import (
     APIEndpoint, APIParameter, ScheduledTask, APIResult, 
     FixtureData, LeagueData, StandingData,
-    LiveFixtureTask, LiveFixtureData, LiveOddsTask, LiveOddsData,
+    LiveFixtureTask, LiveFixtureData, LiveFixtureHistory, LiveFixtureEvent, LiveFixtureEnrichment, LiveOddsTask, LiveOddsData,
     LiveOddsCategory, LiveOddsValue
 )
 from .live_tasks import toggle_task_status, restart_task
@@ -316,6 +316,37 @@ class LiveFixtureDataAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(LiveFixtureHistory)
+class LiveFixtureHistoryAdmin(admin.ModelAdmin):
+    """Admin para el historial compacto de partidos en vivo"""
+    list_display = ['fixture_id', 'home_team_name', 'away_team_name', 'started_at', 'changes_count', 'updated_at']
+    search_fields = ['fixture_id', 'home_team_name', 'away_team_name']
+    readonly_fields = ['fixture_id', 'home_team_name', 'away_team_name', 'started_at', 'base_state', 'last_state', 'deltas', 'updated_at']
+    
+    def changes_count(self, obj):
+        """Número de cambios registrados"""
+        return len(obj.deltas or [])
+    
+    changes_count.short_description = "Cambios"
+
+
+@admin.register(LiveFixtureEvent)
+class LiveFixtureEventAdmin(admin.ModelAdmin):
+    """Admin para eventos de partidos en vivo"""
+    list_display = ['fixture_id', 'minute', 'event_type', 'detail', 'team_name', 'player_name', 'created_at']
+    list_filter = ['event_type']
+    search_fields = ['fixture_id', 'team_name', 'player_name']
+
+
+@admin.register(LiveFixtureEnrichment)
+class LiveFixtureEnrichmentAdmin(admin.ModelAdmin):
+    """Admin para el enriquecimiento de partidos con demanda"""
+    list_display = ['fixture_id', 'hot_reason', 'lineups_updated_at', 'statistics_updated_at', 'updated_at']
+    list_filter = ['hot_reason']
+    search_fields = ['fixture_id']
+    readonly_fields = ['lineups', 'statistics', 'lineups_updated_at', 'statistics_updated_at', 'updated_at']
+
+
 @admin.register(LiveOddsData)
 class LiveOddsDataAdmin(admin.ModelAdmin):
     """Admin para datos de cuotas en vivo"""
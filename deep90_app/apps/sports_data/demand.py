@@ -0,0 +1,98 @@
+import logging
+from typing import Dict, Iterable, Set
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import LiveFixtureData
+
+logger = logging.getLogger(__name__)
+
+# Prefijo de las marcas de demanda guardadas en caché
+HOT_FIXTURE_KEY = "hot_fixture:{fixture_id}"
+
+
+def _to_int_ids(values: Iterable) -> Set[int]:
+    """
+    Convierte una colección de IDs (int, str o dict con 'id') en un conjunto de enteros.
+
+    Args:
+        values: Valores a convertir
+
+    Returns:
+        Conjunto de IDs válidos
+    """
+    ids = set()
+    for value in values or []:
+        if isinstance(value, dict):
+            value = value.get('id')
+        try:
+            ids.add(int(value))
+        except (TypeError, ValueError):
+            continue
+    return ids
+
+
+def mark_fixture_hot(fixture_id, reason: str = 'flow') -> None:
+    """
+    Marca un partido como "caliente" durante HOT_FIXTURE_TTL segundos.
+
+    Se usa para señales de demanda efímeras (por ejemplo, la vista de detalle
+    de un Flow); las conversaciones activas y los favoritos se leen directamente
+    de la base de datos.
+
+    Args:
+        fixture_id: ID del partido
+        reason: Origen de la señal de demanda
+    """
+    try:
+        cache.set(HOT_FIXTURE_KEY.format(fixture_id=int(fixture_id)), reason, settings.HOT_FIXTURE_TTL)
+    except Exception as e:
+        logger.warning(f"No se pudo marcar el partido {fixture_id} como caliente: {str(e)}")
+
+
+def get_hot_fixture_ids() -> Dict[int, str]:
+    """
+    Calcula los partidos en vivo con demanda real de usuarios.
+
+    Un partido es caliente si alguna conversación activa lo está analizando,
+    si alguien abrió su detalle en un Flow recientemente o si juega un equipo
+    favorito de algún usuario.
+
+    Returns:
+        Diccionario {fixture_id: motivo} con los partidos calientes en vivo
+    """
+    from deep90_app.apps.whatsapp.models import Conversation, UserPreference
+
+    live_fixtures = list(
+        LiveFixtureData.objects.values_list('fixture_id', 'home_team_id', 'away_team_id')
+    )
+    live_ids = {fixture_id for fixture_id, _, _ in live_fixtures}
+    hot = {}
+
+    # 1. Conversaciones activas sobre un partido
+    conversation_ids = _to_int_ids(
+        Conversation.objects.filter(is_active=True, fixture_id__isnull=False)
+        .values_list('fixture_id', flat=True)
+    )
+    for fixture_id in conversation_ids & live_ids:
+        hot[fixture_id] = 'conversation'
+
+    # 2. Vistas de detalle recientes (una sola lectura múltiple en caché)
+    try:
+        keys = {HOT_FIXTURE_KEY.format(fixture_id=fixture_id): fixture_id for fixture_id in live_ids}
+        for key, reason in cache.get_many(list(keys)).items():
+            hot.setdefault(keys[key], reason)
+    except Exception as e:
+        logger.warning(f"No se pudieron leer las marcas de demanda: {str(e)}")
+
+    # 3. Partidos de equipos favoritos
+    favorite_teams = set()
+    for teams in UserPreference.objects.exclude(favorite_teams=[]).values_list('favorite_teams', flat=True):
+        favorite_teams |= _to_int_ids(teams)
+    if favorite_teams:
+        for fixture_id, home_team_id, away_team_id in live_fixtures:
+            if home_team_id in favorite_teams or away_team_id in favorite_teams:
+                hot.setdefault(fixture_id, 'favorite')
+
+    return hot
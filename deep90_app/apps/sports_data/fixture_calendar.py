@@ -0,0 +1,309 @@
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional, Set
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import FixtureData, LeagueData, LiveFixtureData
+from .services import ResponseProcessor
+
+logger = logging.getLogger(__name__)
+
+# Índice compacto por día: lista de [fixture_id, timestamp, league_id, status_short]
+CALENDAR_DAY_KEY = "fixture_calendar:{day}"
+
+# Campos que se comparan para decidir si un partido del calendario cambió
+CALENDAR_COMPARE_FIELDS = ('date', 'status_short', 'home_goals', 'away_goals', 'league_round', 'venue_name')
+
+# Campos de FixtureData que se reescriben al actualizar un partido que cambió
+FIXTURE_UPDATE_FIELDS = [
+    'fixture_id', 'date', 'timestamp', 'timezone', 'status_long', 'status_short', 'elapsed',
+    'venue_id', 'venue_name', 'venue_city',
+    'home_team_id', 'home_team_name', 'home_team_logo', 'home_team_winner',
+    'away_team_id', 'away_team_name', 'away_team_logo', 'away_team_winner',
+    'home_goals', 'away_goals', 'home_halftime', 'away_halftime', 'home_fulltime', 'away_fulltime',
+    'home_extratime', 'away_extratime', 'home_penalty', 'away_penalty',
+    'league_id', 'league_name', 'league_country', 'league_logo', 'league_flag', 'league_season', 'league_round',
+    'query_date',
+]
+
+# Estados de partido en juego
+IN_PLAY_STATUSES = ['1H', '2H', 'HT', 'ET', 'BT', 'P', 'INT', 'LIVE']
+
+# Estados de partido terminado (finalizado, cancelado, abandonado o adjudicado)
+FINISHED_STATUSES = ['FT', 'AET', 'PEN', 'WO', 'AWD', 'CANC', 'ABD']
+
+
+def get_followed_league_ids() -> Set[int]:
+    """
+    Obtiene las ligas seguidas: las configuradas en FIXTURE_CALENDAR_LEAGUES más
+    las ligas favoritas de los usuarios.
+
+    Returns:
+        Conjunto de IDs de liga
+    """
+    from deep90_app.apps.whatsapp.models import UserPreference
+
+    league_ids = set()
+    for value in settings.FIXTURE_CALENDAR_LEAGUES:
+        try:
+            league_ids.add(int(value))
+        except (TypeError, ValueError):
+            continue
+
+    for leagues in UserPreference.objects.exclude(favorite_leagues=[]).values_list('favorite_leagues', flat=True):
+        for value in leagues or []:
+            if isinstance(value, dict):
+                value = value.get('id')
+            try:
+                league_ids.add(int(value))
+            except (TypeError, ValueError):
+                continue
+
+    return league_ids
+
+
+def _league_season(league_id: int, today: date) -> int:
+    """
+    Obtiene la temporada actual de una liga (por defecto, el año en curso).
+    """
+    season = LeagueData.objects.filter(league_id=league_id, is_current=True).values_list('season', flat=True).first()
+    return season or today.year
+
+
+def sync_calendar(days: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Carga de forma incremental los próximos ``days`` días de partidos de las ligas
+    seguidas en FixtureData y reconstruye el índice por día.
+
+    Solo se crean los partidos nuevos y se actualizan los que cambiaron; el resto
+    no genera escrituras.
+
+    Args:
+        days: Número de días hacia adelante (por defecto FIXTURE_CALENDAR_DAYS)
+
+    Returns:
+        Diccionario con el resultado de la sincronización
+    """
+    days = days or settings.FIXTURE_CALENDAR_DAYS
+    today = timezone.localdate()
+    end_day = today + timedelta(days=days)
+    league_ids = get_followed_league_ids()
+
+    if not league_ids:
+        return {'success': True, 'message': 'No hay ligas seguidas', 'created': 0, 'updated': 0}
+
+    headers = {
+        'x-rapidapi-host': 'v3.football.api-sports.io',
+        'x-rapidapi-key': settings.API_FOOTBALL_KEY,
+    }
+    url = f"{settings.API_SPORTS_BASE_URL.rstrip('/')}/fixtures"
+
+    created = 0
+    updated = 0
+    errors = []
+    for league_id in sorted(league_ids):
+        try:
+            params = {
+                'league': league_id,
+                'season': _league_season(league_id, today),
+                'from': today.isoformat(),
+                'to': end_day.isoformat(),
+                'timezone': settings.TIME_ZONE,
+            }
+            response = requests.get(url=url, headers=headers, params=params, timeout=30)
+            if response.status_code != 200:
+                raise Exception(f"Error en la API: {response.status_code} - {response.text}")
+
+            league_created, league_updated = upsert_fixtures(response.json().get('response', []))
+            created += league_created
+            updated += league_updated
+        except Exception as e:
+            logger.error(f"Error sincronizando el calendario de la liga {league_id}: {str(e)}")
+            errors.append({'league_id': league_id, 'error': str(e)})
+
+    for offset in range(days + 1):
+        build_day_index(today + timedelta(days=offset))
+
+    return {
+        'success': not errors,
+        'leagues': len(league_ids),
+        'created': created,
+        'updated': updated,
+        'errors': errors,
+    }
+
+
+def upsert_fixtures(fixtures: List[Dict[str, Any]], result=None) -> tuple:
+    """
+    Inserta los partidos nuevos y actualiza solo los que cambiaron.
+
+    Args:
+        fixtures: Lista de partidos tal como la devuelve el endpoint fixtures
+        result: APIResult del que provienen (None para el calendario); los partidos
+            creados o actualizados quedan enlazados a él
+
+    Returns:
+        Tupla (creados, actualizados)
+    """
+    rows = {}
+    for fixture_data in fixtures:
+        fields = ResponseProcessor.fixture_fields(fixture_data)
+        if fields['fixture_id'] and fields['date']:
+            rows[fields['fixture_id']] = fields
+
+    existing = {
+        fixture.fixture_id: fixture
+        for fixture in FixtureData.objects.filter(fixture_id__in=list(rows))
+    }
+
+    to_create = []
+    to_update = []
+    for fixture_id, fields in rows.items():
+        fixture = existing.get(fixture_id)
+        if fixture is None:
+            to_create.append(FixtureData(result=result, **fields))
+            continue
+        if any(getattr(fixture, field) != fields[field] for field in CALENDAR_COMPARE_FIELDS):
+            for field, value in fields.items():
+                setattr(fixture, field, value)
+            fixture.query_date = timezone.now()
+            if result is not None:
+                fixture.result = result
+            to_update.append(fixture)
+
+    if to_create:
+        FixtureData.objects.bulk_create(to_create)
+    if to_update:
+        update_fields = FIXTURE_UPDATE_FIELDS + ['result'] if result is not None else FIXTURE_UPDATE_FIELDS
+        FixtureData.objects.bulk_update(to_update, update_fields)
+
+    return len(to_create), len(to_update)
+
+
+def purge_finished_fixtures(days: Optional[int] = None) -> int:
+    """
+    Elimina los partidos terminados hace más de ``days`` días.
+
+    Los partidos ya no se borran al procesar cada resultado de la API (se
+    actualizan en su sitio), así que sin esta limpieza la tabla crece sin límite.
+
+    Args:
+        days: Días que se conservan (por defecto FIXTURE_RETENTION_DAYS)
+
+    Returns:
+        Número de partidos eliminados
+    """
+    days = days or settings.FIXTURE_RETENTION_DAYS
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = FixtureData.objects.filter(status_short__in=FINISHED_STATUSES, date__lt=cutoff).delete()
+    return deleted
+
+
+def build_day_index(day: date) -> List[list]:
+    """
+    Reconstruye y guarda en caché el índice compacto de partidos de un día.
+
+    Args:
+        day: Día (zona horaria local)
+
+    Returns:
+        Lista de [fixture_id, timestamp, league_id, status_short] ordenada por hora
+    """
+    start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+    entries = [
+        list(entry) for entry in
+        FixtureData.objects.filter(date__gte=start, date__lt=start + timedelta(days=1))
+        .order_by('timestamp')
+        .values_list('fixture_id', 'timestamp', 'league_id', 'status_short')
+        .distinct()
+    ]
+    try:
+        cache.set(CALENDAR_DAY_KEY.format(day=day.isoformat()), entries, 60 * 60 * 24 * 2)
+    except Exception as e:
+        logger.warning(f"No se pudo guardar el índice del calendario para {day}: {str(e)}")
+    return entries
+
+
+def get_day_index(day: date) -> List[list]:
+    """
+    Obtiene el índice compacto de un día desde la caché, reconstruyéndolo si falta.
+    """
+    try:
+        entries = cache.get(CALENDAR_DAY_KEY.format(day=day.isoformat()))
+    except Exception:
+        entries = None
+    if entries is None:
+        entries = build_day_index(day)
+    return entries
+
+
+def get_kickoffs_between(start: datetime, end: datetime) -> List[list]:
+    """
+    Obtiene los partidos del calendario con inicio entre dos instantes.
+
+    Args:
+        start: Instante inicial
+        end: Instante final
+
+    Returns:
+        Lista de entradas del índice por día
+    """
+    start_ts = int(start.timestamp())
+    end_ts = int(end.timestamp())
+    day = timezone.localtime(start).date()
+    last_day = timezone.localtime(end).date()
+
+    kickoffs = []
+    while day <= last_day:
+        kickoffs.extend(entry for entry in get_day_index(day) if start_ts <= entry[1] <= end_ts)
+        day += timedelta(days=1)
+    return kickoffs
+
+
+def get_next_poll_delay(interval_seconds: int, now: Optional[datetime] = None) -> int:
+    """
+    Calcula cuándo debe volver a consultarse la API de partidos en vivo según el calendario.
+
+    - Con partidos en juego (o iniciados dentro de LIVE_MATCH_WINDOW_MINUTES): intervalo normal.
+    - Con un inicio dentro de LIVE_KICKOFF_LEAD_MINUTES: consulta de calentamiento al doble del intervalo.
+    - Sin actividad: se duerme hasta el próximo inicio menos la antelación
+      (como máximo LIVE_IDLE_MAX_SLEEP segundos). El calendario solo conoce las
+      ligas seguidas, así que ese tope es también lo que puede tardar en verse un
+      partido en juego de otra liga.
+    - Sin ligas seguidas no hay calendario y se mantiene el intervalo normal.
+
+    Args:
+        interval_seconds: Intervalo configurado en la tarea
+        now: Instante de referencia (por defecto ahora)
+
+    Returns:
+        Segundos hasta la próxima consulta
+    """
+    now = now or timezone.now()
+    try:
+        if not get_followed_league_ids():
+            return interval_seconds
+
+        if LiveFixtureData.objects.filter(status_short__in=IN_PLAY_STATUSES).exists():
+            return interval_seconds
+
+        window = timedelta(minutes=settings.LIVE_MATCH_WINDOW_MINUTES)
+        lead = timedelta(minutes=settings.LIVE_KICKOFF_LEAD_MINUTES)
+        if get_kickoffs_between(now - window, now):
+            return interval_seconds
+        if get_kickoffs_between(now, now + lead):
+            return interval_seconds * 2
+
+        upcoming = get_kickoffs_between(now, now + timedelta(seconds=settings.LIVE_IDLE_MAX_SLEEP) + lead)
+        if upcoming:
+            next_kickoff = min(entry[1] for entry in upcoming)
+            delay = next_kickoff - int((now + lead).timestamp())
+            return max(interval_seconds, delay)
+        return settings.LIVE_IDLE_MAX_SLEEP
+    except Exception as e:
+        logger.warning(f"No se pudo calcular el intervalo según el calendario: {str(e)}")
+        return interval_seconds
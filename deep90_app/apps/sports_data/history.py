@@ -0,0 +1,190 @@
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from django.utils import timezone
+
+from .models import LiveFixtureHistory
+
+logger = logging.getLogger(__name__)
+
+# Campos del estado de un partido que se registran en el historial
+TRACKED_FIELDS = ('status_short', 'elapsed', 'home_goals', 'away_goals', 'home_red_cards', 'away_red_cards')
+
+# Campos cuyo cambio indica que hay eventos nuevos que consultar
+EVENT_TRIGGER_FIELDS = ('status_short', 'home_goals', 'away_goals')
+
+# Detalles de eventos de la API que implican una expulsión
+RED_CARD_DETAILS = ('Red Card', 'Second Yellow card')
+
+
+class LiveFixtureHistoryService:
+    """
+    Servicio para registrar y reproducir el historial de estado de los partidos en vivo.
+
+    Cada ingesta de partidos en vivo llama a ``record`` y solo se almacenan los
+    campos que cambiaron respecto al último estado conocido (codificación delta).
+    """
+
+    @staticmethod
+    def extract_state(fixture_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Extrae el estado compacto de un partido desde la respuesta de la API.
+
+        Args:
+            fixture_data: Elemento de ``response`` del endpoint /fixtures
+
+        Returns:
+            Diccionario con los campos de TRACKED_FIELDS
+        """
+        fixture = fixture_data.get('fixture') or {}
+        status = fixture.get('status') or {}
+        goals = fixture_data.get('goals') or {}
+        teams = fixture_data.get('teams') or {}
+        home_id = (teams.get('home') or {}).get('id')
+        away_id = (teams.get('away') or {}).get('id')
+
+        # Contar tarjetas rojas a partir de los eventos incluidos en raw_data
+        home_red_cards = 0
+        away_red_cards = 0
+        for event in fixture_data.get('events') or []:
+            if event.get('type') != 'Card' or event.get('detail') not in RED_CARD_DETAILS:
+                continue
+            team_id = (event.get('team') or {}).get('id')
+            if team_id == home_id:
+                home_red_cards += 1
+            elif team_id == away_id:
+                away_red_cards += 1
+
+        return {
+            'status_short': status.get('short'),
+            'elapsed': status.get('elapsed'),
+            'home_goals': goals.get('home'),
+            'away_goals': goals.get('away'),
+            'home_red_cards': home_red_cards,
+            'away_red_cards': away_red_cards,
+        }
+
+    @staticmethod
+    def diff_states(previous: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Calcula los campos que cambiaron entre dos estados.
+
+        Args:
+            previous: Estado anterior
+            current: Estado actual
+
+        Returns:
+            Diccionario solo con los campos modificados y su nuevo valor
+        """
+        return {
+            field: current.get(field)
+            for field in TRACKED_FIELDS
+            if previous.get(field) != current.get(field)
+        }
+
+    @staticmethod
+    def has_event_changes(changes: Dict[str, Any]) -> bool:
+        """
+        Indica si los cambios detectados justifican consultar los eventos del partido.
+
+        Args:
+            changes: Campos modificados devueltos por ``record``
+
+        Returns:
+            True si cambió el marcador o el estado del partido
+        """
+        return any(field in changes for field in EVENT_TRIGGER_FIELDS)
+
+    @staticmethod
+    def record(fixture_data: Dict[str, Any], observed_at: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Registra el estado actual de un partido y devuelve los campos que cambiaron.
+
+        Args:
+            fixture_data: Elemento de ``response`` del endpoint /fixtures
+            observed_at: Momento de la observación (por defecto ahora)
+
+        Returns:
+            Diccionario con los campos modificados; en la primera observación
+            contiene el estado completo
+        """
+        observed_at = observed_at or timezone.now()
+        fixture_id = fixture_data['fixture']['id']
+        state = LiveFixtureHistoryService.extract_state(fixture_data)
+
+        history = LiveFixtureHistory.objects.filter(fixture_id=fixture_id).first()
+        if history is None:
+            teams = fixture_data.get('teams') or {}
+            LiveFixtureHistory.objects.create(
+                fixture_id=fixture_id,
+                home_team_name=(teams.get('home') or {}).get('name') or '',
+                away_team_name=(teams.get('away') or {}).get('name') or '',
+                started_at=observed_at,
+                base_state=state,
+                last_state=state,
+                deltas=[],
+            )
+            return state
+
+        changes = LiveFixtureHistoryService.diff_states(history.last_state, state)
+        if not changes:
+            return {}
+
+        offset = int((observed_at - history.started_at).total_seconds())
+        history.deltas.append([offset, changes])
+        history.last_state = state
+        history.save(update_fields=['deltas', 'last_state', 'updated_at'])
+        return changes
+
+    @staticmethod
+    def state_at(fixture_id: int, at: datetime) -> Optional[Dict[str, Any]]:
+        """
+        Reconstruye el estado de un partido en un instante dado.
+
+        Args:
+            fixture_id: ID del partido
+            at: Instante a consultar
+
+        Returns:
+            Estado del partido en ese instante, o None si no hay historial
+            o el instante es anterior a la primera observación
+        """
+        history = LiveFixtureHistory.objects.filter(fixture_id=fixture_id).first()
+        if history is None or at < history.started_at:
+            return None
+
+        limit = (at - history.started_at).total_seconds()
+        state = dict(history.base_state)
+        for offset, changes in history.deltas:
+            if offset > limit:
+                break
+            state.update(changes)
+        return state
+
+    @staticmethod
+    def replay(fixture_id: int) -> List[Dict[str, Any]]:
+        """
+        Reproduce la línea de tiempo completa de un partido.
+
+        Args:
+            fixture_id: ID del partido
+
+        Returns:
+            Lista ordenada de pasos con el instante, los cambios y el estado
+            resultante tras aplicarlos
+        """
+        history = LiveFixtureHistory.objects.filter(fixture_id=fixture_id).first()
+        if history is None:
+            return []
+
+        state = dict(history.base_state)
+        timeline = [{'at': history.started_at, 'changes': dict(state), 'state': dict(state)}]
+        for offset, changes in history.deltas:
+            state.update(changes)
+            timeline.append({
+                'at': history.started_at + timezone.timedelta(seconds=offset),
+                'changes': changes,
+                'state': dict(state),
+            })
+        return timeline
@@ -0,0 +1,199 @@
+"""
+Elección del líder de la ingesta en vivo.
+
+Los candidatos son los procesos de celery beat (ver schedulers.py): solo el
+líder publica las tareas de LEADER_TASKS, con su token de fencing en los
+argumentos, y los workers descartan las ejecuciones con un token anterior al
+vigente (``is_token_current``).
+
+Cada proceso tiene un identificador propio (host, pid y un sufijo aleatorio),
+así que dos beats en el mismo host no comparten liderazgo. El lease es corto
+(LIVE_LEADER_LEASE_SECONDS) y un heartbeat lo renueva cada
+LIVE_LEADER_HEARTBEAT_SECONDS con un compare-and-set atómico; si el líder muere,
+otro candidato lo releva en cuanto el lease expira.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Dict, Any, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from deep90_app.utils import redis_store
+
+logger = logging.getLogger(__name__)
+
+# Claves del lease de liderazgo y de las métricas (en la caché Redis compartida)
+LEADER_KEY = "live_ingest:leader"
+TOKEN_KEY = "live_ingest:fencing_token"
+LAST_SEEN_KEY = "live_ingest:leader_last_seen"
+METRIC_FAILOVERS_KEY = "live_ingest:metrics:failovers"
+METRIC_LAST_FAILOVER_KEY = "live_ingest:metrics:last_failover_seconds"
+METRIC_DUPLICATE_RUNS_KEY = "live_ingest:metrics:duplicate_runs"
+METRIC_SKIPPED_KEY = "live_ingest:metrics:skipped_non_leader"
+
+# Tareas periódicas que solo publica el líder
+LEADER_TASKS = {
+    'deep90_app.apps.sports_data.live_tasks.schedule_live_tasks',
+    'deep90_app.apps.sports_data.live_tasks.check_and_reset_stalled_tasks',
+    'deep90_app.apps.sports_data.live_tasks.enrich_hot_fixtures',
+}
+
+# Sufijo aleatorio por proceso (un hijo creado con fork obtiene el suyo)
+_process_suffix: Dict[int, str] = {}
+_heartbeat_lock = threading.Lock()
+_heartbeat_thread: Optional[threading.Thread] = None
+
+
+def get_node_id() -> str:
+    """
+    Identificador único del proceso: prefijo del nodo (LIVE_LEADER_NODE_ID o el
+    hostname), pid y un sufijo aleatorio.
+    """
+    pid = os.getpid()
+    suffix = _process_suffix.setdefault(pid, uuid.uuid4().hex[:8])
+    return f"{settings.LIVE_LEADER_NODE_ID or socket.gethostname()}:{pid}:{suffix}"
+
+
+def _read_leader() -> Tuple[Optional[str], Optional[int], Optional[str]]:
+    """Lease vigente como (valor, token, nodo), o (None, None, None) si no hay líder."""
+    value = redis_store.get_value(LEADER_KEY)
+    if not value:
+        return None, None, None
+    token, _, node = value.partition(':')
+    return value, int(token), node
+
+
+def _incr(key: str) -> None:
+    """Incrementa un contador de métricas creándolo si no existe."""
+    try:
+        cache.add(key, 0, None)
+        cache.incr(key)
+    except Exception as e:
+        logger.warning(f"No se pudo actualizar la métrica {key}: {str(e)}")
+
+
+def acquire_leadership() -> Optional[int]:
+    """
+    Intenta obtener o renovar el lease de liderazgo de la ingesta en vivo.
+
+    La renovación solo prolonga el lease si sigue siendo de este proceso
+    (compare-and-set); la adquisición usa SET NX, de modo que nunca hay dos
+    líderes con el lease vigente. Cada nuevo líder recibe un token de fencing
+    mayor que el anterior.
+
+    Returns:
+        Token de fencing si este proceso es el líder, None en caso contrario
+    """
+    node_id = get_node_id()
+    lease = settings.LIVE_LEADER_LEASE_SECONDS
+    now = time.time()
+    try:
+        value, token, node = _read_leader()
+        if node == node_id and redis_store.compare_and_expire(LEADER_KEY, value, lease):
+            cache.set(LAST_SEEN_KEY, now, 60 * 60)
+            return token
+
+        if value:
+            _incr(METRIC_SKIPPED_KEY)
+            return None
+
+        cache.add(TOKEN_KEY, 0, None)
+        token = cache.incr(TOKEN_KEY)
+        if not redis_store.set_if_absent(LEADER_KEY, f"{token}:{node_id}", lease):
+            # Otro proceso ganó la carrera
+            _incr(METRIC_SKIPPED_KEY)
+            return None
+
+        last_seen = cache.get(LAST_SEEN_KEY)
+        if last_seen:
+            failover_seconds = round(now - last_seen, 2)
+            cache.set(METRIC_LAST_FAILOVER_KEY, failover_seconds, None)
+            _incr(METRIC_FAILOVERS_KEY)
+            logger.warning(f"Proceso {node_id} asume el liderazgo de la ingesta en vivo (token {token}, failover {failover_seconds}s)")
+        else:
+            logger.info(f"Proceso {node_id} asume el liderazgo de la ingesta en vivo (token {token})")
+        cache.set(LAST_SEEN_KEY, now, 60 * 60)
+        return token
+    except Exception as e:
+        logger.error(f"Error en la elección de líder de la ingesta en vivo: {str(e)}")
+        return None
+
+
+def get_leader_token() -> Optional[int]:
+    """Token de fencing de este proceso si tiene el lease vigente, None en caso contrario."""
+    try:
+        _, token, node = _read_leader()
+    except Exception as e:
+        logger.warning(f"No se pudo leer el líder de la ingesta en vivo: {str(e)}")
+        return None
+    return token if node == get_node_id() else None
+
+
+def _heartbeat() -> None:
+    while True:
+        acquire_leadership()
+        time.sleep(settings.LIVE_LEADER_HEARTBEAT_SECONDS)
+
+
+def start_heartbeat() -> None:
+    """
+    Lanza (una vez por proceso) el hilo que se presenta como candidato y renueva
+    el lease cada LIVE_LEADER_HEARTBEAT_SECONDS.
+    """
+    global _heartbeat_thread
+    with _heartbeat_lock:
+        if _heartbeat_thread is not None and _heartbeat_thread.is_alive():
+            return
+        _heartbeat_thread = threading.Thread(target=_heartbeat, name='live-leader-heartbeat', daemon=True)
+        _heartbeat_thread.start()
+
+
+def is_token_current(token: Optional[int]) -> bool:
+    """
+    Verifica que un token de fencing sigue siendo el vigente antes de escribir.
+
+    Las ejecuciones sin token (lanzadas manualmente desde el dashboard) siempre
+    se permiten. Las que traen un token antiguo se cuentan como ejecuciones duplicadas.
+
+    Args:
+        token: Token recibido al programar la tarea
+
+    Returns:
+        True si la tarea puede escribir
+    """
+    if token is None:
+        return True
+    try:
+        _, current, _ = _read_leader()
+    except Exception:
+        return True
+    if current is not None and token < current:
+        _incr(METRIC_DUPLICATE_RUNS_KEY)
+        logger.warning(f"Ejecución descartada con token de fencing obsoleto ({token} < {current})")
+        return False
+    return True
+
+
+def get_leader_status() -> Dict[str, Any]:
+    """
+    Obtiene el estado del liderazgo y sus métricas.
+
+    Returns:
+        Diccionario con líder actual, token, failovers y ejecuciones duplicadas
+    """
+    _, token, node = _read_leader()
+    return {
+        'node': get_node_id(),
+        'leader': node,
+        'is_leader': node == get_node_id(),
+        'fencing_token': token,
+        'failovers': cache.get(METRIC_FAILOVERS_KEY, 0),
+        'last_failover_seconds': cache.get(METRIC_LAST_FAILOVER_KEY),
+        'duplicate_runs': cache.get(METRIC_DUPLICATE_RUNS_KEY, 0),
+        'skipped_non_leader': cache.get(METRIC_SKIPPED_KEY, 0),
+    }
@@ -0,0 +1,446 @@
+import json
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .history import LiveFixtureHistoryService
+from .models import LiveFixtureData, LiveFixtureEnrichment, LiveFixtureEvent, LiveOddsData
+
+logger = logging.getLogger(__name__)
+
+# Payload serializado por partido que devuelve la herramienta consultar_partido_en_vivo
+LIVE_PAYLOAD_KEY = "live_payload:{fixture_id}"
+COMPACT_PAYLOAD_KEY = "live_payload:compact:{fixture_id}"
+# Cuotas principales actuales y las anteriores a su último cambio ({'previous': ..., 'current': ...}),
+# para calcular el movimiento de cuotas
+HEADLINE_ODDS_KEY = "live_payload:headline_odds:{fixture_id}"
+
+# Mercados principales del payload compacto, en orden de prioridad (se recortan desde el final)
+HEADLINE_MARKETS = (
+    'Fulltime Result',
+    'Match Winner',
+    'Double Chance',
+    'Over/Under',
+    'Both Teams',
+    'Next Goal',
+    'Asian Handicap',
+)
+
+# Máximo de eventos recientes en el payload compacto
+COMPACT_MAX_EVENTS = 8
+
+# Máximo de valores por mercado cuando la API no marca la línea principal
+COMPACT_MAX_VALUES = 6
+
+# Estadísticas de los partidos con demanda (LiveFixtureEnrichment) en el payload compacto,
+# en orden de prioridad (se recortan desde el final)
+COMPACT_STATISTICS = (
+    'Ball Possession',
+    'Shots on Goal',
+    'Total Shots',
+    'expected_goals',
+    'Corner Kicks',
+    'Fouls',
+)
+
+
+def _serialize_fixture(fixture: LiveFixtureData) -> dict:
+    """Convierte un LiveFixtureData en diccionario (todos los campos más raw_data)."""
+    fixture_data = {
+        field.name: getattr(fixture, field.name) for field in fixture._meta.fields if field.name != 'raw_data'
+    }
+    # Incluir raw_data si existe
+    if fixture.raw_data:
+        fixture_data['raw_data'] = fixture.raw_data
+    return fixture_data
+
+
+def _serialize_odds(odds: Optional[LiveOddsData]) -> Optional[dict]:
+    """
+    Convierte un LiveOddsData en diccionario con sus categorías y valores.
+
+    Las categorías y valores deben venir precargados con
+    ``prefetch_related('odds_categories__values')`` para evitar consultas N+1.
+    """
+    if not odds:
+        return None
+    odds_data = {field.name: getattr(odds, field.name) for field in odds._meta.fields if field.name not in ['raw_odds_data']}
+    if odds.raw_odds_data:
+        odds_data['raw_odds_data'] = odds.raw_odds_data
+    # Agregar categorías y valores
+    odds_data['categories'] = [
+        {
+            'id': cat.category_id,
+            'name': cat.name,
+            'values': [
+                {
+                    'value': v.value,
+                    'odd': v.odd,
+                    'handicap': v.handicap,
+                    'main': v.main,
+                    'suspended': v.suspended
+                } for v in cat.values.all()
+            ]
+        } for cat in odds.odds_categories.all()
+    ]
+    return odds_data
+
+
+def _load_live_fixtures(fixture_ids: Optional[Iterable[int]] = None) -> tuple:
+    """
+    Carga partidos en vivo y sus cuotas (con categorías y valores precargados).
+
+    Args:
+        fixture_ids: IDs de los partidos (por defecto, todos los partidos en vivo)
+
+    Returns:
+        Tupla ({fixture_id: LiveFixtureData}, {fixture_id: LiveOddsData})
+    """
+    fixtures_query = LiveFixtureData.objects.order_by('-updated_at').select_related('task')
+    if fixture_ids is not None:
+        fixtures_query = fixtures_query.filter(fixture_id__in=list(fixture_ids))
+
+    fixtures = {}
+    for fixture in fixtures_query:
+        fixtures.setdefault(fixture.fixture_id, fixture)
+    odds_by_fixture = {}
+    odds_query = LiveOddsData.objects.order_by('-updated_at').select_related('task').prefetch_related(
+        'odds_categories__values'
+    )
+    for odds in odds_query.filter(fixture_id__in=list(fixtures)):
+        odds_by_fixture.setdefault(odds.fixture_id, odds)
+    return fixtures, odds_by_fixture
+
+
+def _full_payload(fixture: LiveFixtureData, odds: Optional[LiveOddsData]) -> str:
+    """Serializa el payload completo (todos los campos y datos en bruto) de un partido."""
+    return json.dumps({
+        'fixture': _serialize_fixture(fixture),
+        'odds': _serialize_odds(odds)
+    }, ensure_ascii=False, default=str)
+
+
+def _stored_events(fixture_ids: Iterable[int]) -> Dict[int, List[LiveFixtureEvent]]:
+    """Carga en una consulta los eventos guardados de varios partidos."""
+    stored_events = {}
+    for event in LiveFixtureEvent.objects.filter(fixture_id__in=list(fixture_ids)):
+        stored_events.setdefault(event.fixture_id, []).append(event)
+    return stored_events
+
+
+def _stored_enrichments(fixture_ids: Iterable[int]) -> Dict[int, LiveFixtureEnrichment]:
+    """Carga en una consulta el enriquecimiento (alineaciones y estadísticas) de varios partidos."""
+    return {
+        enrichment.fixture_id: enrichment
+        for enrichment in LiveFixtureEnrichment.objects.filter(fixture_id__in=list(fixture_ids))
+    }
+
+
+def build_live_fixture_payloads(fixture_ids: Optional[Iterable[int]] = None) -> Dict[int, str]:
+    """
+    Construye los payloads completos serializados de varios partidos con un número
+    fijo de consultas (partidos y cuotas con sus categorías/valores precargados).
+
+    Args:
+        fixture_ids: IDs de los partidos (por defecto, todos los partidos en vivo)
+
+    Returns:
+        Diccionario {fixture_id: payload JSON}
+    """
+    fixtures, odds_by_fixture = _load_live_fixtures(fixture_ids)
+    return {
+        fixture_id: _full_payload(fixture, odds_by_fixture.get(fixture_id))
+        for fixture_id, fixture in fixtures.items()
+    }
+
+
+def estimate_tokens(payload: str) -> int:
+    """
+    Estimación rápida de tokens de un texto JSON (aprox. 4 caracteres por token).
+    """
+    return (len(payload) + 3) // 4
+
+
+def _headline_markets(odds: Optional[LiveOddsData]) -> Dict[str, Dict[str, str]]:
+    """
+    Extrae los mercados principales de unas cuotas, en el orden de HEADLINE_MARKETS.
+
+    Args:
+        odds: Cuotas con categorías y valores precargados
+
+    Returns:
+        Diccionario ordenado {mercado: {selección: cuota}}
+    """
+    if not odds:
+        return {}
+    categories = list(odds.odds_categories.all())
+    markets = {}
+    for pattern in HEADLINE_MARKETS:
+        category = next(
+            (cat for cat in categories if pattern.lower() in cat.name.lower() and cat.name not in markets),
+            None
+        )
+        if category is None:
+            continue
+        values = [v for v in category.values.all() if not v.suspended]
+        main_values = [v for v in values if v.main]
+        selected = main_values or values[:COMPACT_MAX_VALUES]
+        if selected:
+            markets[category.name] = {
+                (f"{v.value} {v.handicap}" if v.handicap else v.value): v.odd for v in selected
+            }
+    return markets
+
+
+def _odds_movement(previous: Dict[str, Dict[str, str]], current: Dict[str, Dict[str, str]]) -> Dict[str, Dict[str, list]]:
+    """
+    Calcula el movimiento de cuotas respecto a las anteriores ({mercado: {selección: [antes, ahora]}}).
+    """
+    movement = {}
+    for market, values in current.items():
+        changed = {
+            label: [previous[market][label], odd]
+            for label, odd in values.items()
+            if label in previous.get(market, {}) and previous[market][label] != odd
+        }
+        if changed:
+            movement[market] = changed
+    return movement
+
+
+def _advance_headline_odds(state: Optional[dict], markets: Dict[str, Dict[str, str]]) -> dict:
+    """
+    Estado de las cuotas principales tras un ciclo de ingesta.
+
+    La referencia del movimiento solo avanza cuando las cuotas cambian: un ciclo
+    de partidos (sin cuotas nuevas) conserva el movimiento calculado en el último
+    ciclo de cuotas.
+    """
+    state = state or {}
+    if markets == state.get('current'):
+        return state
+    return {'previous': state.get('current') or {}, 'current': markets}
+
+
+def _compact_statistics(enrichment: Optional[LiveFixtureEnrichment]) -> Dict[str, list]:
+    """
+    Obtiene las estadísticas de COMPACT_STATISTICS como {estadística: [local, visitante]}.
+    """
+    teams = (enrichment.statistics if enrichment else None) or []
+    if len(teams) < 2:
+        return {}
+    values = [
+        {item.get('type'): item.get('value') for item in team.get('statistics') or []}
+        for team in teams[:2]
+    ]
+    return {
+        name: [values[0].get(name), values[1].get(name)]
+        for name in COMPACT_STATISTICS
+        if values[0].get(name) is not None or values[1].get(name) is not None
+    }
+
+
+def _compact_formations(enrichment: Optional[LiveFixtureEnrichment]) -> list:
+    """Obtiene las formaciones [local, visitante] de las alineaciones, o [] si no hay alineaciones."""
+    teams = (enrichment.lineups if enrichment else None) or []
+    if len(teams) < 2:
+        return []
+    return [team.get('formation') or '' for team in teams[:2]]
+
+
+def _recent_events(fixture: LiveFixtureData, stored_events: List[LiveFixtureEvent]) -> List[list]:
+    """
+    Obtiene los eventos recientes como [minuto, tipo, detalle, equipo, jugador],
+    del más reciente al más antiguo.
+    """
+    events = []
+    for event in (fixture.raw_data or {}).get('events') or []:
+        time_data = event.get('time') or {}
+        events.append([
+            time_data.get('elapsed') or 0,
+            event.get('type') or '',
+            event.get('detail') or '',
+            (event.get('team') or {}).get('name') or '',
+            (event.get('player') or {}).get('name') or '',
+        ])
+    if not events:
+        events = [
+            [event.minute, event.event_type, event.detail, event.team_name, event.player_name]
+            for event in stored_events
+        ]
+    events.sort(key=lambda event: event[0], reverse=True)
+    return events[:COMPACT_MAX_EVENTS]
+
+
+def build_compact_payload(fixture: LiveFixtureData, odds: Optional[LiveOddsData],
+                          stored_events: Optional[List[LiveFixtureEvent]] = None,
+                          previous_markets: Optional[Dict[str, Dict[str, str]]] = None,
+                          token_budget: Optional[int] = None,
+                          enrichment: Optional[LiveFixtureEnrichment] = None) -> str:
+    """
+    Construye el payload compacto de un partido para el asistente.
+
+    Incluye marcador y estado, tarjetas rojas, eventos recientes, mercados
+    principales y el movimiento de cuotas desde el ciclo anterior. Los partidos
+    con demanda (enrich_hot_fixtures) añaden sus formaciones y estadísticas. El
+    orden de los campos es fijo y, si se supera el presupuesto de tokens, se
+    recortan de forma determinista: primero los eventos más antiguos, después
+    las estadísticas de menor prioridad, los mercados de menor prioridad y por
+    último el movimiento de cuotas.
+
+    Args:
+        fixture: Partido en vivo
+        odds: Cuotas del partido (con categorías y valores precargados)
+        stored_events: Eventos guardados del partido (si raw_data no los trae)
+        previous_markets: Mercados principales anteriores al último cambio de cuotas
+        token_budget: Presupuesto de tokens (por defecto LIVE_TOOL_TOKEN_BUDGET)
+        enrichment: Alineaciones y estadísticas del partido, si tiene demanda
+
+    Returns:
+        Payload JSON compacto
+    """
+    token_budget = token_budget or settings.LIVE_TOOL_TOKEN_BUDGET
+    state = LiveFixtureHistoryService.extract_state(fixture.raw_data or {})
+    markets = _headline_markets(odds)
+    payload = {
+        'fixture_id': fixture.fixture_id,
+        'league': f"{fixture.league_name} ({fixture.league_country})",
+        'home': fixture.home_team_name,
+        'away': fixture.away_team_name,
+        'score': [fixture.home_goals, fixture.away_goals],
+        'status': fixture.status_short,
+        'elapsed': fixture.elapsed,
+        'red_cards': [state['home_red_cards'], state['away_red_cards']],
+        'events': _recent_events(fixture, stored_events or []),
+        'odds_status': (
+            'blocked' if odds and odds.is_blocked else
+            'stopped' if odds and odds.is_stopped else
+            'finished' if odds and odds.is_finished else
+            'open' if odds else 'unavailable'
+        ),
+        'markets': markets,
+        'odds_movement': _odds_movement(previous_markets or {}, markets),
+    }
+    formations = _compact_formations(enrichment)
+    if formations:
+        payload['formations'] = formations
+    statistics = _compact_statistics(enrichment)
+    if statistics:
+        payload['statistics'] = statistics
+
+    def serialize():
+        return json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=str)
+
+    serialized = serialize()
+    while estimate_tokens(serialized) > token_budget:
+        if len(payload['events']) > 1:
+            payload['events'].pop()
+        elif payload.get('statistics'):
+            payload['statistics'].pop(list(payload['statistics'])[-1])
+            if not payload['statistics']:
+                del payload['statistics']
+        elif len(payload['markets']) > 1:
+            payload['markets'].pop(list(payload['markets'])[-1])
+            payload['odds_movement'] = {
+                market: values for market, values in payload['odds_movement'].items() if market in payload['markets']
+            }
+        elif payload['odds_movement']:
+            payload['odds_movement'] = {}
+        else:
+            break
+        serialized = serialize()
+    return serialized
+
+
+def refresh_live_fixture_payloads(stale_fixture_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Reconstruye y guarda en caché los payloads (completo y compacto) de todos los partidos en vivo.
+
+    Se llama una vez por ciclo de ingesta (partidos o cuotas): cada escritura
+    sobrescribe el payload anterior y los partidos que dejaron de estar en vivo
+    se eliminan de la caché. Los mercados principales se guardan, junto con los
+    anteriores a su último cambio, para calcular el movimiento de cuotas.
+
+    Args:
+        stale_fixture_ids: IDs que estaban en vivo antes de la ingesta
+
+    Returns:
+        Número de partidos guardados
+    """
+    try:
+        fixtures, odds_by_fixture = _load_live_fixtures()
+        stored_events = _stored_events(fixtures)
+        enrichments = _stored_enrichments(fixtures)
+        headline_states = cache.get_many([HEADLINE_ODDS_KEY.format(fixture_id=fixture_id) for fixture_id in fixtures])
+
+        entries = {}
+        for fixture_id, fixture in fixtures.items():
+            odds = odds_by_fixture.get(fixture_id)
+            markets_key = HEADLINE_ODDS_KEY.format(fixture_id=fixture_id)
+            markets = _headline_markets(odds)
+            headline_state = _advance_headline_odds(headline_states.get(markets_key), markets)
+            entries[LIVE_PAYLOAD_KEY.format(fixture_id=fixture_id)] = _full_payload(fixture, odds)
+            entries[COMPACT_PAYLOAD_KEY.format(fixture_id=fixture_id)] = build_compact_payload(
+                fixture, odds, stored_events.get(fixture_id), headline_state.get('previous'),
+                enrichment=enrichments.get(fixture_id),
+            )
+            if markets:
+                entries[markets_key] = headline_state
+        cache.set_many(entries, settings.LIVE_PAYLOAD_TTL)
+
+        removed = set(stale_fixture_ids or []) - set(fixtures)
+        if removed:
+            cache.delete_many([
+                key.format(fixture_id=fixture_id)
+                for fixture_id in removed
+                for key in (LIVE_PAYLOAD_KEY, COMPACT_PAYLOAD_KEY, HEADLINE_ODDS_KEY)
+            ])
+        return len(fixtures)
+    except Exception as e:
+        logger.error(f"Error guardando los payloads de partidos en vivo: {str(e)}")
+        return 0
+
+
+def get_live_fixture_payload(fixture_id, compact: bool = False) -> Optional[str]:
+    """
+    Obtiene el payload serializado de un partido: una sola lectura de caché y,
+    si no existe, se construye desde la base de datos y se guarda.
+
+    Args:
+        fixture_id: ID del partido
+        compact: True para el payload compacto con presupuesto de tokens
+
+    Returns:
+        Payload JSON o None si el partido no está en vivo
+    """
+    fixture_id = int(fixture_id)
+    key = (COMPACT_PAYLOAD_KEY if compact else LIVE_PAYLOAD_KEY).format(fixture_id=fixture_id)
+    try:
+        payload = cache.get(key)
+        if payload is not None:
+            return payload
+    except Exception as e:
+        logger.warning(f"No se pudo leer el payload del partido {fixture_id} de la caché: {str(e)}")
+
+    fixtures, odds_by_fixture = _load_live_fixtures([fixture_id])
+    fixture = fixtures.get(fixture_id)
+    if fixture is None:
+        return None
+    odds = odds_by_fixture.get(fixture_id)
+    if compact:
+        headline_state = _advance_headline_odds(
+            cache.get(HEADLINE_ODDS_KEY.format(fixture_id=fixture_id)), _headline_markets(odds)
+        )
+        payload = build_compact_payload(
+            fixture, odds, _stored_events([fixture_id]).get(fixture_id), headline_state.get('previous'),
+            enrichment=_stored_enrichments([fixture_id]).get(fixture_id),
+        )
+    else:
+        payload = _full_payload(fixture, odds)
+    try:
+        cache.set(key, payload, settings.LIVE_PAYLOAD_TTL)
+    except Exception:
+        pass
+    return payload
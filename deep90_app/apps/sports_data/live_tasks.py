@@ -1,7 +1,7 @@
 import json
 import logging
 import time
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import requests
 from celery import shared_task
 from django.conf import settings
@@ -10,7 +10,15 @@ from django_celery_beat.models import PeriodicTask, IntervalSchedule
 from django.contrib.auth import get_user_model
 from django.db import transaction
 
-from .models import LiveFixtureTask, LiveOddsTask, LiveFixtureData, LiveOddsData, LiveOddsCategory, LiveOddsValue
+from .models import (
+    LiveFixtureTask, LiveOddsTask, LiveFixtureData, LiveFixtureEvent, LiveFixtureEnrichment,
+    LiveOddsData, LiveOddsCategory, LiveOddsValue
+)
+from .history import LiveFixtureHistoryService
+from .demand import get_hot_fixture_ids
+from .fixture_calendar import get_next_poll_delay
+from .leader import is_token_current
+from .live_payloads import refresh_live_fixture_payloads
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -321,26 +329,33 @@ def clean_invalid_periodic_tasks():
     return deleted
 
 
-@shared_task
-def check_and_reset_stalled_tasks() -> Dict[str, Any]:
+@shared_task(ignore_result=True)
+def check_and_reset_stalled_tasks(fencing_token: Optional[int] = None) -> Dict[str, Any]:
     """
     Tarea programada que verifica periódicamente si hay tareas con next_run en el pasado
     y las reprograma para ejecución inmediata
     
+    Args:
+        fencing_token: Token del beat líder que publicó la tarea (None en ejecuciones manuales)
+    
     Returns:
         Diccionario con información sobre la ejecución de la tarea
     """
+    if not is_token_current(fencing_token):
+        return {'success': True, 'message': 'Publicada por un líder anterior de la ingesta en vivo'}
+    
     logger.info("Verificando tareas con programación incorrecta...")
     return reset_stalled_tasks()
 
 
-@shared_task
-def update_live_fixtures(task_id: int) -> Dict[str, Any]:
+@shared_task(ignore_result=True)
+def update_live_fixtures(task_id: int, fencing_token: Optional[int] = None) -> Dict[str, Any]:
     """
     Tarea para actualizar datos de partidos en vivo
     
     Args:
         task_id: ID de la tarea LiveFixtureTask
+        fencing_token: Token del líder que programó la tarea (None en ejecuciones manuales)
         
     Returns:
         Diccionario con información sobre la ejecución de la tarea
@@ -359,6 +374,15 @@ def update_live_fixtures(task_id: int) -> Dict[str, Any]:
                 'fixtures_updated': 0
             }
         
+        # Descartar ejecuciones programadas por un líder anterior
+        if not is_token_current(fencing_token):
+            return {
+                'task_id': task_id,
+                'success': False,
+                'message': 'Token de fencing obsoleto, ejecución descartada',
+                'fixtures_updated': 0
+            }
+        
         # Actualizar estado
         task.status = 'running'
         task.last_run = timezone.now()
@@ -393,6 +417,8 @@ def update_live_fixtures(task_id: int) -> Dict[str, Any]:
         
         # Contabilizar actualizaciones
         fixtures_updated = 0
+        # Partidos con cambios de marcador o estado (requieren consultar eventos)
+        changed_fixture_ids = []
         fixtures_total = len(data.get('response', []))
         
         # Extraer IDs de fixtures actualmente en vivo
@@ -400,6 +426,7 @@ def update_live_fixtures(task_id: int) -> Dict[str, Any]:
         
         # Eliminamos TODOS los datos de partidos de esta tarea
         # Esta es la modificación para no mantener históricos
+        previous_fixture_ids = list(LiveFixtureData.objects.filter(task=task).values_list('fixture_id', flat=True))
         with transaction.atomic():
             deleted_count = LiveFixtureData.objects.filter(task=task).delete()[0]
             logger.info(f"Eliminados {deleted_count} registros de partidos antiguos para la tarea {task.id}")
@@ -461,18 +488,34 @@ def update_live_fixtures(task_id: int) -> Dict[str, Any]:
                 raw_data=fixture_data,
             )
             fixtures_updated += 1
+            
+            # Registrar solo los cambios de estado en el historial del partido
+            try:
+                changes = LiveFixtureHistoryService.record(fixture_data)
+                if LiveFixtureHistoryService.has_event_changes(changes):
+                    changed_fixture_ids.append(fixture_id)
+            except Exception as history_error:
+                logger.warning(f"No se pudo registrar el historial del partido {fixture_id}: {str(history_error)}")
         
         # Actualizar estado de la tarea
         execution_time = time.time() - start_time
         task.status = 'idle'
-        task.next_run = timezone.now() + timezone.timedelta(seconds=task.interval_seconds)
+        task.next_run = timezone.now() + timezone.timedelta(seconds=get_next_poll_delay(task.interval_seconds))
         task.save(update_fields=['status', 'next_run'])
         
+        # Precalcular los payloads de la herramienta del asistente para este ciclo
+        refresh_live_fixture_payloads(stale_fixture_ids=previous_fixture_ids)
+        
+        # Consultar eventos solo de los partidos que cambiaron en esta ingesta
+        if changed_fixture_ids:
+            update_live_fixture_events.delay(fixture_ids=changed_fixture_ids)
+        
         return {
             'task_id': task_id,
             'success': True,
             'fixtures_total': fixtures_total,
             'fixtures_updated': fixtures_updated,
+            'fixtures_with_changes': len(changed_fixture_ids),
             'execution_time': round(execution_time, 2)
         }
         
@@ -504,13 +547,202 @@ def update_live_fixtures(task_id: int) -> Dict[str, Any]:
         }
 
 
-@shared_task
-def update_live_odds(task_id: int) -> Dict[str, Any]:
+@shared_task(ignore_result=True)
+def update_live_fixture_events(fixture_ids: List[int]) -> Dict[str, Any]:
+    """
+    Tarea para obtener de forma incremental los eventos (goles, tarjetas, cambios)
+    de los partidos cuyo marcador o estado cambió en la última ingesta.
+    
+    Args:
+        fixture_ids: IDs de los partidos a consultar
+        
+    Returns:
+        Diccionario con información sobre la ejecución de la tarea
+    """
+    start_time = time.time()
+    headers = {
+        'x-rapidapi-host': 'v3.football.api-sports.io',
+        'x-rapidapi-key': settings.API_FOOTBALL_KEY,
+    }
+    url = f"{settings.API_SPORTS_BASE_URL.rstrip('/')}/fixtures/events"
+    
+    events_created = 0
+    errors = []
+    for fixture_id in fixture_ids:
+        try:
+            response = requests.get(url=url, headers=headers, params={'fixture': fixture_id}, timeout=30)
+            if response.status_code != 200:
+                raise Exception(f"Error en la API: {response.status_code} - {response.text}")
+            
+            events_created += store_fixture_events(fixture_id, response.json().get('response', []))
+        except Exception as e:
+            logger.error(f"Error obteniendo eventos del partido {fixture_id}: {str(e)}")
+            errors.append({'fixture_id': fixture_id, 'error': str(e)})
+    
+    return {
+        'success': not errors,
+        'fixtures_checked': len(fixture_ids),
+        'events_created': events_created,
+        'errors': errors,
+        'execution_time': round(time.time() - start_time, 2)
+    }
+
+
+def store_fixture_events(fixture_id: int, events: List[Dict[str, Any]]) -> int:
+    """
+    Agrega los eventos aún no vistos de un partido.
+    
+    La deduplicación se hace por (partido, minuto, tipo, jugador) mediante la
+    restricción única del modelo, así que los eventos ya guardados se ignoran.
+    
+    Args:
+        fixture_id: ID del partido
+        events: Lista de eventos tal como la devuelve la API
+        
+    Returns:
+        Número de eventos nuevos guardados
+    """
+    existing_keys = set(
+        LiveFixtureEvent.objects.filter(fixture_id=fixture_id)
+        .values_list('minute', 'event_type', 'player_id')
+    )
+    
+    new_events = []
+    for event in events:
+        time_data = event.get('time') or {}
+        team = event.get('team') or {}
+        player = event.get('player') or {}
+        assist = event.get('assist') or {}
+        key = (time_data.get('elapsed') or 0, event.get('type') or '', player.get('id') or 0)
+        if key in existing_keys:
+            continue
+        existing_keys.add(key)
+        new_events.append(LiveFixtureEvent(
+            fixture_id=fixture_id,
+            minute=key[0],
+            extra_minute=time_data.get('extra'),
+            event_type=key[1],
+            detail=event.get('detail') or '',
+            comments=event.get('comments') or '',
+            team_id=team.get('id'),
+            team_name=team.get('name') or '',
+            player_id=key[2],
+            player_name=player.get('name') or '',
+            assist_name=assist.get('name') or '',
+        ))
+    
+    if new_events:
+        LiveFixtureEvent.objects.bulk_create(new_events, ignore_conflicts=True)
+    return len(new_events)
+
+
+@shared_task(ignore_result=True)
+def enrich_hot_fixtures(fencing_token: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Tarea para enriquecer los partidos en vivo con demanda de usuarios.
+    
+    Los partidos calientes reciben alineaciones (una vez), estadísticas y eventos
+    con mayor frecuencia que la consulta básica; los partidos sin demanda no
+    consumen cuota adicional de la API.
+    
+    Args:
+        fencing_token: Token del beat líder que publicó la tarea (None en ejecuciones manuales)
+    
+    Returns:
+        Diccionario con información sobre la ejecución de la tarea
+    """
+    start_time = time.time()
+    if not is_token_current(fencing_token):
+        return {'success': True, 'message': 'Publicada por un líder anterior de la ingesta en vivo'}
+    
+    try:
+        hot_fixtures = get_hot_fixture_ids()
+    except Exception as e:
+        logger.error(f"Error calculando partidos con demanda: {str(e)}")
+        return {'success': False, 'error': str(e)}
+    
+    if not hot_fixtures:
+        return {'success': True, 'hot_fixtures': 0, 'api_calls': 0}
+    
+    headers = {
+        'x-rapidapi-host': 'v3.football.api-sports.io',
+        'x-rapidapi-key': settings.API_FOOTBALL_KEY,
+    }
+    base_url = settings.API_SPORTS_BASE_URL.rstrip('/')
+    
+    api_calls = 0
+    events_created = 0
+    errors = []
+    for fixture_id, reason in hot_fixtures.items():
+        try:
+            enrichment, _ = LiveFixtureEnrichment.objects.get_or_create(fixture_id=fixture_id)
+            enrichment.hot_reason = reason
+            update_fields = ['hot_reason', 'updated_at']
+            
+            # Las alineaciones no cambian durante el partido: solo se piden una vez
+            if not enrichment.lineups:
+                response = requests.get(f"{base_url}/fixtures/lineups", headers=headers, params={'fixture': fixture_id}, timeout=30)
+                api_calls += 1
+                if response.status_code == 200:
+                    enrichment.lineups = response.json().get('response', [])
+                    enrichment.lineups_updated_at = timezone.now()
+                    update_fields += ['lineups', 'lineups_updated_at']
+            
+            response = requests.get(f"{base_url}/fixtures/statistics", headers=headers, params={'fixture': fixture_id}, timeout=30)
+            api_calls += 1
+            if response.status_code == 200:
+                enrichment.statistics = response.json().get('response', [])
+                enrichment.statistics_updated_at = timezone.now()
+                update_fields += ['statistics', 'statistics_updated_at']
+            
+            response = requests.get(f"{base_url}/fixtures/events", headers=headers, params={'fixture': fixture_id}, timeout=30)
+            api_calls += 1
+            if response.status_code == 200:
+                events_created += store_fixture_events(fixture_id, response.json().get('response', []))
+            
+            enrichment.save(update_fields=update_fields)
+        except Exception as e:
+            logger.error(f"Error enriqueciendo el partido {fixture_id}: {str(e)}")
+            errors.append({'fixture_id': fixture_id, 'error': str(e)})
+    
+    return {
+        'success': not errors,
+        'hot_fixtures': len(hot_fixtures),
+        'api_calls': api_calls,
+        'events_created': events_created,
+        'errors': errors,
+        'execution_time': round(time.time() - start_time, 2)
+    }
+
+
+@shared_task(ignore_result=True)
+def purge_live_fixture_enrichments() -> Dict[str, Any]:
+    """
+    Elimina el enriquecimiento de los partidos que ya no están en vivo y no se
+    actualiza desde hace más de LIVE_ENRICHMENT_RETENTION_HOURS.
+    
+    Returns:
+        Diccionario con información sobre la ejecución de la tarea
+    """
+    try:
+        cutoff = timezone.now() - timezone.timedelta(hours=settings.LIVE_ENRICHMENT_RETENTION_HOURS)
+        deleted, _ = LiveFixtureEnrichment.objects.filter(updated_at__lt=cutoff).exclude(
+            fixture_id__in=LiveFixtureData.objects.values('fixture_id')
+        ).delete()
+        return {'success': True, 'deleted': deleted}
+    except Exception as e:
+        logger.error(f"Error purgando el enriquecimiento de partidos: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+
+@shared_task(ignore_result=True)
+def update_live_odds(task_id: int, fencing_token: Optional[int] = None) -> Dict[str, Any]:
     """
     Tarea para actualizar cuotas de partidos en vivo
     
     Args:
         task_id: ID de la tarea LiveOddsTask
+        fencing_token: Token del líder que programó la tarea (None en ejecuciones manuales)
         
     Returns:
         Diccionario con información sobre la ejecución de la tarea
@@ -529,6 +761,15 @@ def update_live_odds(task_id: int) -> Dict[str, Any]:
                 'odds_updated': 0
             }
         
+        # Descartar ejecuciones programadas por un líder anterior
+        if not is_token_current(fencing_token):
+            return {
+                'task_id': task_id,
+                'success': False,
+                'message': 'Token de fencing obsoleto, ejecución descartada',
+                'odds_updated': 0
+            }
+        
         # Actualizar estado
         task.status = 'running'
         task.last_run = timezone.now()
@@ -548,7 +789,7 @@ def update_live_odds(task_id: int) -> Dict[str, Any]:
         if not live_fixtures:
             logger.info("No hay partidos en vivo para obtener cuotas")
             task.status = 'idle'
-            task.next_run = timezone.now() + timezone.timedelta(seconds=task.interval_seconds)
+            task.next_run = timezone.now() + timezone.timedelta(seconds=get_next_poll_delay(task.interval_seconds))
             task.save(update_fields=['status', 'next_run'])
             return {
                 'task_id': task_id,
@@ -687,10 +928,13 @@ def update_live_odds(task_id: int) -> Dict[str, Any]:
                 logger.error(f"Error procesando categorías y valores para el partido {fixture_id}: {str(e)}")
                 # Permitimos que el proceso continúe con otros partidos
         
+        # Las cuotas forman parte del payload del asistente: reconstruirlo con los nuevos datos
+        refresh_live_fixture_payloads()
+        
         # Actualizar estado de la tarea
         execution_time = time.time() - start_time
         task.status = 'idle'
-        task.next_run = timezone.now() + timezone.timedelta(seconds=task.interval_seconds)
+        task.next_run = timezone.now() + timezone.timedelta(seconds=get_next_poll_delay(task.interval_seconds))
         task.save(update_fields=['status', 'next_run'])
         
         return {
@@ -731,13 +975,27 @@ def update_live_odds(task_id: int) -> Dict[str, Any]:
         }
 
 
-@shared_task
-def schedule_live_tasks():
+@shared_task(ignore_result=True)
+def schedule_live_tasks(fencing_token: Optional[int] = None):
     """
     Comprueba qué tareas de datos en vivo deben ejecutarse y las programa
+    
+    Solo el beat líder la publica (ver schedulers.py); el token se propaga a las
+    tareas de ingesta para descartar las de un líder anterior.
+    
+    Args:
+        fencing_token: Token del beat líder que publicó la tarea (None en ejecuciones manuales)
     """
     now = timezone.now()
     
+    if not is_token_current(fencing_token):
+        return {
+            'fixture_tasks_scheduled': 0,
+            'odds_tasks_scheduled': 0,
+            'leader': False,
+            'timestamp': now.isoformat()
+        }
+    
     # Programar tareas de partidos en vivo
     fixture_tasks = LiveFixtureTask.objects.filter(
         is_enabled=True,
@@ -746,7 +1004,7 @@ def schedule_live_tasks():
     
     for task in fixture_tasks:
         logger.info(f"Programando actualización de partidos en vivo para tarea: {task.id} - {task.name}")
-        update_live_fixtures.delay(task_id=task.id)
+        update_live_fixtures.delay(task_id=task.id, fencing_token=fencing_token)
     
     # Programar tareas de cuotas en vivo
     odds_tasks = LiveOddsTask.objects.filter(
@@ -756,10 +1014,12 @@ def schedule_live_tasks():
     
     for task in odds_tasks:
         logger.info(f"Programando actualización de cuotas en vivo para tarea: {task.id} - {task.name}")
-        update_live_odds.delay(task_id=task.id)
+        update_live_odds.delay(task_id=task.id, fencing_token=fencing_token)
         
     return {
         'fixture_tasks_scheduled': fixture_tasks.count(),
         'odds_tasks_scheduled': odds_tasks.count(),
+        'leader': True,
+        'fencing_token': fencing_token,
         'timestamp': now.isoformat()
     }
\ No newline at end of file
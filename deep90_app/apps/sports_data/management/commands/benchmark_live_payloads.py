@@ -0,0 +1,96 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from deep90_app.apps.sports_data.live_payloads import estimate_tokens, get_live_fixture_payload
+from deep90_app.apps.sports_data.models import LiveFixtureData
+
+
+class Command(BaseCommand):
+    help = 'Compara el tamaño (bytes/tokens) del payload completo y compacto de consultar_partido_en_vivo y, opcionalmente, la latencia de una ejecución completa del asistente'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fixture', type=int, action='append', help='ID de partido (se puede repetir)')
+        parser.add_argument('--limit', type=int, default=10, help='Número de partidos en vivo a medir')
+        parser.add_argument('--run', action='store_true', help='Medir también la latencia de ejecución del asistente (usa la API de OpenAI)')
+        parser.add_argument('--runs', type=int, default=3, help='Ejecuciones por modo y partido con --run')
+        parser.add_argument('--assistant-id', default=None, help='Asistente a usar con --run (por defecto ASSISTANT_ID_LIVE_ODDS)')
+
+    def handle(self, *args, **options):
+        fixture_ids = options['fixture'] or list(
+            LiveFixtureData.objects.values_list('fixture_id', flat=True).distinct()[:options['limit']]
+        )
+        if not fixture_ids:
+            self.stdout.write(self.style.WARNING('No hay partidos en vivo para medir.'))
+            return
+
+        self.stdout.write(f"Presupuesto de tokens: {settings.LIVE_TOOL_TOKEN_BUDGET}")
+        self.stdout.write(f"{'Partido':>10} {'Completo (B)':>14} {'Compacto (B)':>14} {'Tokens compl.':>14} {'Tokens comp.':>13} {'Reducción':>10}")
+        full_sizes, compact_sizes = [], []
+        for fixture_id in fixture_ids:
+            full = get_live_fixture_payload(fixture_id, compact=False)
+            compact = get_live_fixture_payload(fixture_id, compact=True)
+            if full is None or compact is None:
+                self.stdout.write(self.style.WARNING(f"{fixture_id:>10} sin datos en vivo"))
+                continue
+            full_bytes = len(full.encode('utf-8'))
+            compact_bytes = len(compact.encode('utf-8'))
+            full_sizes.append(full_bytes)
+            compact_sizes.append(compact_bytes)
+            self.stdout.write(
+                f"{fixture_id:>10} {full_bytes:>14} {compact_bytes:>14} {estimate_tokens(full):>14} "
+                f"{estimate_tokens(compact):>13} {100 - compact_bytes * 100 // full_bytes:>9}%"
+            )
+
+        if full_sizes:
+            self.stdout.write(self.style.SUCCESS(
+                f"Mediana: completo {statistics.median(full_sizes):.0f} B, compacto {statistics.median(compact_sizes):.0f} B"
+            ))
+
+        if options['run']:
+            self._benchmark_runs(fixture_ids, options['runs'], options['assistant_id'] or settings.ASSISTANT_ID_LIVE_ODDS)
+
+    def _benchmark_runs(self, fixture_ids, runs, assistant_id):
+        """Mide la latencia de extremo a extremo de una ejecución con cada modo de payload."""
+        from deep90_app.apps.whatsapp.assistant_manager import AssistantManager
+
+        if not assistant_id:
+            self.stdout.write(self.style.ERROR('No hay asistente configurado para --run.'))
+            return
+
+        manager = AssistantManager()
+        for mode in ('full', 'compact'):
+            latencies = []
+            with override_settings(LIVE_TOOL_PAYLOAD_MODE=mode):
+                for fixture_id in fixture_ids:
+                    for _ in range(runs):
+                        latencies.append(self._timed_run(manager, assistant_id, fixture_id))
+            latencies = [latency for latency in latencies if latency is not None]
+            if latencies:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Modo {mode}: mediana {statistics.median(latencies):.2f}s, "
+                    f"máx {max(latencies):.2f}s en {len(latencies)} ejecuciones"
+                ))
+
+    def _timed_run(self, manager, assistant_id, fixture_id):
+        """Ejecuta el asistente hasta completar (resolviendo tool calls) y devuelve los segundos empleados."""
+        thread_id = manager.create_thread()
+        manager.add_message_to_thread(
+            thread_id,
+            f"Analiza el partido {fixture_id}. Ejecuta consultar_partido_en_vivo({fixture_id}) antes de responder."
+        )
+        start = time.time()
+        run_id = manager.run_assistant(thread_id, assistant_id)
+        while True:
+            run = manager.check_run_status(thread_id, run_id)
+            if run.status == 'completed':
+                return time.time() - start
+            if run.status == 'requires_action':
+                manager.process_tool_calls(thread_id, run_id, run.required_action)
+            elif run.status in ('failed', 'cancelled', 'expired'):
+                self.stdout.write(self.style.WARNING(f"Ejecución {run_id} terminó con estado {run.status}"))
+                return None
+            time.sleep(0.5)
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.8 on 2026-10-18 23:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sports_data', '0010_alter_livefixturedata_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LiveFixtureHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fixture_id', models.IntegerField(unique=True, verbose_name='ID del partido')),
+                ('home_team_name', models.CharField(blank=True, max_length=255, verbose_name='Equipo local')),
+                ('away_team_name', models.CharField(blank=True, max_length=255, verbose_name='Equipo visitante')),
+                ('started_at', models.DateTimeField(verbose_name='Primera observación')),
+                ('base_state', models.JSONField(default=dict, verbose_name='Estado inicial')),
+                ('last_state', models.JSONField(default=dict, verbose_name='Último estado')),
+                ('deltas', models.JSONField(default=list, verbose_name='Cambios')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Última actualización')),
+            ],
+            options={
+                'verbose_name': 'Historial de partido en vivo',
+                'verbose_name_plural': 'live_Historial de partidos en vivo',
+                'indexes': [models.Index(fields=['started_at'], name='sports_data_started_e816ea_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.8 on 2026-10-18 23:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sports_data', '0011_livefixturehistory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LiveFixtureEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fixture_id', models.IntegerField(verbose_name='ID del partido')),
+                ('minute', models.IntegerField(verbose_name='Minuto')),
+                ('extra_minute', models.IntegerField(blank=True, null=True, verbose_name='Minuto añadido')),
+                ('event_type', models.CharField(max_length=50, verbose_name='Tipo')),
+                ('detail', models.CharField(blank=True, max_length=100, verbose_name='Detalle')),
+                ('comments', models.CharField(blank=True, max_length=255, verbose_name='Comentarios')),
+                ('team_id', models.IntegerField(blank=True, null=True, verbose_name='ID equipo')),
+                ('team_name', models.CharField(blank=True, max_length=255, verbose_name='Equipo')),
+                ('player_id', models.IntegerField(default=0, help_text='0 cuando la API no informa el jugador', verbose_name='ID jugador')),
+                ('player_name', models.CharField(blank=True, max_length=255, verbose_name='Jugador')),
+                ('assist_name', models.CharField(blank=True, max_length=255, verbose_name='Asistencia')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de registro')),
+            ],
+            options={
+                'verbose_name': 'Evento de partido en vivo',
+                'verbose_name_plural': 'live_Eventos de partidos en vivo',
+                'ordering': ['fixture_id', 'minute', 'extra_minute'],
+                'indexes': [models.Index(fields=['fixture_id'], name='sports_data_fixture_622cd9_idx')],
+                'unique_together': {('fixture_id', 'minute', 'event_type', 'player_id')},
+            },
+        ),
+    ]
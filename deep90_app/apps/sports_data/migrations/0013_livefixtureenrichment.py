@@ -0,0 +1,30 @@
+# Generated by Django 5.1.8 on 2026-10-18 23:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sports_data', '0012_livefixtureevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LiveFixtureEnrichment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fixture_id', models.IntegerField(unique=True, verbose_name='ID del partido')),
+                ('hot_reason', models.CharField(blank=True, max_length=50, verbose_name='Motivo de demanda')),
+                ('lineups', models.JSONField(blank=True, default=list, verbose_name='Alineaciones')),
+                ('statistics', models.JSONField(blank=True, default=list, verbose_name='Estadísticas')),
+                ('lineups_updated_at', models.DateTimeField(blank=True, null=True, verbose_name='Alineaciones actualizadas')),
+                ('statistics_updated_at', models.DateTimeField(blank=True, null=True, verbose_name='Estadísticas actualizadas')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Última actualización')),
+            ],
+            options={
+                'verbose_name': 'Enriquecimiento de partido en vivo',
+                'verbose_name_plural': 'live_Enriquecimiento de partidos en vivo',
+            },
+        ),
+    ]
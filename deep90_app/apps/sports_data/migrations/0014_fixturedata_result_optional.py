@@ -0,0 +1,19 @@
+# Generated by Django 5.1.8 on 2026-10-19 00:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sports_data', '0013_livefixtureenrichment'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='fixturedata',
+            name='result',
+            field=models.ForeignKey(blank=True, help_text='Vacío para partidos cargados por el calendario de partidos', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='fixture_data', to='sports_data.apiresult', verbose_name='Resultado API'),
+        ),
+    ]
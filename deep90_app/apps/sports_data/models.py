@@ -154,7 +154,10 @@ class FixtureData(models.Model):
         APIResult,
         on_delete=models.CASCADE,
         related_name='fixture_data',
-        verbose_name=_("Resultado API")
+        verbose_name=_("Resultado API"),
+        null=True,
+        blank=True,
+        help_text=_("Vacío para partidos cargados por el calendario de partidos")
     )
     query_date = models.DateTimeField(_("Fecha de consulta"), default=timezone.now)
     fixture_id = models.IntegerField(_("ID del partido"))
@@ -434,6 +437,96 @@ class LiveFixtureData(models.Model):
         return f"{self.home_team_name} vs {self.away_team_name} ({self.elapsed}' - {self.status_long})"
 
 
+class LiveFixtureHistory(models.Model):
+    """
+    Historial compacto del estado de un partido en vivo.
+
+    En lugar de guardar una copia por cada ingesta, se guarda el estado inicial
+    y una lista de deltas ``[segundos_desde_inicio, {campo: valor}]`` con solo
+    los campos que cambiaron (marcador, estado, minuto y tarjetas rojas).
+    Así un partido completo ocupa unos pocos KB y se puede reconstruir el
+    estado en cualquier instante o reproducir la línea de tiempo.
+    """
+    fixture_id = models.IntegerField(_("ID del partido"), unique=True)
+    home_team_name = models.CharField(_("Equipo local"), max_length=255, blank=True)
+    away_team_name = models.CharField(_("Equipo visitante"), max_length=255, blank=True)
+    started_at = models.DateTimeField(_("Primera observación"))
+    base_state = models.JSONField(_("Estado inicial"), default=dict)
+    last_state = models.JSONField(_("Último estado"), default=dict)
+    deltas = models.JSONField(_("Cambios"), default=list)
+    updated_at = models.DateTimeField(_("Última actualización"), auto_now=True)
+
+    class Meta:
+        verbose_name = _("Historial de partido en vivo")
+        verbose_name_plural = _("live_Historial de partidos en vivo")
+        indexes = [
+            models.Index(fields=['started_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.home_team_name} vs {self.away_team_name} ({len(self.deltas)} cambios)"
+
+
+class LiveFixtureEvent(models.Model):
+    """
+    Evento de un partido en vivo (gol, tarjeta, cambio, VAR) obtenido de /fixtures/events.
+
+    Los eventos se agregan de forma incremental; la clave (partido, minuto, tipo,
+    jugador) evita duplicados entre consultas sucesivas.
+    """
+    fixture_id = models.IntegerField(_("ID del partido"))
+    minute = models.IntegerField(_("Minuto"))
+    extra_minute = models.IntegerField(_("Minuto añadido"), null=True, blank=True)
+    event_type = models.CharField(_("Tipo"), max_length=50)
+    detail = models.CharField(_("Detalle"), max_length=100, blank=True)
+    comments = models.CharField(_("Comentarios"), max_length=255, blank=True)
+    team_id = models.IntegerField(_("ID equipo"), null=True, blank=True)
+    team_name = models.CharField(_("Equipo"), max_length=255, blank=True)
+    player_id = models.IntegerField(
+        _("ID jugador"),
+        default=0,
+        help_text=_("0 cuando la API no informa el jugador")
+    )
+    player_name = models.CharField(_("Jugador"), max_length=255, blank=True)
+    assist_name = models.CharField(_("Asistencia"), max_length=255, blank=True)
+    created_at = models.DateTimeField(_("Fecha de registro"), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("Evento de partido en vivo")
+        verbose_name_plural = _("live_Eventos de partidos en vivo")
+        ordering = ['fixture_id', 'minute', 'extra_minute']
+        indexes = [
+            models.Index(fields=['fixture_id']),
+        ]
+        unique_together = ('fixture_id', 'minute', 'event_type', 'player_id')
+
+    def __str__(self):
+        return f"{self.fixture_id} {self.minute}' {self.event_type} - {self.player_name}"
+
+
+class LiveFixtureEnrichment(models.Model):
+    """
+    Datos adicionales (alineaciones y estadísticas) de los partidos con demanda.
+
+    Solo se obtienen para partidos "calientes" (conversaciones activas, vistas de
+    detalle en Flows o equipos favoritos); el resto recibe únicamente la consulta básica.
+    """
+    fixture_id = models.IntegerField(_("ID del partido"), unique=True)
+    hot_reason = models.CharField(_("Motivo de demanda"), max_length=50, blank=True)
+    lineups = models.JSONField(_("Alineaciones"), default=list, blank=True)
+    statistics = models.JSONField(_("Estadísticas"), default=list, blank=True)
+    lineups_updated_at = models.DateTimeField(_("Alineaciones actualizadas"), null=True, blank=True)
+    statistics_updated_at = models.DateTimeField(_("Estadísticas actualizadas"), null=True, blank=True)
+    updated_at = models.DateTimeField(_("Última actualización"), auto_now=True)
+
+    class Meta:
+        verbose_name = _("Enriquecimiento de partido en vivo")
+        verbose_name_plural = _("live_Enriquecimiento de partidos en vivo")
+
+    def __str__(self):
+        return f"{self.fixture_id} ({self.hot_reason})"
+
+
 class LiveOddsTask(models.Model):
     """Modelo para representar tareas nativas del sistema para obtener cuotas en vivo."""
     STATUS_CHOICES = (
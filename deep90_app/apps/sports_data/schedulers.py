@@ -0,0 +1,36 @@
+"""
+Planificador de celery beat con elección de líder para la ingesta en vivo.
+
+Cada proceso de beat se presenta como candidato (heartbeat de leader.py). Las
+tareas de LEADER_TASKS solo se publican desde el líder, con su token de fencing
+en los argumentos; los beats en espera las omiten. El resto de entradas se
+publican como con DatabaseScheduler.
+"""
+import copy
+import logging
+
+from django_celery_beat.schedulers import DatabaseScheduler
+
+from .leader import LEADER_TASKS, get_leader_token, start_heartbeat
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderDatabaseScheduler(DatabaseScheduler):
+    """DatabaseScheduler que publica las tareas de la ingesta en vivo solo desde el beat líder."""
+
+    def setup_schedule(self):
+        super().setup_schedule()
+        start_heartbeat()
+
+    def apply_entry(self, entry, producer=None):
+        if entry.task not in LEADER_TASKS:
+            return super().apply_entry(entry, producer=producer)
+
+        token = get_leader_token()
+        if token is None:
+            logger.debug(f"Beat en espera: se omite {entry.name} (no es el líder de la ingesta en vivo)")
+            return None
+        leader_entry = copy.copy(entry)
+        leader_entry.kwargs = {**(entry.kwargs or {}), 'fencing_token': token}
+        return super().apply_entry(leader_entry, producer=producer)
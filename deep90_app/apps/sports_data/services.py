@@ -1,6 +1,7 @@
 from datetime import datetime
+from django.utils import timezone
 from django.utils.timezone import make_aware
-from .models import APIResult, FixtureData, LeagueData, StandingData
+from .models import APIResult, LeagueData, StandingData
 
 
 class ResponseProcessor:
@@ -40,80 +41,93 @@ class ResponseProcessor:
         Args:
             result: Objeto APIResult con los datos a procesar
         """
+        # fixture_calendar importa este módulo
+        from .fixture_calendar import build_day_index, upsert_fixtures
+        
         data = result.response_data
         
-        # Verificar si es una respuesta válida
+        # Sin respuesta válida se conservan los partidos existentes (los usa el calendario)
         if not data.get('response'):
-            # Si no hay respuesta válida, eliminamos todos los datos existentes
-            FixtureData.objects.all().delete()
             return
         
-        # Eliminar todos los datos existentes antes de cargar los nuevos
-        FixtureData.objects.all().delete()
+        # Se insertan los partidos nuevos y se actualizan los que cambiaron, igual que el calendario;
+        # unos y otros quedan enlazados a este resultado (result.fixture_data)
+        created, updated = upsert_fixtures(data['response'], result)
+        if created or updated:
+            days = {
+                timezone.localtime(fields['date']).date()
+                for fields in map(ResponseProcessor.fixture_fields, data['response'])
+                if fields['date']
+            }
+            for day in days:
+                build_day_index(day)
+
+    @staticmethod
+    def fixture_fields(fixture_data):
+        """
+        Convierte un elemento de la respuesta de 'fixtures' en los campos de FixtureData.
         
-        # Iterar a través de cada partido en la respuesta
-        for fixture_data in data['response']:
-            try:
-                fixture = fixture_data.get('fixture', {})
-                teams = fixture_data.get('teams', {})
-                goals = fixture_data.get('goals', {})
-                score = fixture_data.get('score', {})
-                league = fixture_data.get('league', {})
-                
-                # Parsear la fecha a un objeto datetime con zona horaria
-                date_str = fixture.get('date')
-                try:
-                    date = datetime.fromisoformat(date_str.replace('Z', '+00:00')) if date_str else None
-                except (ValueError, AttributeError):
-                    date = None
-                
-                # Crear registro en FixtureData
-                FixtureData.objects.create(
-                    result=result,
-                    fixture_id=fixture.get('id', 0),
-                    date=date,
-                    timestamp=fixture.get('timestamp', 0),
-                    timezone=fixture.get('timezone', 'UTC'),
-                    status_long=fixture.get('status', {}).get('long', ''),
-                    status_short=fixture.get('status', {}).get('short', ''),
-                    elapsed=fixture.get('status', {}).get('elapsed'),
-                    venue_id=fixture.get('venue', {}).get('id'),
-                    venue_name=fixture.get('venue', {}).get('name'),
-                    venue_city=fixture.get('venue', {}).get('city'),
-                    
-                    home_team_id=teams.get('home', {}).get('id', 0),
-                    home_team_name=teams.get('home', {}).get('name', ''),
-                    home_team_logo=teams.get('home', {}).get('logo'),
-                    home_team_winner=teams.get('home', {}).get('winner'),
-                    
-                    away_team_id=teams.get('away', {}).get('id', 0),
-                    away_team_name=teams.get('away', {}).get('name', ''),
-                    away_team_logo=teams.get('away', {}).get('logo'),
-                    away_team_winner=teams.get('away', {}).get('winner'),
-                    
-                    home_goals=goals.get('home'),
-                    away_goals=goals.get('away'),
-                    
-                    home_halftime=score.get('halftime', {}).get('home'),
-                    away_halftime=score.get('halftime', {}).get('away'),
-                    home_fulltime=score.get('fulltime', {}).get('home'),
-                    away_fulltime=score.get('fulltime', {}).get('away'),
-                    home_extratime=score.get('extratime', {}).get('home'),
-                    away_extratime=score.get('extratime', {}).get('away'),
-                    home_penalty=score.get('penalty', {}).get('home'),
-                    away_penalty=score.get('penalty', {}).get('away'),
-                    
-                    league_id=league.get('id', 0),
-                    league_name=league.get('name', ''),
-                    league_country=league.get('country', ''),
-                    league_logo=league.get('logo'),
-                    league_flag=league.get('flag'),
-                    league_season=league.get('season', 0),
-                    league_round=league.get('round', '')
-                )
-            except Exception as e:
-                # Registrar error sin interrumpir el procesamiento del resto
-                print(f"Error procesando fixture: {e}")
+        Args:
+            fixture_data: Elemento de ``response`` del endpoint fixtures
+            
+        Returns:
+            dict: Valores de los campos del modelo (sin ``result``)
+        """
+        fixture = fixture_data.get('fixture', {})
+        teams = fixture_data.get('teams', {})
+        goals = fixture_data.get('goals', {})
+        score = fixture_data.get('score', {})
+        league = fixture_data.get('league', {})
+        
+        # Parsear la fecha a un objeto datetime con zona horaria
+        date_str = fixture.get('date')
+        try:
+            date = datetime.fromisoformat(date_str.replace('Z', '+00:00')) if date_str else None
+        except (ValueError, AttributeError):
+            date = None
+        
+        return dict(
+            fixture_id=fixture.get('id', 0),
+            date=date,
+            timestamp=fixture.get('timestamp', 0),
+            timezone=fixture.get('timezone', 'UTC'),
+            status_long=fixture.get('status', {}).get('long', ''),
+            status_short=fixture.get('status', {}).get('short', ''),
+            elapsed=fixture.get('status', {}).get('elapsed'),
+            venue_id=fixture.get('venue', {}).get('id'),
+            venue_name=fixture.get('venue', {}).get('name'),
+            venue_city=fixture.get('venue', {}).get('city'),
+            
+            home_team_id=teams.get('home', {}).get('id', 0),
+            home_team_name=teams.get('home', {}).get('name', ''),
+            home_team_logo=teams.get('home', {}).get('logo'),
+            home_team_winner=teams.get('home', {}).get('winner'),
+            
+            away_team_id=teams.get('away', {}).get('id', 0),
+            away_team_name=teams.get('away', {}).get('name', ''),
+            away_team_logo=teams.get('away', {}).get('logo'),
+            away_team_winner=teams.get('away', {}).get('winner'),
+            
+            home_goals=goals.get('home'),
+            away_goals=goals.get('away'),
+            
+            home_halftime=score.get('halftime', {}).get('home'),
+            away_halftime=score.get('halftime', {}).get('away'),
+            home_fulltime=score.get('fulltime', {}).get('home'),
+            away_fulltime=score.get('fulltime', {}).get('away'),
+            home_extratime=score.get('extratime', {}).get('home'),
+            away_extratime=score.get('extratime', {}).get('away'),
+            home_penalty=score.get('penalty', {}).get('home'),
+            away_penalty=score.get('penalty', {}).get('away'),
+            
+            league_id=league.get('id', 0),
+            league_name=league.get('name', ''),
+            league_country=league.get('country', ''),
+            league_logo=league.get('logo'),
+            league_flag=league.get('flag'),
+            league_season=league.get('season', 0),
+            league_round=league.get('round', '')
+        )
 
     @staticmethod
     def _process_leagues(result):
@@ -8,6 +8,7 @@ from django_celery_beat.models import PeriodicTask, IntervalSchedule
 
 from .models import ScheduledTask, APIResult
 from .services import ResponseProcessor
+from .fixture_calendar import purge_finished_fixtures, sync_calendar
 
 
 @shared_task
@@ -110,7 +111,7 @@ def execute_api_request(task_id: int) -> Dict[str, Any]:
         }
 
 
-@shared_task
+@shared_task(ignore_result=True)
 def schedule_periodic_tasks():
     """Revisa y programa tareas periódicas que no tengan una tarea de Celery asociada."""
     periodic_tasks = ScheduledTask.objects.filter(
@@ -137,4 +138,32 @@ def schedule_periodic_tasks():
         
         # Guarda el ID de la tarea periódica en la tarea programada
         task.celery_task_id = str(periodic_task.id)
-        task.save(update_fields=['celery_task_id'])
\ No newline at end of file
+        task.save(update_fields=['celery_task_id'])
+
+
+@shared_task(ignore_result=True)
+def sync_fixture_calendar(days: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Carga diaria del calendario de partidos de las ligas seguidas.
+    
+    Args:
+        days: Número de días hacia adelante (por defecto FIXTURE_CALENDAR_DAYS)
+        
+    Returns:
+        Diccionario con el resultado de la sincronización
+    """
+    start_time = time.time()
+    result = sync_calendar(days)
+    result['execution_time'] = round(time.time() - start_time, 2)
+    return result
+
+
+@shared_task(ignore_result=True)
+def purge_old_fixtures() -> Dict[str, Any]:
+    """
+    Elimina de FixtureData los partidos terminados hace más de FIXTURE_RETENTION_DAYS.
+    
+    Returns:
+        Diccionario con el resultado de la limpieza
+    """
+    return {'success': True, 'deleted': purge_finished_fixtures()}
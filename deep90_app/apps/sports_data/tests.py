@@ -1,3 +1,311 @@
-from django.test import TestCase
+from types import SimpleNamespace
 
-# Create your tests here.
+import pytest
+from celery.beat import Scheduler
+from django.core.cache import cache
+from django.utils import timezone
+
+from deep90_app.apps.sports_data.demand import mark_fixture_hot
+from deep90_app.apps.sports_data.fixture_calendar import get_kickoffs_between
+from deep90_app.apps.sports_data.fixture_calendar import get_next_poll_delay
+from deep90_app.apps.sports_data.fixture_calendar import purge_finished_fixtures
+from deep90_app.apps.sports_data.fixture_calendar import upsert_fixtures
+from deep90_app.apps.sports_data.history import LiveFixtureHistoryService
+from deep90_app.apps.sports_data import leader
+from deep90_app.apps.sports_data.leader import LEADER_KEY
+from deep90_app.apps.sports_data.leader import acquire_leadership
+from deep90_app.apps.sports_data.leader import get_leader_status
+from deep90_app.apps.sports_data.leader import get_leader_token
+from deep90_app.apps.sports_data.leader import get_node_id
+from deep90_app.apps.sports_data.leader import is_token_current
+from deep90_app.apps.sports_data.live_payloads import estimate_tokens
+from deep90_app.apps.sports_data.live_payloads import get_live_fixture_payload
+from deep90_app.apps.sports_data.live_payloads import refresh_live_fixture_payloads
+from deep90_app.apps.sports_data import live_tasks
+from deep90_app.apps.sports_data.live_tasks import store_fixture_events
+from deep90_app.apps.sports_data.models import APIEndpoint
+from deep90_app.apps.sports_data.models import APIResult
+from deep90_app.apps.sports_data.models import FixtureData
+from deep90_app.apps.sports_data.models import LiveFixtureData
+from deep90_app.apps.sports_data.models import LiveFixtureEnrichment
+from deep90_app.apps.sports_data.models import LiveFixtureEvent
+from deep90_app.apps.sports_data.models import LiveFixtureTask
+from deep90_app.apps.sports_data.models import LiveOddsCategory
+from deep90_app.apps.sports_data.models import LiveOddsData
+from deep90_app.apps.sports_data.models import LiveOddsTask
+from deep90_app.apps.sports_data.models import LiveOddsValue
+from deep90_app.apps.sports_data.models import ScheduledTask
+from deep90_app.apps.sports_data.schedulers import LeaderDatabaseScheduler
+from deep90_app.apps.sports_data.services import ResponseProcessor
+from deep90_app.users.tests.factories import UserFactory
+from deep90_app.utils import redis_store
+
+pytestmark = pytest.mark.django_db
+
+
+def _fixture(elapsed, home_goals, away_goals, status="1H", events=None):
+    return {
+        "fixture": {"id": 1001, "status": {"short": status, "elapsed": elapsed}},
+        "teams": {"home": {"id": 1, "name": "Local"}, "away": {"id": 2, "name": "Visitante"}},
+        "goals": {"home": home_goals, "away": away_goals},
+        "events": events or [],
+    }
+
+
+def test_live_fixture_history_stores_only_deltas_and_replays():
+    start = timezone.now()
+    red_card = {"type": "Card", "detail": "Red Card", "team": {"id": 2}}
+
+    LiveFixtureHistoryService.record(_fixture(10, 0, 0), observed_at=start)
+    assert LiveFixtureHistoryService.record(_fixture(10, 0, 0), observed_at=start + timezone.timedelta(seconds=60)) == {}
+    changes = LiveFixtureHistoryService.record(
+        _fixture(12, 1, 0, events=[red_card]),
+        observed_at=start + timezone.timedelta(seconds=120),
+    )
+
+    assert changes == {"elapsed": 12, "home_goals": 1, "away_red_cards": 1}
+    assert LiveFixtureHistoryService.state_at(1001, start + timezone.timedelta(seconds=90))["home_goals"] == 0
+    assert LiveFixtureHistoryService.state_at(1001, start + timezone.timedelta(seconds=150))["home_goals"] == 1
+    assert LiveFixtureHistoryService.state_at(1001, start - timezone.timedelta(seconds=1)) is None
+    assert len(LiveFixtureHistoryService.replay(1001)) == 2
+
+
+def test_store_fixture_events_appends_only_unseen_events():
+    goal = {"time": {"elapsed": 23}, "team": {"id": 1}, "player": {"id": 9, "name": "Nueve"}, "type": "Goal", "detail": "Normal Goal"}
+    card = {"time": {"elapsed": 40}, "team": {"id": 2}, "player": {"id": 4, "name": "Cuatro"}, "type": "Card", "detail": "Yellow Card"}
+
+    assert store_fixture_events(1001, [goal]) == 1
+    assert store_fixture_events(1001, [goal, card]) == 1
+    assert LiveFixtureEvent.objects.filter(fixture_id=1001).count() == 2
+
+
+def _calendar_fixture(fixture_id, kickoff, status="NS"):
+    return {
+        "fixture": {"id": fixture_id, "date": kickoff.isoformat(), "timestamp": int(kickoff.timestamp()), "status": {"short": status, "long": status}},
+        "teams": {"home": {"id": 1, "name": "Local"}, "away": {"id": 2, "name": "Visitante"}},
+        "goals": {"home": None, "away": None},
+        "league": {"id": 39, "name": "Premier League", "country": "England", "season": 2026},
+    }
+
+
+def _fixtures_result(fixtures):
+    endpoint = APIEndpoint.objects.create(name="Fixtures", endpoint="fixtures")
+    task = ScheduledTask.objects.create(name="Fixtures en vivo", endpoint=endpoint, created_by=UserFactory())
+    return APIResult.objects.create(task=task, response_code=200, response_data={"response": fixtures})
+
+
+def test_fixture_calendar_upserts_incrementally_and_drives_polling(settings):
+    settings.FIXTURE_CALENDAR_LEAGUES = ["39"]
+    cache.clear()
+    now = timezone.now()
+    kickoff = now + timezone.timedelta(minutes=10)
+
+    assert get_next_poll_delay(60, now=now) == settings.LIVE_IDLE_MAX_SLEEP
+
+    assert upsert_fixtures([_calendar_fixture(1, kickoff)]) == (1, 0)
+    assert upsert_fixtures([_calendar_fixture(1, kickoff)]) == (0, 0)
+    assert upsert_fixtures([_calendar_fixture(1, kickoff, status="PST")]) == (0, 1)
+
+    cache.clear()
+    assert get_next_poll_delay(60, now=now) == 120
+    assert get_next_poll_delay(60, now=kickoff + timezone.timedelta(minutes=5)) == 60
+    # Lejos del próximo inicio la espera no pasa del tope (partidos en juego de ligas no seguidas)
+    assert get_next_poll_delay(60, now=now - timezone.timedelta(hours=3)) == settings.LIVE_IDLE_MAX_SLEEP == 300
+
+    # Una consulta periódica de fixtures (live=all) actualiza el calendario sin borrarlo
+    result = _fixtures_result([_calendar_fixture(2, now, status="1H")])
+    ResponseProcessor._process_fixtures(result)
+    ResponseProcessor._process_fixtures(SimpleNamespace(response_data={"response": []}))
+    assert set(FixtureData.objects.values_list("fixture_id", "status_short")) == {(1, "PST"), (2, "1H")}
+    # Los partidos que escribe un resultado de la API quedan enlazados a él
+    assert list(result.fixture_data.values_list("fixture_id", flat=True)) == [2]
+    assert [entry[0] for entry in get_kickoffs_between(now - timezone.timedelta(minutes=1), kickoff)] == [2, 1]
+
+
+def test_finished_fixtures_are_purged_after_the_retention_window(settings):
+    settings.FIXTURE_RETENTION_DAYS = 30
+    now = timezone.now()
+    upsert_fixtures([
+        _calendar_fixture(1, now - timezone.timedelta(days=40), status="FT"),
+        _calendar_fixture(2, now - timezone.timedelta(days=40), status="PST"),
+        _calendar_fixture(3, now - timezone.timedelta(days=5), status="FT"),
+        _calendar_fixture(4, now + timezone.timedelta(days=2)),
+    ])
+    # El partido cambió: la actualización reescribe sus campos sin tocar los demás
+    assert upsert_fixtures([_calendar_fixture(3, now - timezone.timedelta(days=5), status="AET")]) == (0, 1)
+
+    assert purge_finished_fixtures() == 1
+    assert sorted(FixtureData.objects.values_list("fixture_id", flat=True)) == [2, 3, 4]
+    assert FixtureData.objects.get(fixture_id=3).status_short == "AET"
+
+
+def test_leader_election_with_fencing_tokens(settings, monkeypatch):
+    cache.clear()
+    settings.LIVE_LEADER_NODE_ID = "node-a"
+    token_a = acquire_leadership()
+    assert token_a is not None
+    assert acquire_leadership() == token_a
+
+    # Otro proceso del mismo host (p. ej. un segundo beat) no comparte el liderazgo
+    monkeypatch.setattr(leader.os, "getpid", lambda: 99999)
+    assert get_node_id().startswith("node-a:99999:")
+    assert acquire_leadership() is None
+    monkeypatch.undo()
+
+    settings.LIVE_LEADER_NODE_ID = "node-b"
+    assert acquire_leadership() is None
+
+    # El lease de node-a expira y node-b toma el relevo con un token mayor
+    redis_store.delete(LEADER_KEY)
+    token_b = acquire_leadership()
+    assert token_b > token_a
+    assert not is_token_current(token_a)
+    assert is_token_current(token_b)
+
+    # node-a no renueva un lease que ya no es suyo
+    settings.LIVE_LEADER_NODE_ID = "node-a"
+    assert acquire_leadership() is None and get_leader_token() is None
+
+    settings.LIVE_LEADER_NODE_ID = "node-b"
+    status = get_leader_status()
+    assert status["leader"] == get_node_id()
+    assert status["is_leader"]
+    assert status["failovers"] == 1
+    assert status["duplicate_runs"] == 1
+
+
+def test_only_the_leader_beat_publishes_live_ingest_tasks(settings, monkeypatch):
+    cache.clear()
+    published = []
+    monkeypatch.setattr(Scheduler, "apply_entry", lambda self, entry, producer=None: published.append((entry.task, entry.kwargs)))
+    scheduler = LeaderDatabaseScheduler.__new__(LeaderDatabaseScheduler)
+    live_entry = SimpleNamespace(name="live", task="deep90_app.apps.sports_data.live_tasks.schedule_live_tasks", kwargs={})
+    other_entry = SimpleNamespace(name="other", task="deep90_app.apps.sports_data.tasks.schedule_periodic_tasks", kwargs={})
+
+    settings.LIVE_LEADER_NODE_ID = "beat-b"
+    scheduler.apply_entry(live_entry)
+    scheduler.apply_entry(other_entry)
+    token = acquire_leadership()
+    scheduler.apply_entry(live_entry)
+    assert published == [
+        ("deep90_app.apps.sports_data.tasks.schedule_periodic_tasks", {}),
+        ("deep90_app.apps.sports_data.live_tasks.schedule_live_tasks", {"fencing_token": token}),
+    ]
+    assert live_entry.kwargs == {}
+
+
+def _live_fixture(fixture_id=2002):
+    user = UserFactory()
+    fixture_task = LiveFixtureTask.objects.create(name="Partidos", created_by=user)
+    odds_task = LiveOddsTask.objects.create(name="Cuotas", created_by=user)
+    fixture = LiveFixtureData.objects.create(
+        task=fixture_task, fixture_id=fixture_id, date=timezone.now(), timestamp=0, timezone="UTC",
+        status_long="First Half", status_short="1H", elapsed=30, home_team_id=1, home_team_name="Local",
+        away_team_id=2, away_team_name="Visitante", home_goals=1, away_goals=0, league_id=39,
+        league_name="Premier League", league_country="England", league_season=2026,
+        raw_data={"fixture": {"id": fixture_id}},
+    )
+    odds = LiveOddsData.objects.create(
+        task=odds_task, fixture_id=fixture_id, league_id=39, league_season=2026, home_team_id=1,
+        away_team_id=2, status_long="First Half", update_time="", raw_odds_data={},
+    )
+    category = LiveOddsCategory.objects.create(odds_data=odds, category_id=59, name="Fulltime Result")
+    for value, odd in (("Home", "1.50"), ("Draw", "3.80"), ("Away", "6.00")):
+        LiveOddsValue.objects.create(category=category, value=value, odd=odd)
+    return fixture
+
+
+def test_live_fixture_payload_is_served_from_cache(django_assert_num_queries):
+    cache.clear()
+    _live_fixture()
+    assert refresh_live_fixture_payloads() == 1
+
+    with django_assert_num_queries(0):
+        payload = get_live_fixture_payload(2002)
+    assert '"Fulltime Result"' in payload
+
+    # Lectura desde la base de datos si la caché no lo tiene: sin consultas N+1
+    cache.clear()
+    with django_assert_num_queries(4):
+        assert get_live_fixture_payload(2002) == payload
+
+
+def test_compact_live_payload_respects_token_budget(settings):
+    cache.clear()
+    _live_fixture()
+    refresh_live_fixture_payloads()
+
+    compact = get_live_fixture_payload(2002, compact=True)
+    full = get_live_fixture_payload(2002)
+    assert compact.startswith('{"fixture_id":2002,"league":')
+    assert '"Fulltime Result":{"Home":"1.50","Draw":"3.80","Away":"6.00"}' in compact
+    assert len(compact) < len(full)
+
+    # Con un presupuesto mínimo se recortan mercados y movimiento, pero el marcador permanece
+    settings.LIVE_TOOL_TOKEN_BUDGET = 10
+    cache.clear()
+    trimmed = get_live_fixture_payload(2002, compact=True)
+    assert '"score":[1,0]' in trimmed
+    assert estimate_tokens(trimmed) <= estimate_tokens(compact)
+
+
+def test_odds_movement_survives_refreshes_without_new_odds():
+    cache.clear()
+    _live_fixture()
+    refresh_live_fixture_payloads()
+    assert '"odds_movement":{}' in get_live_fixture_payload(2002, compact=True)
+
+    # Ciclo de cuotas: la cuota del local baja
+    LiveOddsValue.objects.filter(value="Home").update(odd="1.40")
+    refresh_live_fixture_payloads()
+    movement = '"odds_movement":{"Fulltime Result":{"Home":["1.50","1.40"]}}'
+    assert movement in get_live_fixture_payload(2002, compact=True)
+
+    # Ciclo de partidos (cuotas sin cambios): el movimiento se conserva
+    LiveFixtureData.objects.filter(fixture_id=2002).update(elapsed=31)
+    refresh_live_fixture_payloads()
+    assert movement in get_live_fixture_payload(2002, compact=True)
+
+
+def test_hot_fixtures_are_enriched_served_and_purged(monkeypatch):
+    cache.clear()
+    _live_fixture(2002)
+    _live_fixture(2003)
+    mark_fixture_hot(2002)
+
+    responses = {
+        "lineups": [{"formation": "4-3-3"}, {"formation": "4-4-2"}],
+        "statistics": [
+            {"statistics": [{"type": "Ball Possession", "value": "61%"}, {"type": "Shots on Goal", "value": 4}]},
+            {"statistics": [{"type": "Ball Possession", "value": "39%"}, {"type": "Shots on Goal", "value": 1}]},
+        ],
+        "events": [],
+    }
+    calls = []
+
+    def fake_get(url, headers, params, timeout):
+        endpoint = url.rsplit("/", 1)[-1]
+        calls.append((endpoint, params["fixture"]))
+        return SimpleNamespace(status_code=200, json=lambda: {"response": responses[endpoint]})
+
+    monkeypatch.setattr(live_tasks.requests, "get", fake_get)
+
+    # Solo el partido con demanda consume cuota; las alineaciones se piden una vez
+    assert live_tasks.enrich_hot_fixtures()["hot_fixtures"] == 1
+    assert calls == [("lineups", 2002), ("statistics", 2002), ("events", 2002)]
+    live_tasks.enrich_hot_fixtures()
+    assert calls[3:] == [("statistics", 2002), ("events", 2002)]
+    assert LiveFixtureEnrichment.objects.get(fixture_id=2002).hot_reason == "flow"
+
+    refresh_live_fixture_payloads()
+    compact = get_live_fixture_payload(2002, compact=True)
+    assert '"formations":["4-3-3","4-4-2"]' in compact
+    assert '"statistics":{"Ball Possession":["61%","39%"],"Shots on Goal":[4,1]}' in compact
+    assert '"statistics"' not in get_live_fixture_payload(2003, compact=True)
+
+    # Se conserva mientras el partido está en vivo; se purga cuando termina y caduca
+    LiveFixtureEnrichment.objects.update(updated_at=timezone.now() - timezone.timedelta(days=2))
+    assert live_tasks.purge_live_fixture_enrichments()["deleted"] == 0
+    LiveFixtureData.objects.filter(fixture_id=2002).delete()
+    assert live_tasks.purge_live_fixture_enrichments()["deleted"] == 1
+    assert not LiveFixtureEnrichment.objects.exists()
@@ -33,4 +33,8 @@ urlpatterns = [
 
     # Nueva ruta para exponer el JSON de un partido en vivo y sus odds
     path("api/live-fixture-detail/<int:fixture_id>/", views.api_live_fixture_detail, name="api-live-fixture-detail"),
+    # Historial de estado (replay) de un partido en vivo
+    path("api/live-fixture-history/<int:fixture_id>/", views.api_live_fixture_history, name="api-live-fixture-history"),
+    # Estado del liderazgo de la ingesta en vivo (failovers y ejecuciones duplicadas)
+    path("api/live-leader-status/", views.api_live_leader_status, name="api-live-leader-status"),
 ]
\ No newline at end of file
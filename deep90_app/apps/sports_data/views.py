@@ -5,15 +5,15 @@ from django.views.generic.edit import FormView, CreateView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.urls import reverse, reverse_lazy
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponseRedirect
+from django.http import HttpResponse, JsonResponse, HttpResponseRedirect
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.db import transaction
 from django.db.models import Count
 from django_celery_beat.models import PeriodicTask
 from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.utils.decorators import method_decorator
 from django.views.decorators.http import require_POST, require_GET
-import json
 import os
 from django.conf import settings
 from deep90_app.apps.whatsapp.sports_service import consultar_partido_en_vivo
@@ -26,6 +26,8 @@ from .models import (
 from .forms import TaskScheduleForm, EndpointSelectionForm, ParametersForm
 from .tasks import execute_api_request
 from .live_tasks import toggle_task_status, restart_task, update_live_fixtures, update_live_odds
+from .history import LiveFixtureHistoryService
+from .leader import get_leader_status
 
 
 class AdminRequiredMixin(UserPassesTestMixin):
@@ -815,6 +817,43 @@ def fixture_widget(request, fixture_id):
 def api_live_fixture_detail(request, fixture_id):
     """
     API: Devuelve el JSON estructurado de un partido en vivo y sus odds.
+    
+    El payload ya viene serializado desde la caché, así que se devuelve tal cual.
+    """
+    json_result = consultar_partido_en_vivo(fixture_id, compact=False)
+    return HttpResponse(json_result, content_type='application/json')
+
+
+@require_GET
+def api_live_fixture_history(request, fixture_id):
+    """
+    API: Devuelve el historial de estado de un partido.
+
+    Sin parámetros devuelve la línea de tiempo completa; con ``?at=<ISO 8601>``
+    devuelve el estado reconstruido en ese instante.
+    """
+    at = request.GET.get('at')
+    if at:
+        at_datetime = parse_datetime(at)
+        if at_datetime is None:
+            return JsonResponse({'error': 'Parámetro "at" inválido'}, status=400)
+        if timezone.is_naive(at_datetime):
+            at_datetime = timezone.make_aware(at_datetime)
+        state = LiveFixtureHistoryService.state_at(fixture_id, at_datetime)
+        if state is None:
+            return JsonResponse({'error': 'No hay historial para ese instante'}, status=404)
+        return JsonResponse({'fixture_id': fixture_id, 'at': at_datetime.isoformat(), 'state': state})
+
+    timeline = LiveFixtureHistoryService.replay(fixture_id)
+    if not timeline:
+        return JsonResponse({'error': f'No hay historial para el partido {fixture_id}'}, status=404)
+    return JsonResponse({'fixture_id': fixture_id, 'timeline': timeline})
+
+
+@staff_member_required
+@require_GET
+def api_live_leader_status(request):
+    """
+    API: Devuelve el nodo líder de la ingesta en vivo y las métricas de failover.
     """
-    json_result = consultar_partido_en_vivo(fixture_id)
-    return JsonResponse(json.loads(json_result), safe=False)
+    return JsonResponse(get_leader_status())
@@ -1,6 +1,8 @@
 from django.contrib import admin
+from django.db import transaction
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
+from . import user_cache
 from .models import WhatsAppUser, Conversation, Message, UserInput, UserPreference, AssistantConfig
 
 
@@ -33,28 +35,37 @@ class WhatsAppUserAdmin(admin.ModelAdmin):
     actions = ['mark_as_registered', 'mark_as_suspended', 'mark_as_banned', 
                'set_subscription_free', 'set_subscription_premium', 'set_subscription_pro']
     
+    def _update_users(self, queryset, **fields):
+        """
+        Actualiza los usuarios seleccionados y descarta sus perfiles cacheados tras el
+        commit (update() no emite señales).
+        """
+        phones = list(queryset.values_list('phone_number', flat=True))
+        queryset.update(**fields)
+        transaction.on_commit(lambda: user_cache.invalidate_many(phones))
+    
     def mark_as_registered(self, request, queryset):
-        queryset.update(status='registered')
+        self._update_users(queryset, status='registered')
     mark_as_registered.short_description = _("Marcar como registrados")
     
     def mark_as_suspended(self, request, queryset):
-        queryset.update(status='suspended')
+        self._update_users(queryset, status='suspended')
     mark_as_suspended.short_description = _("Marcar como suspendidos")
     
     def mark_as_banned(self, request, queryset):
-        queryset.update(status='banned', is_blacklisted=True)
+        self._update_users(queryset, status='banned', is_blacklisted=True)
     mark_as_banned.short_description = _("Marcar como bloqueados")
     
     def set_subscription_free(self, request, queryset):
-        queryset.update(subscription_plan='free')
+        self._update_users(queryset, subscription_plan='free')
     set_subscription_free.short_description = _("Establecer suscripción gratuita")
     
     def set_subscription_premium(self, request, queryset):
-        queryset.update(subscription_plan='premium')
+        self._update_users(queryset, subscription_plan='premium')
     set_subscription_premium.short_description = _("Establecer suscripción premium")
     
     def set_subscription_pro(self, request, queryset):
-        queryset.update(subscription_plan='pro')
+        self._update_users(queryset, subscription_plan='pro')
     set_subscription_pro.short_description = _("Establecer suscripción profesional")
 
 
@@ -84,7 +95,7 @@ class ConversationAdmin(admin.ModelAdmin):
             'fields': ('user', 'thread_id', 'is_active', 'conversation_type')
         }),
         (_('Contexto y datos'), {
-            'fields': ('fixture_id', 'preserve_context')
+            'fields': ('fixture_id', 'preserve_context', 'context_summary', 'summary_until')
         }),
         (_('Fechas'), {
             'fields': ('created_at', 'updated_at', 'last_message_at')
@@ -93,7 +104,7 @@ class ConversationAdmin(admin.ModelAdmin):
     
     inlines = [MessageInline]
     
-    readonly_fields = ['created_at', 'updated_at', 'last_message_at']
+    readonly_fields = ['created_at', 'updated_at', 'last_message_at', 'summary_until']
     
     actions = ['mark_as_active', 'mark_as_inactive', 'mark_as_preserve_context', 'mark_as_no_preserve_context']
     
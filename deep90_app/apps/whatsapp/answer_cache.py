@@ -0,0 +1,226 @@
+"""
+Caché de respuestas de corta duración para preguntas repetidas sobre un partido.
+
+Durante un partido con mucha demanda, muchos usuarios hacen casi la misma
+pregunta sobre el mismo ``fixture_id`` en el mismo minuto. Las respuestas se
+guardan con la clave (tipo de asistente, fixture_id, intención normalizada,
+versión de los datos). La versión se deriva del payload compacto en vivo del
+partido, de modo que una respuesta nunca se sirve con datos distintos de los que
+la generaron. Si no hay coincidencia, se lanza un run normal.
+
+Como la respuesta se sirve a otros usuarios, solo se guarda si el run respondió
+a una única pregunta (no a una ráfaga agrupada ni a un run relanzado con
+mensajes nuevos) y si no menciona el nombre de quien preguntó.
+"""
+import hashlib
+import logging
+import re
+import time
+import unicodedata
+from typing import Dict, Any, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from deep90_app.apps.sports_data.live_payloads import estimate_tokens, get_live_fixture_payload
+
+from .metrics import get_counter, get_latency_summary, increment, record_latency
+
+logger = logging.getLogger(__name__)
+
+ANSWER_KEY = "answer_cache:{conversation_type}:{fixture_id}:{intent}:{version}"
+PENDING_KEY = "answer_cache:pending:{conversation_id}"
+
+# Palabras que no cambian la intención de la pregunta
+STOPWORDS = {
+    'a', 'al', 'como', 'con', 'crees', 'cual', 'cuales', 'de', 'del', 'dime', 'el', 'en', 'es', 'esta',
+    'este', 'hay', 'la', 'las', 'le', 'lo', 'los', 'me', 'mi', 'para', 'por', 'porfa', 'porfavor', 'que',
+    'se', 'su', 'te', 'tu', 'un', 'una', 'va', 'vas', 'y', 'ya', 'hola', 'gracias', 'favor', 'oye',
+}
+
+
+def _fold(text: str) -> str:
+    """Texto en minúsculas y sin tildes."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def normalize_intent(text: str) -> str:
+    """
+    Normaliza una pregunta para agrupar formulaciones equivalentes.
+
+    Quita tildes, signos y palabras vacías y ordena los términos restantes, de modo
+    que "¿Quién gana el partido?" y "quien gana partido" producen la misma intención.
+
+    Args:
+        text: Texto del usuario
+
+    Returns:
+        Intención normalizada (términos únicos ordenados separados por espacios)
+    """
+    terms = {term for term in re.findall(r'[a-z0-9]+', _fold(text)) if term not in STOPWORDS}
+    return ' '.join(sorted(terms))
+
+
+def get_snapshot_version(fixture_id) -> str:
+    """
+    Versión de los datos de un partido: hash del payload compacto en vivo o,
+    si el partido no está en vivo, la franja horaria actual.
+
+    Args:
+        fixture_id: ID del partido
+
+    Returns:
+        Identificador corto de la versión de los datos
+    """
+    try:
+        payload = get_live_fixture_payload(int(fixture_id), compact=True)
+    except (TypeError, ValueError):
+        payload = None
+    if payload:
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:12]
+    return f"h{int(time.time() // 3600)}"
+
+
+def build_key(conversation_type: str, fixture_id, text: str) -> Optional[str]:
+    """
+    Construye la clave de caché de una pregunta o None si no es cacheable.
+
+    Args:
+        conversation_type: Tipo de conversación (ConversationType)
+        fixture_id: ID del partido de la conversación
+        text: Texto del usuario
+
+    Returns:
+        Clave de caché o None
+    """
+    if conversation_type not in settings.ANSWER_CACHE_TYPES or not fixture_id:
+        return None
+    intent = normalize_intent(text)
+    if not intent:
+        return None
+    return ANSWER_KEY.format(
+        conversation_type=conversation_type,
+        fixture_id=fixture_id,
+        intent=hashlib.sha1(intent.encode('utf-8')).hexdigest()[:16],
+        version=get_snapshot_version(fixture_id),
+    )
+
+
+def lookup(key: Optional[str]) -> Optional[str]:
+    """
+    Busca una respuesta en caché registrando aciertos, fallos y antigüedad.
+
+    Args:
+        key: Clave construida con build_key
+
+    Returns:
+        Texto de la respuesta o None
+    """
+    if not key:
+        return None
+    try:
+        cached = cache.get(key)
+    except Exception as e:
+        logger.warning(f"No se pudo consultar la caché de respuestas: {str(e)}")
+        return None
+    if not cached:
+        increment('answer_cache:misses')
+        return None
+
+    increment('answer_cache:hits')
+    increment('answer_cache:tokens_saved', cached.get('tokens') or 0)
+    record_latency('answer_cache:staleness', time.time() - cached['created_at'])
+    return cached['answer']
+
+
+def mentions_user(answer: str, user_names: Iterable[str]) -> bool:
+    """
+    Indica si una respuesta menciona alguno de los nombres del usuario.
+
+    Args:
+        answer: Texto de la respuesta
+        user_names: Nombres del usuario (nombre completo, nombre de perfil)
+
+    Returns:
+        True si aparece alguna palabra de los nombres (de 3 letras o más)
+    """
+    words = set(re.findall(r'[a-z0-9]+', _fold(answer)))
+    return any(
+        term in words
+        for name in user_names if name
+        for term in re.findall(r'[a-z0-9]+', _fold(name)) if len(term) >= 3
+    )
+
+
+def remember_pending(conversation_id, key: Optional[str], user_names: Iterable[str] = ()) -> None:
+    """
+    Registra la pregunta que alimenta el próximo run de la conversación.
+
+    Debe llamarse con cada mensaje que lanza o relanza un run, también con los no
+    cacheables (``key`` None): si el run recibe más de un mensaje, su respuesta no
+    corresponde a una sola intención y no se guarda.
+
+    Args:
+        conversation_id: ID de la conversación
+        key: Clave construida con build_key (None si la pregunta no es cacheable)
+        user_names: Nombres del usuario, para no guardar respuestas que los mencionen
+    """
+    pending_key = PENDING_KEY.format(conversation_id=conversation_id)
+    try:
+        entry = {'key': key, 'names': [name for name in user_names if name]}
+        if not cache.add(pending_key, entry, settings.RUN_TRACKER_MAX_AGE):
+            # Ráfaga agrupada o run relanzado: la respuesta cubre varios mensajes
+            cache.set(pending_key, {'key': None, 'names': []}, settings.RUN_TRACKER_MAX_AGE)
+    except Exception as e:
+        logger.warning(f"No se pudo registrar la pregunta pendiente de la conversación {conversation_id}: {str(e)}")
+
+
+def store_pending(conversation_id, answer: str, total_tokens: Optional[int] = None) -> None:
+    """
+    Guarda la respuesta de un run si respondía a una única pregunta cacheable y no
+    está personalizada con el nombre del usuario.
+
+    Args:
+        conversation_id: ID de la conversación
+        answer: Texto de la respuesta
+        total_tokens: Tokens consumidos por el run (estimados a partir del texto si se desconocen)
+    """
+    pending_key = PENDING_KEY.format(conversation_id=conversation_id)
+    try:
+        entry = cache.get(pending_key)
+        if not entry:
+            return
+        cache.delete(pending_key)
+        if not entry['key']:
+            return
+        if mentions_user(answer, entry['names']):
+            increment('answer_cache:personalized')
+            return
+        cache.set(entry['key'], {
+            'answer': answer,
+            'created_at': time.time(),
+            'tokens': total_tokens or estimate_tokens(answer),
+        }, settings.ANSWER_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"No se pudo guardar la respuesta en caché: {str(e)}")
+
+
+def get_answer_cache_status() -> Dict[str, Any]:
+    """
+    Métricas de la caché de respuestas.
+
+    Returns:
+        Diccionario con aciertos, fallos, tasa de acierto, tokens ahorrados, respuestas
+        personalizadas no guardadas y antigüedad servida
+    """
+    hits = get_counter('answer_cache:hits')
+    misses = get_counter('answer_cache:misses')
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+        'tokens_saved': get_counter('answer_cache:tokens_saved'),
+        'personalized': get_counter('answer_cache:personalized'),
+        'staleness': get_latency_summary('answer_cache:staleness'),
+    }
@@ -1,13 +1,23 @@
 import logging
 import json
+import time
 from django.conf import settings
-from openai import OpenAI
+from django.core.cache import cache
 
-from .sports_service import FootballDataService
+from .openai_client import get_openai_client
+from .tools import execute_tool, execute_tool_calls
 from .models import SubscriptionPlan
 
 logger = logging.getLogger(__name__)
 
+# Marca en caché de hilos que se sabe que existen en OpenAI
+THREAD_ALIVE_KEY = "assistant_thread_alive:{thread_id}"
+# Hilo con un run posiblemente en curso y runs cancelados por la llegada de mensajes nuevos
+RUN_ACTIVE_KEY = "assistant_run_active:{thread_id}"
+RUN_SUPERSEDED_KEY = "assistant_run_superseded:{run_id}"
+
+ACTIVE_RUN_STATUSES = ('queued', 'in_progress', 'requires_action', 'cancelling')
+
 
 class AssistantManager:
     """
@@ -16,8 +26,8 @@ class AssistantManager:
     """
     
     def __init__(self):
-        """Inicializar el cliente OpenAI y cargar IDs de asistentes."""
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        """Obtener el cliente OpenAI compartido del proceso y cargar IDs de asistentes."""
+        self.client = get_openai_client()
         self.assistant_id = settings.ASSISTANT_ID_PAY
     
     def get_assistant_for_user(self, user, conversation_type=None):
@@ -52,12 +62,13 @@ class AssistantManager:
         """
         try:
             thread = self.client.beta.threads.create()
+            self.mark_thread_alive(thread.id)
             return thread.id
         except Exception as e:
             logger.error(f"Error al crear thread: {e}")
             raise
     
-    def add_message_to_thread(self, thread_id, content, user_info=None):
+    def add_message_to_thread(self, thread_id, content, user_info=None, role="user"):
         """
         Añade un mensaje del usuario al hilo.
         
@@ -65,6 +76,7 @@ class AssistantManager:
             thread_id: ID del hilo
             content: Contenido del mensaje
             user_info: Información del usuario (opcional)
+            role: Rol del mensaje ("user" o "assistant" para respuestas servidas desde caché)
             
         Returns:
             Objeto mensaje creado
@@ -76,7 +88,7 @@ class AssistantManager:
                 
             message = self.client.beta.threads.messages.create(
                 thread_id=thread_id,
-                role="user",
+                role=role,
                 content=content,
                 metadata=metadata
             )
@@ -112,6 +124,148 @@ class AssistantManager:
             logger.error(f"Error al ejecutar asistente: {e}")
             raise
     
+    def create_thread_and_run(self, assistant_id, messages, user_info=None):
+        """
+        Crea un hilo con sus mensajes iniciales y lanza el run en una sola llamada.
+
+        Args:
+            assistant_id: ID del asistente
+            messages: Mensajes a añadir al hilo, en orden: textos de usuario o diccionarios {role, content}
+            user_info: Información del usuario (opcional, se guarda como metadata)
+
+        Returns:
+            Tupla (thread_id, run_id)
+        """
+        try:
+            metadata = {'user_info': json.dumps(user_info)} if user_info else {}
+            run = self.client.beta.threads.create_and_run(
+                assistant_id=assistant_id,
+                thread={
+                    'messages': [
+                        dict(message, metadata=metadata) if isinstance(message, dict)
+                        else {'role': 'user', 'content': message, 'metadata': metadata}
+                        for message in messages
+                    ]
+                }
+            )
+            self.mark_thread_alive(run.thread_id)
+            return run.thread_id, run.id
+        except Exception as e:
+            logger.error(f"Error al crear thread y ejecutar asistente: {e}")
+            raise
+
+    def stream_run(self, thread_id, assistant_id):
+        """
+        Ejecuta el asistente consumiendo el stream de eventos del run.
+
+        Las tool calls (``requires_action``) se resuelven en el mismo proceso y sus
+        resultados se envían con ``submit_tool_outputs_stream``, de modo que la
+        respuesta está disponible en cuanto el run termina, sin sondeos.
+
+        Args:
+            thread_id: ID del hilo
+            assistant_id: ID del asistente
+
+        Returns:
+            Diccionario con run_id, status, content (texto del último mensaje del asistente) y total_tokens
+        """
+        result = {'run_id': None, 'status': None, 'content': None, 'total_tokens': None}
+        stream_manager = self.client.beta.threads.runs.stream(
+            thread_id=thread_id,
+            assistant_id=assistant_id
+        )
+
+        while stream_manager is not None:
+            next_stream = None
+            with stream_manager as stream:
+                for event in stream:
+                    if event.event == 'thread.run.created':
+                        result['run_id'] = event.data.id
+                    elif event.event == 'thread.message.completed':
+                        result['content'] = self._message_text(event.data)
+                    elif event.event == 'thread.run.requires_action':
+                        tool_outputs = execute_tool_calls(event.data.required_action.submit_tool_outputs.tool_calls)
+                        next_stream = self.client.beta.threads.runs.submit_tool_outputs_stream(
+                            thread_id=thread_id,
+                            run_id=event.data.id,
+                            tool_outputs=tool_outputs
+                        )
+                        break
+                    elif event.event in ('thread.run.completed', 'thread.run.failed', 'thread.run.cancelled',
+                                         'thread.run.expired', 'thread.run.incomplete'):
+                        result['status'] = event.data.status
+                        if event.data.usage:
+                            result['total_tokens'] = event.data.usage.total_tokens
+                    elif event.event == 'error':
+                        raise Exception(f"Error en el stream del run: {event.data}")
+            stream_manager = next_stream
+
+        return result
+
+    def mark_run_active(self, thread_id):
+        """Marca que el hilo puede tener un run en curso."""
+        try:
+            cache.set(RUN_ACTIVE_KEY.format(thread_id=thread_id), True, settings.RUN_TRACKER_MAX_AGE)
+        except Exception as e:
+            logger.warning(f"No se pudo marcar el run activo del thread {thread_id}: {e}")
+
+    def clear_run_active(self, thread_id):
+        """Quita la marca de run en curso del hilo."""
+        try:
+            cache.delete(RUN_ACTIVE_KEY.format(thread_id=thread_id))
+        except Exception as e:
+            logger.warning(f"No se pudo limpiar el run activo del thread {thread_id}: {e}")
+
+    def cancel_active_run(self, thread_id, wait_seconds=10):
+        """
+        Cancela el run en curso de un hilo para poder añadirle mensajes nuevos.
+
+        Solo consulta OpenAI si el hilo está marcado con un run en curso. El run
+        cancelado se marca como reemplazado para que no se notifique como fallo.
+
+        Args:
+            thread_id: ID del hilo
+            wait_seconds: Tiempo máximo de espera hasta que el run quede cancelado
+
+        Returns:
+            ID del run cancelado o None si no había ninguno en curso
+        """
+        try:
+            if not cache.get(RUN_ACTIVE_KEY.format(thread_id=thread_id)):
+                return None
+        except Exception:
+            pass
+
+        runs = self.client.beta.threads.runs.list(thread_id=thread_id, order="desc", limit=1)
+        if not runs.data or runs.data[0].status not in ACTIVE_RUN_STATUSES:
+            self.clear_run_active(thread_id)
+            return None
+
+        run = runs.data[0]
+        cache.set(RUN_SUPERSEDED_KEY.format(run_id=run.id), True, 60 * 60)
+        if run.status != 'cancelling':
+            try:
+                self.client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run.id)
+            except Exception as e:
+                # El run pudo terminar entre la consulta y la cancelación
+                logger.info(f"No se pudo cancelar el run {run.id}: {e}")
+
+        deadline = time.time() + wait_seconds
+        while time.time() < deadline:
+            status = self.client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id).status
+            if status not in ACTIVE_RUN_STATUSES:
+                break
+            time.sleep(0.25)
+
+        self.clear_run_active(thread_id)
+        logger.info(f"Run {run.id} cancelado por mensajes nuevos en el thread {thread_id}")
+        return run.id
+
+    @staticmethod
+    def is_run_superseded(run_id):
+        """Indica si un run fue cancelado porque llegaron mensajes nuevos."""
+        return bool(run_id) and bool(cache.get(RUN_SUPERSEDED_KEY.format(run_id=run_id)))
+
     def check_run_status(self, thread_id, run_id):
         """
         Verifica el estado de una ejecución.
@@ -160,22 +314,8 @@ class AssistantManager:
             Estado de la ejecución actualizada
         """
         try:
-            tool_calls = required_action.submit_tool_outputs.tool_calls
-            tool_outputs = []
-            
-            for tool_call in tool_calls:
-                # Procesar cada llamada a herramienta
-                function_name = tool_call.function.name
-                function_args = json.loads(tool_call.function.arguments)
-                
-                # Ejecutar la función correspondiente
-                output = self._execute_tool_function(function_name, function_args)
-                
-                # Agregar resultado a los outputs
-                tool_outputs.append({
-                    "tool_call_id": tool_call.id,
-                    "output": output
-                })
+            # Las llamadas independientes se ejecutan en paralelo (ver tools.py)
+            tool_outputs = execute_tool_calls(required_action.submit_tool_outputs.tool_calls)
             
             # Enviar los resultados de las herramientas
             run = self.client.beta.threads.runs.submit_tool_outputs(
@@ -189,50 +329,98 @@ class AssistantManager:
             logger.error(f"Error al procesar tool calls: {e}")
             raise
     
-    def get_assistant_messages(self, thread_id, after_message_id=None):
+    def get_assistant_messages(self, thread_id, after_message_id=None, limit=20):
         """
         Obtiene los mensajes del asistente después de un ID de mensaje específico.
         
         Args:
             thread_id: ID del hilo
             after_message_id: ID del mensaje después del cual obtener mensajes
+            limit: Número máximo de mensajes del hilo a revisar (una sola página)
             
         Returns:
-            Lista de mensajes del asistente
+            Lista de mensajes del asistente (más recientes primero)
         """
         try:
-            # Obtener todos los mensajes del hilo
-            response = self.client.beta.threads.messages.list(
-                thread_id=thread_id,
-                order="desc"  # Más recientes primero
-            )
-            
-            messages = []
+            params = {'thread_id': thread_id, 'order': "desc", 'limit': limit}
+            if after_message_id:
+                # Con orden descendente, el cursor "before" devuelve solo los mensajes más nuevos
+                params['before'] = after_message_id
+            response = self.client.beta.threads.messages.list(**params)
             
-            # Si se especifica un mensaje_id, recoger mensajes hasta ese ID
-            # De lo contrario, recoger todos los mensajes del asistente
-            for message in response.data:
-                if message.role == "assistant":
-                    if after_message_id and message.id == after_message_id:
-                        break
-                    
-                    # Extraer contenido del mensaje
-                    content = []
-                    for content_part in message.content:
-                        if content_part.type == "text":
-                            content.append(content_part.text.value)
-                    
-                    messages.append({
-                        "id": message.id,
-                        "content": "\n".join(content),
-                        "created_at": message.created_at
-                    })
-            
-            return messages
+            return [
+                {
+                    "id": message.id,
+                    "content": self._message_text(message),
+                    "created_at": message.created_at
+                }
+                for message in response.data
+                if message.role == "assistant"
+            ]
         except Exception as e:
             logger.error(f"Error al obtener mensajes del asistente: {e}")
             raise
     
+    def get_latest_assistant_message(self, thread_id, run_id=None):
+        """
+        Obtiene el texto de la respuesta más reciente del asistente con una sola
+        consulta de un mensaje, independientemente de la longitud del hilo.
+        
+        Args:
+            thread_id: ID del hilo
+            run_id: ID del run que generó la respuesta (opcional, filtra por run)
+            
+        Returns:
+            Texto del mensaje o None si el último mensaje no es del asistente
+        """
+        params = {'thread_id': thread_id, 'order': "desc", 'limit': 1}
+        if run_id:
+            params['run_id'] = run_id
+        response = self.client.beta.threads.messages.list(**params)
+        if response.data and response.data[0].role == "assistant":
+            self.mark_thread_alive(thread_id)
+            return self._message_text(response.data[0])
+        return None
+    
+    def is_thread_alive(self, thread_id):
+        """
+        Verifica que un hilo sigue existiendo en OpenAI.
+        
+        El resultado positivo se guarda en caché THREAD_ALIVE_TTL segundos; si no
+        está en caché se consulta el hilo (una llamada de coste constante).
+        
+        Args:
+            thread_id: ID del hilo
+            
+        Returns:
+            True si el hilo existe
+        """
+        key = THREAD_ALIVE_KEY.format(thread_id=thread_id)
+        try:
+            if cache.get(key):
+                return True
+        except Exception as e:
+            logger.warning(f"No se pudo leer el estado del thread {thread_id} en caché: {e}")
+        
+        try:
+            self.client.beta.threads.retrieve(thread_id)
+        except Exception as e:
+            logger.info(f"Thread {thread_id} no disponible: {e}")
+            return False
+        self.mark_thread_alive(thread_id)
+        return True
+    
+    def mark_thread_alive(self, thread_id):
+        """Guarda en caché que un hilo existe."""
+        try:
+            cache.set(THREAD_ALIVE_KEY.format(thread_id=thread_id), True, settings.THREAD_ALIVE_TTL)
+        except Exception as e:
+            logger.warning(f"No se pudo guardar el estado del thread {thread_id} en caché: {e}")
+    
+    @staticmethod
+    def _message_text(message):
+        """Extrae el texto de un mensaje de OpenAI."""
+        return "\n".join(part.text.value for part in message.content if part.type == "text")
 
     def _execute_tool_function(self, function_name, function_args):
         """
@@ -245,22 +433,4 @@ class AssistantManager:
         Returns:
             Resultado de la función como string
         """
-        try:
-            # Mapear nombres de funciones a funciones reales
-            from .sports_service import consultar_partido_en_vivo
-            function_map = {
-                "get_live_match_results": FootballDataService.get_live_match_results,
-                "consultar_partido_en_vivo": consultar_partido_en_vivo
-            }
-            
-            # Verificar si la función existe
-            if function_name not in function_map:
-                return f"Error: Función '{function_name}' no implementada."
-            
-            # Ejecutar la función
-            result = function_map[function_name](**function_args)
-            return result
-        
-        except Exception as e:
-            logger.error(f"Error al ejecutar función {function_name}: {e}")
-            return f"Error al ejecutar {function_name}: {str(e)}"
\ No newline at end of file
+        return execute_tool(function_name, function_args)
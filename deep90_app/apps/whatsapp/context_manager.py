@@ -0,0 +1,179 @@
+"""
+Contexto de conversación gestionado por la aplicación.
+
+Para los tipos de conversación de MANAGED_CONTEXT_TYPES, el historial canónico es
+la tabla ``Message`` y no el hilo de OpenAI. Cada turno se ejecuta en un hilo nuevo
+que solo recibe las instrucciones una vez, un resumen acumulado de lo anterior y,
+literalmente, todos los mensajes posteriores al resumen (``summary_until``). Así
+la latencia y el coste de cada run no crecen con la antigüedad de la
+conversación. El resumen se actualiza de forma incremental en segundo plano
+cuando quedan CONTEXT_SUMMARY_BATCH mensajes fuera de los últimos
+CONTEXT_WINDOW_MESSAGES; hasta entonces esos mensajes se siguen enviando, de modo
+que ninguno queda fuera del resumen y del historial a la vez. El historial
+enviado se limita a CONTEXT_WINDOW_MESSAGES + CONTEXT_SUMMARY_BATCH mensajes.
+"""
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+from .models import Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_INSTRUCTIONS = (
+    "Resume la conversación entre un usuario y un asistente de fútbol en español, en un máximo de "
+    "{max_words} palabras. Conserva los partidos, equipos, preferencias, predicciones y apuestas "
+    "mencionados y cualquier dato que el usuario haya pedido recordar. Integra el resumen previo si existe."
+)
+
+
+def is_managed(conversation: Conversation) -> bool:
+    """Indica si la conversación usa contexto gestionado por la aplicación."""
+    return conversation.conversation_type in settings.MANAGED_CONTEXT_TYPES
+
+
+def _latest(conversation: Conversation, limit: int) -> List[Message]:
+    """Últimos ``limit`` mensajes de texto en orden cronológico."""
+    messages = conversation.messages.filter(message_type='text').order_by('-created_at')
+    return list(messages[:limit])[::-1]
+
+
+def _window(conversation: Conversation) -> List[Message]:
+    """Últimos CONTEXT_WINDOW_MESSAGES mensajes de texto en orden cronológico."""
+    return _latest(conversation, settings.CONTEXT_WINDOW_MESSAGES)
+
+
+def _history(conversation: Conversation) -> List[Message]:
+    """
+    Mensajes que se envían literalmente: la ventana y los anteriores aún no resumidos.
+
+    Returns:
+        Mensajes posteriores a ``summary_until`` (al menos la ventana, como máximo
+        CONTEXT_WINDOW_MESSAGES + CONTEXT_SUMMARY_BATCH) en orden cronológico
+    """
+    messages = _latest(conversation, settings.CONTEXT_WINDOW_MESSAGES + settings.CONTEXT_SUMMARY_BATCH)
+    older, window = messages[:-settings.CONTEXT_WINDOW_MESSAGES], messages[-settings.CONTEXT_WINDOW_MESSAGES:]
+    if conversation.summary_until:
+        older = [message for message in older if message.created_at > conversation.summary_until]
+    return older + window
+
+
+def build_context_messages(conversation: Conversation, user_name: str) -> List[Dict[str, str]]:
+    """
+    Construye los mensajes de un turno: instrucciones y resumen, y el historial
+    posterior al resumen (que termina con los mensajes pendientes del usuario).
+
+    Args:
+        conversation: Conversación
+        user_name: Nombre del usuario
+
+    Returns:
+        Lista de mensajes {role, content} para threads.create_and_run (el último es del usuario)
+    """
+    now_str = datetime.now().strftime('%d/%m/%Y %H:%M')
+    header = [
+        f"Nombre del usuario: {user_name}. (No es necesario que siempre lo llames por su nombre.)",
+        f"Fecha de consulta: {now_str}.",
+    ]
+    if conversation.fixture_id:
+        header.append(
+            f"Antes de responder, ejecuta siempre la función consultar_partido_en_vivo({conversation.fixture_id}) "
+            "para obtener los datos más recientes del partido y sus cuotas."
+        )
+    if conversation.context_summary:
+        header.append(f"Resumen de la conversación anterior:\n{conversation.context_summary}")
+
+    messages = [{'role': 'user', 'content': "\n".join(header)}]
+    for message in _history(conversation):
+        role = 'user' if message.is_from_user else 'assistant'
+        if messages[-1]['role'] == role:
+            # Mensajes consecutivos del mismo rol (p. ej. una ráfaga del usuario) se unen
+            messages[-1]['content'] += f"\n{message.content}"
+        else:
+            messages.append({'role': role, 'content': message.content})
+
+    if messages[-1]['role'] != 'user':
+        messages.append({'role': 'user', 'content': "Continúa la conversación."})
+    return messages
+
+
+def messages_pending_summary(conversation: Conversation):
+    """Mensajes anteriores a la ventana que aún no están incluidos en el resumen."""
+    window = _window(conversation)
+    if not window:
+        return Message.objects.none()
+    pending = conversation.messages.filter(message_type='text', created_at__lt=window[0].created_at)
+    if conversation.summary_until:
+        pending = pending.filter(created_at__gt=conversation.summary_until)
+    return pending.order_by('created_at')
+
+
+def maybe_refresh_summary(conversation: Conversation) -> bool:
+    """
+    Encola la actualización del resumen si hay CONTEXT_SUMMARY_BATCH mensajes fuera de la ventana.
+
+    Args:
+        conversation: Conversación
+
+    Returns:
+        True si se encoló la actualización
+    """
+    if not is_managed(conversation):
+        return False
+    if messages_pending_summary(conversation).count() < settings.CONTEXT_SUMMARY_BATCH:
+        return False
+    from .tasks import refresh_conversation_summary
+    refresh_conversation_summary.delay(conversation.id)
+    return True
+
+
+def summarize(previous_summary: str, messages: List[Message], client=None) -> str:
+    """
+    Integra mensajes nuevos en el resumen de la conversación.
+
+    Args:
+        previous_summary: Resumen acumulado (puede estar vacío)
+        messages: Mensajes a incorporar, en orden cronológico
+        client: Cliente OpenAI (por defecto el compartido del proceso)
+
+    Returns:
+        Nuevo resumen
+    """
+    if client is None:
+        from .openai_client import get_openai_client
+        client = get_openai_client()
+
+    transcript = "\n".join(
+        f"{'Usuario' if message.is_from_user else 'Asistente'}: {message.content}" for message in messages
+    )
+    content = f"Resumen previo:\n{previous_summary or '(ninguno)'}\n\nMensajes nuevos:\n{transcript}"
+    response = client.chat.completions.create(
+        model=settings.CONTEXT_SUMMARY_MODEL,
+        messages=[
+            {'role': 'system', 'content': SUMMARY_INSTRUCTIONS.format(max_words=settings.CONTEXT_SUMMARY_MAX_WORDS)},
+            {'role': 'user', 'content': content},
+        ],
+    )
+    return response.choices[0].message.content.strip()
+
+
+def refresh_summary(conversation: Conversation, client=None) -> Optional[int]:
+    """
+    Incorpora al resumen los mensajes que quedaron fuera de la ventana.
+
+    Args:
+        conversation: Conversación
+        client: Cliente OpenAI (opcional)
+
+    Returns:
+        Número de mensajes incorporados o None si no había pendientes
+    """
+    pending = list(messages_pending_summary(conversation))
+    if not pending:
+        return None
+    conversation.context_summary = summarize(conversation.context_summary, pending, client)
+    conversation.summary_until = pending[-1].created_at
+    conversation.save(update_fields=['context_summary', 'summary_until'])
+    return len(pending)
@@ -0,0 +1,106 @@
+"""
+Contadores diarios de mensajes por usuario para el límite del plan gratuito.
+
+Cada mensaje entrante incrementa en Redis (``cache.incr``) un contador por
+usuario y día local que expira a la medianoche de TIME_ZONE. El contador es la
+fuente de verdad para aplicar DAILY_MESSAGES_LIMIT, así que la comprobación es
+O(1) en lugar de un COUNT con join sobre ``Message``. Una tarea periódica
+reconcilia los contadores con los mensajes registrados en la base de datos por
+si Redis perdió claves.
+"""
+import logging
+from datetime import datetime, time as dt_time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
+
+from .metrics import increment
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+COUNTER_KEY = "daily_messages:{phone}:{day}"
+
+
+def _local_midnights():
+    """Inicio del día local actual y de mañana (aware)."""
+    today = timezone.localdate()
+    start = timezone.make_aware(datetime.combine(today, dt_time.min))
+    return start, timezone.make_aware(datetime.combine(today + timedelta(days=1), dt_time.min))
+
+
+def _key(phone: str) -> str:
+    return COUNTER_KEY.format(phone=phone, day=timezone.localdate().strftime('%Y%m%d'))
+
+
+def _ttl() -> int:
+    """Segundos hasta la medianoche local (con un pequeño margen)."""
+    _, tomorrow = _local_midnights()
+    return int((tomorrow - timezone.now()).total_seconds()) + 60
+
+
+def record_message(phone: str) -> int:
+    """
+    Cuenta un mensaje entrante del usuario.
+
+    Args:
+        phone: Teléfono del usuario
+
+    Returns:
+        Mensajes del usuario hoy, incluido este
+    """
+    key = _key(phone)
+    try:
+        cache.add(key, 0, _ttl())
+        return cache.incr(key)
+    except Exception as e:
+        logger.warning(f"No se pudo actualizar el contador diario de {phone}: {str(e)}")
+        return 0
+
+
+def get_count(phone: str) -> int:
+    """Mensajes entrantes del usuario en el día local actual."""
+    try:
+        return cache.get(_key(phone), 0)
+    except Exception as e:
+        logger.warning(f"No se pudo leer el contador diario de {phone}: {str(e)}")
+        return 0
+
+
+def has_reached_limit(count: int) -> bool:
+    """Indica si un número de mensajes diarios alcanza DAILY_MESSAGES_LIMIT."""
+    return count >= settings.DAILY_MESSAGES_LIMIT
+
+
+def reconcile() -> int:
+    """
+    Ajusta los contadores del día a los mensajes entrantes registrados en la base de datos.
+
+    Solo se corrigen contadores por debajo de la cuenta real (claves perdidas o
+    expulsadas de Redis); nunca se reducen.
+
+    Returns:
+        Número de contadores corregidos
+    """
+    today_start, _ = _local_midnights()
+    # Cada mensaje entrante se registra una vez en la conversación de sistema (log_message)
+    counts = (
+        Message.objects.filter(
+            is_from_user=True,
+            created_at__gte=today_start,
+            conversation__thread_id__startswith="system_conversation_",
+        )
+        .values('conversation__user')
+        .annotate(count=Count('id'))
+    )
+    fixed = 0
+    for row in counts:
+        phone = row['conversation__user']
+        if get_count(phone) < row['count']:
+            cache.set(_key(phone), row['count'], _ttl())
+            fixed += 1
+    if fixed:
+        increment('daily_limits:reconciled', fixed)
+    return fixed
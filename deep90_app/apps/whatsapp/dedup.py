@@ -0,0 +1,110 @@
+"""
+Idempotencia de los webhooks de WhatsApp.
+
+Meta reintenta las entregas que no recibe a tiempo, y sin control un reintento
+vuelve a ejecutar todo el flujo (runs de OpenAI incluidos) y duplica respuestas.
+Cada ``message.id`` se reclama dos veces:
+
+- En la vista, con ``cache.add`` sobre una clave con TTL (O(1), sin base de
+  datos): los reintentos se descartan antes de encolar nada. Si el encolado
+  falla, los IDs se liberan (``release_at_edge``) para aceptar el reintento.
+- En el worker, insertando el ID en ``InboundMessage`` (clave primaria única),
+  que cubre los casos en que la clave de Redis ya expiró o se perdió.
+"""
+import logging
+from datetime import timedelta
+from typing import Dict, Iterable, List
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.utils import timezone
+
+from .metrics import get_counter, increment
+from .models import InboundMessage
+
+logger = logging.getLogger(__name__)
+
+SEEN_KEY = "webhook:seen:{message_id}"
+
+
+def claim_at_edge(message_ids: Iterable[str]) -> List[str]:
+    """
+    Reclama los IDs de mensaje de un webhook en Redis.
+
+    Args:
+        message_ids: IDs de los mensajes del payload
+
+    Returns:
+        IDs no vistos antes (los duplicados se cuentan en ``webhook:dedup_hits``)
+    """
+    new_ids = []
+    for message_id in message_ids:
+        try:
+            claimed = cache.add(SEEN_KEY.format(message_id=message_id), 1, settings.WEBHOOK_DEDUP_TTL)
+        except Exception as e:
+            logger.warning(f"No se pudo comprobar el mensaje {message_id} en la caché: {str(e)}")
+            claimed = True
+        if claimed:
+            new_ids.append(message_id)
+        else:
+            increment('webhook:dedup_hits')
+    return new_ids
+
+
+def release_at_edge(message_ids: Iterable[str]) -> None:
+    """
+    Libera IDs reclamados con ``claim_at_edge`` cuyo mensaje no llegó a encolarse,
+    para que el reintento de Meta no se descarte como duplicado.
+
+    Args:
+        message_ids: IDs de los mensajes a liberar
+    """
+    try:
+        cache.delete_many([SEEN_KEY.format(message_id=message_id) for message_id in message_ids])
+    except Exception as e:
+        logger.error(f"No se pudieron liberar los mensajes {list(message_ids)} en la caché: {str(e)}")
+
+
+def claim_in_db(message_id: str, wa_id: str) -> bool:
+    """
+    Reclama un ID de mensaje en la base de datos.
+
+    Args:
+        message_id: ID del mensaje
+        wa_id: ID de WhatsApp del remitente
+
+    Returns:
+        True si es la primera vez que se ve el mensaje
+    """
+    try:
+        InboundMessage.objects.create(message_id=message_id, wa_id=wa_id)
+        return True
+    except IntegrityError:
+        increment('webhook:dedup_db_hits')
+        return False
+
+
+def purge_inbound_messages() -> int:
+    """
+    Elimina los IDs más antiguos que INBOUND_MESSAGE_RETENTION_DAYS.
+
+    Returns:
+        Número de filas eliminadas
+    """
+    cutoff = timezone.now() - timedelta(days=settings.INBOUND_MESSAGE_RETENTION_DAYS)
+    deleted, _ = InboundMessage.objects.filter(received_at__lt=cutoff).delete()
+    return deleted
+
+
+def get_dedup_status() -> Dict[str, int]:
+    """
+    Métricas de duplicados descartados.
+
+    Returns:
+        Diccionario con los duplicados descartados en la vista (Redis) y en el worker (base de datos)
+    """
+    return {
+        'edge_hits': get_counter('webhook:dedup_hits'),
+        'db_hits': get_counter('webhook:dedup_db_hits'),
+    }
@@ -9,6 +9,7 @@ import json
 import logging
 from django.utils.translation import gettext_lazy as _
 from deep90_app.apps.sports_data.models import FixtureData, LeagueData, LiveFixtureData
+from deep90_app.apps.sports_data.demand import mark_fixture_hot
 
 logger = logging.getLogger(__name__)
 
@@ -458,6 +459,9 @@ class FootballDataFlow:
             logger.info(f"Buscando datos del partido en vivo con ID {fixture_id}")
             fixture = LiveFixtureData.objects.get(fixture_id=fixture_id)
             
+            # Señal de demanda: el partido se enriquece con más datos mientras se consulta
+            mark_fixture_hot(fixture_id, reason='flow')
+            
             # Crear una copia de la respuesta base
             screen_response = dict(cls.SCREEN_RESPONSES["FIXTURE_DETAIL"])
             
@@ -0,0 +1,194 @@
+"""
+Procesamiento ordenado de los mensajes entrantes de cada usuario.
+
+Celery puede ejecutar a la vez dos mensajes del mismo usuario en workers
+distintos, lo que provoca carreras al crear la conversación o lanzar runs sobre
+el mismo hilo. ``receive_whatsapp_webhook`` guarda cada mensaje, en el orden del
+webhook, en los pendientes del ``wa_id``: un conjunto ordenado de Redis sin
+expiración, ordenado por la marca de tiempo de WhatsApp y, dentro del mismo
+segundo, por orden de llegada (ver ``_score``). Después encola
+``process_whatsapp_message``, que solo vacía los pendientes si obtiene el lock
+del usuario, en orden y de uno en uno. Los mensajes de usuarios distintos se
+procesan en paralelo sin restricciones.
+
+Un mensaje solo se quita de los pendientes después de procesarlo, así que si el
+worker muere a mitad sigue ahí. El lock lleva el token de su dueño: se renueva
+antes de cada mensaje y solo lo libera quien lo tomó. Los usuarios con
+pendientes se registran en un conjunto que ``drain_stalled_users`` (tarea
+periódica) recorre para retomar los que nadie está atendiendo. Si el carril del
+plan está lleno (``plan_lanes.LaneFull``), el mensaje se deja pendiente y se
+corta el vaciado para reintentarlo más tarde sin desordenar los siguientes.
+"""
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from deep90_app.utils import redis_store
+
+from .metrics import get_counter, increment
+from .plan_lanes import LaneFull
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = "inbound:pending:{wa_id}"
+PROCESSING_KEY = "inbound:processing:{wa_id}"
+SEQUENCE_KEY = "inbound:seq:{wa_id}"
+ATTEMPT_KEY = "inbound:attempt:{message_id}"
+USERS_KEY = "inbound:users"
+
+# Tiempo durante el que se recuerda que un mensaje ya se empezó a procesar
+ATTEMPT_TTL = 60 * 60 * 24
+
+# Posiciones de llegada que caben dentro de un segundo de la puntuación
+SEQUENCE_SPAN = 1_000_000
+
+
+def _score(wa_id: str, message_data: Dict[str, Any]) -> float:
+    """
+    Puntuación de un mensaje pendiente: marca de tiempo * SEQUENCE_SPAN + secuencia del usuario.
+
+    La marca de tiempo de WhatsApp solo tiene resolución de segundos y Redis
+    desempata por el contenido del miembro, no por la llegada; la secuencia
+    (INCR por usuario) mantiene el orden de una ráfaga dentro del mismo segundo.
+    La puntuación es exacta en un float (menor que 2**53).
+    """
+    timestamp = int(message_data.get('timestamp') or time.time())
+    sequence = redis_store.increment(SEQUENCE_KEY.format(wa_id=wa_id)) % SEQUENCE_SPAN
+    return float(timestamp * SEQUENCE_SPAN + sequence)
+
+
+def push(wa_id: str, contact_data: Dict[str, Any], message_data: Dict[str, Any]) -> bool:
+    """
+    Añade un mensaje a los pendientes del usuario respetando el orden de WhatsApp.
+
+    Args:
+        wa_id: ID de WhatsApp del usuario
+        contact_data: Datos del contacto del webhook
+        message_data: Datos del mensaje del webhook
+
+    Returns:
+        True si el mensaje quedó pendiente
+    """
+    entry = json.dumps({'contact': contact_data, 'message': message_data}, sort_keys=True)
+    try:
+        redis_store.zset_add(PENDING_KEY.format(wa_id=wa_id), entry, _score(wa_id, message_data), only_new=True)
+        redis_store.set_add(USERS_KEY, wa_id)
+        return True
+    except Exception as e:
+        logger.warning(f"No se pudo guardar el mensaje pendiente de {wa_id}: {str(e)}")
+        return False
+
+
+def peek(wa_id: str) -> Optional[Tuple[str, Dict[str, Any], Dict[str, Any]]]:
+    """
+    Mensaje pendiente más antiguo del usuario, sin quitarlo.
+
+    Returns:
+        Tupla (entrada, contacto, mensaje) o None si no hay pendientes
+    """
+    first = redis_store.zset_first(PENDING_KEY.format(wa_id=wa_id))
+    if first is None:
+        return None
+    entry = json.loads(first[0])
+    return first[0], entry['contact'], entry['message']
+
+
+def is_first_attempt(message_id: Optional[str]) -> bool:
+    """
+    Indica si es la primera vez que se procesa un mensaje.
+
+    Un mensaje aplazado por un carril lleno vuelve a procesarse desde el
+    principio; con esto su registro y su cuenta diaria no se repiten.
+    """
+    if not message_id:
+        return True
+    try:
+        return redis_store.set_if_absent(ATTEMPT_KEY.format(message_id=message_id), '1', ATTEMPT_TTL)
+    except Exception as e:
+        logger.warning(f"No se pudo marcar el intento del mensaje {message_id}: {str(e)}")
+        return True
+
+
+def has_pending(wa_id: str) -> bool:
+    """Indica si el usuario tiene mensajes pendientes."""
+    return redis_store.zset_count(PENDING_KEY.format(wa_id=wa_id)) > 0
+
+
+def is_being_processed(wa_id: str) -> bool:
+    """Indica si algún worker tiene el lock del usuario."""
+    return redis_store.get_value(PROCESSING_KEY.format(wa_id=wa_id)) is not None
+
+
+def drain(wa_id: str, handler: Callable[[Dict[str, Any], Dict[str, Any]], None]) -> int:
+    """
+    Procesa en orden con ``handler`` los pendientes del usuario si ningún otro
+    worker lo atiende.
+
+    Si otro worker tiene el lock del usuario, los pendientes se dejan a ese
+    worker, que los procesará antes de soltar el lock.
+
+    Args:
+        wa_id: ID de WhatsApp del usuario
+        handler: Función que procesa un mensaje (contact_data, message_data)
+
+    Returns:
+        Número de mensajes procesados por este worker
+
+    Raises:
+        LaneFull: Si el handler no pudo procesar el mensaje por falta de plazas;
+            el mensaje sigue pendiente
+    """
+    processed = 0
+    pending_key = PENDING_KEY.format(wa_id=wa_id)
+    processing_key = PROCESSING_KEY.format(wa_id=wa_id)
+    while True:
+        token = redis_store.acquire_lock(processing_key, settings.INBOUND_LOCK_TTL)
+        if token is None:
+            if not processed:
+                increment('inbound:handed_off')
+            return processed
+        try:
+            while (item := peek(wa_id)) is not None:
+                if not redis_store.extend_lock(processing_key, token, settings.INBOUND_LOCK_TTL):
+                    # El lock expiró y otro worker atiende ya al usuario
+                    logger.warning(f"Lock de mensajes entrantes de {wa_id} perdido; se cede al otro worker")
+                    return processed
+                entry, contact_data, message_data = item
+                try:
+                    handler(contact_data, message_data)
+                except LaneFull:
+                    raise
+                except Exception as e:
+                    logger.error(f"Error al procesar un mensaje pendiente de {wa_id}: {e}")
+                redis_store.zset_remove(pending_key, entry)
+                processed += 1
+        finally:
+            redis_store.release_lock(processing_key, token)
+        # Un mensaje pudo llegar entre el último peek y la liberación del lock;
+        # push lo vuelve a registrar si llega después de esta comprobación
+        redis_store.set_remove(USERS_KEY, wa_id)
+        if not has_pending(wa_id):
+            return processed
+        redis_store.set_add(USERS_KEY, wa_id)
+
+
+def get_stalled_users() -> List[str]:
+    """Usuarios con mensajes pendientes que ningún worker está atendiendo."""
+    stalled = []
+    for wa_id in redis_store.set_members(USERS_KEY):
+        if not has_pending(wa_id):
+            redis_store.set_remove(USERS_KEY, wa_id)
+        elif not is_being_processed(wa_id):
+            stalled.append(wa_id)
+    return stalled
+
+
+def get_inbound_status() -> Dict[str, int]:
+    """Métricas del procesamiento ordenado: mensajes cedidos al worker que ya atendía al usuario y usuarios retomados."""
+    return {
+        'handed_off': get_counter('inbound:handed_off'),
+        'recovered': get_counter('inbound:recovered'),
+    }
@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand
+
+from deep90_app.apps.whatsapp.answer_cache import get_answer_cache_status
+from deep90_app.apps.whatsapp.dedup import get_dedup_status
+from deep90_app.apps.whatsapp.inbound_queue import get_inbound_status
+from deep90_app.apps.whatsapp.metrics import get_latency_summary
+from deep90_app.apps.whatsapp.openai_client import ENDPOINT_NAMES
+from deep90_app.apps.whatsapp.outbound import get_outbound_status
+from deep90_app.apps.whatsapp.plan_lanes import get_lane_status
+from deep90_app.apps.whatsapp.run_tracker import get_tracker_status
+from deep90_app.apps.whatsapp.tools import get_tool_metrics
+
+
+class Command(BaseCommand):
+    help = 'Muestra las métricas del asistente: tiempo hasta la respuesta por modo de ejecución, carga de sondeos, caché de respuestas, carriles por plan, secuenciador de envíos, latencia de OpenAI por endpoint y latencia por herramienta'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.MIGRATE_HEADING('Tiempo hasta la respuesta'))
+        self.stdout.write(f"{'Modo':<10} {'Muestras':>9} {'Mediana (s)':>12} {'p90 (s)':>9} {'Máx (s)':>9}")
+        for mode in ('stream', 'tracker', 'poll', 'cache'):
+            summary = get_latency_summary(f"time_to_reply:{mode}")
+            if summary:
+                self.stdout.write(f"{mode:<10} {summary['samples']:>9} {summary['median']:>12} {summary['p90']:>9} {summary['max']:>9}")
+            else:
+                self.stdout.write(f"{mode:<10} {'-':>9}")
+
+        status = get_tracker_status()
+        self.stdout.write(self.style.MIGRATE_HEADING('Carga del broker por sondeos'))
+        self.stdout.write(f"Modo poll: {status['poll_mode_tasks']} tareas process_assistant_run (una por sondeo)")
+        self.stdout.write(
+            f"Tracker: {status['tracked']} runs registrados, {status['polls']} sondeos en "
+            f"{status['tracker_tasks']} tareas, eventos {status['events']}, pendientes {status['pending']}"
+            f"{' (activo)' if status['active'] else ''}"
+        )
+
+        inbound = get_inbound_status()
+        self.stdout.write(
+            f"Mensajes entrantes cedidos al worker que ya atendía al usuario: {inbound['handed_off']}, "
+            f"usuarios retomados tras quedar sin worker: {inbound['recovered']}"
+        )
+
+        duplicates = get_dedup_status()
+        self.stdout.write(
+            f"Reintentos del webhook descartados: {duplicates['edge_hits']} en la vista (Redis), "
+            f"{duplicates['db_hits']} en el worker (base de datos)"
+        )
+
+        answers = get_answer_cache_status()
+        staleness = answers['staleness'] or {}
+        self.stdout.write(self.style.MIGRATE_HEADING('Caché de respuestas'))
+        self.stdout.write(
+            f"Aciertos {answers['hits']}, fallos {answers['misses']}, tasa de acierto {answers['hit_rate']}, "
+            f"tokens ahorrados {answers['tokens_saved']}, personalizadas sin guardar {answers['personalized']}, "
+            f"antigüedad mediana {staleness.get('median')}s (máx {staleness.get('max')}s)"
+        )
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Carriles por plan'))
+        self.stdout.write(f"{'Plan':<10} {'En curso':>9} {'Plazas':>7} {'Aplazados':>10} {'Espera mediana (s)':>19} {'p90 (s)':>9}")
+        for plan, lane in get_lane_status().items():
+            wait = lane['queue_wait'] or {}
+            self.stdout.write(
+                f"{plan:<10} {lane['in_flight']!s:>9} {lane['capacity']:>7} {lane['deferred']:>10} "
+                f"{wait.get('median', '-')!s:>19} {wait.get('p90', '-')!s:>9}"
+            )
+
+        sequencer = get_outbound_status()
+        self.stdout.write(self.style.MIGRATE_HEADING('Secuenciador de envíos'))
+        self.stdout.write(
+            f"Pasos programados {sequencer['paced']}, entregados {sequencer['delivered']}, fallidos {sequencer['failed']}"
+        )
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Latencia de OpenAI por endpoint'))
+        self.stdout.write(f"{'Endpoint':<28} {'Muestras':>9} {'Mediana (s)':>12} {'p90 (s)':>9} {'Máx (s)':>9}")
+        for name in sorted(set(ENDPOINT_NAMES.values())):
+            summary = get_latency_summary(f"openai:{name}")
+            if summary:
+                self.stdout.write(f"{name:<28} {summary['samples']:>9} {summary['median']:>12} {summary['p90']:>9} {summary['max']:>9}")
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Herramientas'))
+        metrics = get_tool_metrics()
+        if not metrics:
+            self.stdout.write(self.style.WARNING('Sin métricas registradas.'))
+            return
+        self.stdout.write(f"{'Herramienta':<28} {'Llamadas':>9} {'Caché':>7} {'Media (ms)':>11} {'Máx (ms)':>10}")
+        for name, data in sorted(metrics.items()):
+            self.stdout.write(f"{name:<28} {data['calls']:>9} {data['cache_hits']:>7} {data['avg_ms']:>11} {data['max_ms']:>10}")
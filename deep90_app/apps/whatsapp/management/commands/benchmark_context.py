@@ -0,0 +1,96 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from deep90_app.apps.sports_data.live_payloads import estimate_tokens
+from deep90_app.apps.whatsapp.context_manager import build_context_messages
+from deep90_app.apps.whatsapp.models import Conversation, Message, WhatsAppUser
+
+# Texto que el modo hilo añade a cada mensaje del usuario (ver process_text_message)
+THREAD_MODE_BOILERPLATE = (
+    "\n. Nombre: Usuario. (No es necesario que siempre me llames por mi nombre, pero te lo digo para que lo sepas, "
+    "en ocasiones peudes hacerlo para sentir mas cercano)\n. Fecha de consulta: 01/01/2025 12:00. Por favor, antes "
+    "de responder, ejecuta siempre la función consultar_partido_en_vivo(1) para obtener los datos más recientes "
+    "del partido y sus cuotas\n"
+)
+SAMPLE_QUESTION = "¿Cómo ves el partido? ¿Quién crees que marcará el próximo gol?"
+SAMPLE_ANSWER = (
+    "El local domina la posesión y ha generado las ocasiones más claras; las cuotas reflejan esa ventaja. "
+    "Si mantiene la presión, es el favorito para marcar el próximo gol."
+)
+
+
+class Command(BaseCommand):
+    help = 'Compara el tamaño del contexto (y opcionalmente la latencia) del modo hilo frente al contexto gestionado según la longitud del historial'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lengths', default='0,10,20,40', help='Longitudes de historial a comparar, separadas por comas')
+        parser.add_argument('--run', action='store_true', help='Ejecuta runs reales contra OpenAI y mide su duración')
+        parser.add_argument('--assistant-id', default=None, help='Asistente para --run (por defecto ASSISTANT_ID_PREDICTIONS)')
+
+    def handle(self, *args, **options):
+        lengths = [int(length) for length in options['lengths'].split(',')]
+        assistant_id = options['assistant_id'] or settings.ASSISTANT_ID_PREDICTIONS
+        manager = None
+        if options['run']:
+            from deep90_app.apps.whatsapp.assistant_manager import AssistantManager
+            manager = AssistantManager()
+
+        self.stdout.write(
+            f"{'Historial':>9} {'Tokens hilo':>12} {'Tokens gestionado':>18} {'Run hilo (s)':>13} {'Run gestionado (s)':>19}"
+        )
+        for length in lengths:
+            # Conversación sintética que se descarta al terminar
+            with transaction.atomic():
+                thread_messages, managed_messages = self._build(length)
+                transaction.set_rollback(True)
+
+            thread_tokens = sum(estimate_tokens(message['content']) for message in thread_messages)
+            managed_tokens = sum(estimate_tokens(message['content']) for message in managed_messages)
+            thread_seconds = managed_seconds = '-'
+            if manager:
+                thread_seconds = self._time_run(manager, assistant_id, thread_messages)
+                managed_seconds = self._time_run(manager, assistant_id, managed_messages)
+            self.stdout.write(
+                f"{length:>9} {thread_tokens:>12} {managed_tokens:>18} {thread_seconds:>13} {managed_seconds:>19}"
+            )
+
+    def _build(self, length):
+        """Crea una conversación con ``length`` mensajes y devuelve los mensajes de cada modo."""
+        user = WhatsAppUser.objects.create(phone_number='benchmark-context')
+        conversation = Conversation.objects.create(user=user, thread_id='benchmark', fixture_id='1')
+        start = timezone.now() - timedelta(minutes=length + 1)
+        thread_messages = []
+        for index in range(length + 1):
+            # El historial siempre termina con una pregunta del usuario
+            is_from_user = index % 2 == 0 if length % 2 == 0 else index % 2 == 1
+            content = SAMPLE_QUESTION if is_from_user else SAMPLE_ANSWER
+            Message.objects.create(
+                conversation=conversation, is_from_user=is_from_user, content=content,
+                created_at=start + timedelta(minutes=index),
+            )
+            thread_messages.append({
+                'role': 'user' if is_from_user else 'assistant',
+                'content': content + THREAD_MODE_BOILERPLATE if is_from_user else content,
+            })
+        return thread_messages, build_context_messages(conversation, 'Usuario')
+
+    def _time_run(self, manager, assistant_id, messages):
+        """Duración en segundos de un run sobre un hilo con ``messages``."""
+        try:
+            # threads.create admite como máximo 32 mensajes iniciales; el resto se añade después
+            thread = manager.client.beta.threads.create(messages=messages[:32])
+            for message in messages[32:]:
+                manager.client.beta.threads.messages.create(thread_id=thread.id, **message)
+            start = time.perf_counter()
+            result = manager.stream_run(thread.id, assistant_id)
+            elapsed = round(time.perf_counter() - start, 2)
+            manager.client.beta.threads.delete(thread.id)
+            return elapsed if result['status'] == 'completed' else result['status']
+        except Exception as e:
+            self.stderr.write(f"Error al ejecutar el run: {e}")
+            return 'error'
@@ -0,0 +1,75 @@
+import hashlib
+import hmac
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+
+
+def build_payload(index):
+    """Payload de webhook con un mensaje de texto, como los que envía Meta."""
+    wa_id = f"5730{index % 50:08d}"
+    return {
+        'object': 'whatsapp_business_account',
+        'entry': [{
+            'id': 'benchmark',
+            'changes': [{
+                'field': 'messages',
+                'value': {
+                    'messaging_product': 'whatsapp',
+                    'contacts': [{'wa_id': wa_id, 'profile': {'name': 'Benchmark'}}],
+                    'messages': [{
+                        'id': f"wamid.benchmark.{index}.{time.time_ns()}",
+                        'from': wa_id,
+                        'timestamp': str(int(time.time())),
+                        'type': 'text',
+                        'text': {'body': '¿Cómo va el partido?'},
+                    }],
+                },
+            }],
+        }],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Mide el tiempo de respuesta (p50/p90/p99) del webhook de WhatsApp ante una ráfaga de mensajes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Número de peticiones de la ráfaga')
+        parser.add_argument('--concurrency', type=int, default=20, help='Peticiones simultáneas')
+
+    def handle(self, *args, **options):
+        url = reverse('whatsapp:webhook')
+        bodies = [json.dumps(build_payload(index)).encode('utf-8') for index in range(options['requests'])]
+
+        def post(body):
+            headers = {}
+            if settings.WHATSAPP_APP_SECRET:
+                signature = hmac.new(settings.WHATSAPP_APP_SECRET.encode('utf-8'), body, hashlib.sha256).hexdigest()
+                headers['HTTP_X_HUB_SIGNATURE_256'] = f"sha256={signature}"
+            start = time.perf_counter()
+            response = Client().post(url, data=body, content_type='application/json', **headers)
+            return time.perf_counter() - start, response.status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            results = list(executor.map(post, bodies))
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(latency for latency, _ in results)
+        errors = sum(1 for _, status_code in results if status_code != 200)
+
+        def percentile(fraction):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000
+
+        self.stdout.write(
+            f"{len(results)} peticiones en {elapsed:.2f}s ({len(results) / elapsed:.0f} req/s), errores {errors}"
+        )
+        self.stdout.write(
+            f"p50 {percentile(0.5):.1f}ms, p90 {percentile(0.9):.1f}ms, p99 {percentile(0.99):.1f}ms, "
+            f"máx {latencies[-1] * 1000:.1f}ms"
+        )
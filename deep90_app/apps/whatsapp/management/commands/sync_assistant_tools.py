@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from deep90_app.apps.whatsapp.tools import get_openai_tool_definitions
+
+
+class Command(BaseCommand):
+    help = 'Registra en los asistentes de OpenAI las herramientas del registro (tools.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--assistant-id', action='append', help='Asistente a actualizar (se puede repetir; por defecto todos los configurados)')
+
+    def handle(self, *args, **options):
+        from deep90_app.apps.whatsapp.assistant_manager import AssistantManager
+
+        assistant_ids = options['assistant_id'] or [
+            assistant_id for assistant_id in {
+                settings.ASSISTANT_ID_PAY,
+                settings.ASSISTANT_ID_PREDICTIONS,
+                settings.ASSISTANT_ID_LIVE_ODDS,
+                settings.ASSISTANT_ID_BETTING,
+            } if assistant_id
+        ]
+        definitions = get_openai_tool_definitions()
+        client = AssistantManager().client
+        for assistant_id in assistant_ids:
+            assistant = client.beta.assistants.retrieve(assistant_id)
+            # Conservar las herramientas que no son funciones (file_search, code_interpreter)
+            tools = [tool for tool in assistant.tools if tool.type != 'function'] + definitions
+            client.beta.assistants.update(assistant_id, tools=tools)
+            self.stdout.write(self.style.SUCCESS(f"{assistant_id}: {len(definitions)} funciones registradas"))
+
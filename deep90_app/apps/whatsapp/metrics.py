@@ -0,0 +1,101 @@
+"""
+Métricas ligeras de la mensajería con el asistente, guardadas en la caché compartida.
+
+Las muestras de latencia se guardan como una ventana deslizante por nombre para
+poder calcular medianas y percentiles sin una base de datos de series temporales.
+Cada ventana es una lista de Redis acotada con LPUSH + LTRIM (redis_store), de
+modo que los workers y los hooks de OpenAI que registran a la vez no pierden
+muestras.
+"""
+import logging
+import statistics
+import time
+from typing import Dict, Any, Optional
+
+from django.core.cache import cache
+
+from deep90_app.utils import redis_store
+
+logger = logging.getLogger(__name__)
+
+LATENCY_KEY = "assistant_metrics:latency:{name}"
+COUNTER_KEY = "assistant_metrics:counter:{name}"
+
+# Número de muestras conservadas por métrica
+LATENCY_WINDOW = 500
+
+
+def record_latency(name: str, seconds: float) -> None:
+    """
+    Añade una muestra de latencia a la ventana de una métrica.
+
+    Args:
+        name: Nombre de la métrica (p. ej. "time_to_reply:stream")
+        seconds: Duración medida en segundos
+    """
+    try:
+        redis_store.list_push_capped(LATENCY_KEY.format(name=name), str(round(seconds, 3)), LATENCY_WINDOW)
+    except Exception as e:
+        logger.warning(f"No se pudo registrar la métrica {name}: {str(e)}")
+
+
+def get_latency_summary(name: str) -> Optional[Dict[str, Any]]:
+    """
+    Resume la ventana de muestras de una métrica.
+
+    Args:
+        name: Nombre de la métrica
+
+    Returns:
+        Diccionario con samples, median, p90 y max (en segundos) o None si no hay muestras
+    """
+    samples = redis_store.list_items(LATENCY_KEY.format(name=name))
+    if not samples:
+        return None
+    ordered = sorted(float(sample) for sample in samples)
+    return {
+        'samples': len(ordered),
+        'median': round(statistics.median(ordered), 3),
+        'p90': ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))],
+        'max': ordered[-1],
+    }
+
+
+def increment(name: str, amount: int = 1) -> None:
+    """Incrementa un contador creándolo si no existe."""
+    try:
+        key = COUNTER_KEY.format(name=name)
+        cache.add(key, 0, None)
+        cache.incr(key, amount)
+    except Exception as e:
+        logger.warning(f"No se pudo actualizar el contador {name}: {str(e)}")
+
+
+def get_counter(name: str) -> int:
+    """Obtiene el valor de un contador."""
+    return cache.get(COUNTER_KEY.format(name=name), 0)
+
+
+class StageTimer:
+    """
+    Mide la duración de las etapas de un flujo y las registra en el log.
+
+    Uso: ``timer.mark("threads.create_and_run")`` al terminar cada etapa y
+    ``timer.log()`` al final; el total se guarda como métrica ``stages:<nombre>``.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = self.last = time.perf_counter()
+        self.stages = []
+
+    def mark(self, stage: str) -> None:
+        now = time.perf_counter()
+        self.stages.append((stage, now - self.last))
+        self.last = now
+
+    def log(self) -> None:
+        total = self.last - self.start
+        record_latency(f"stages:{self.name}", total)
+        stages = ", ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in self.stages)
+        logger.info(f"Etapas de {self.name}: {stages} (total {total * 1000:.0f}ms)")
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.8 on 2026-10-19 00:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp', '0009_alter_assistantconfig_experience_level_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='context_summary',
+            field=models.TextField(blank=True, default='', help_text='Resumen acumulado de los mensajes anteriores a la ventana enviada al modelo', verbose_name='Resumen del contexto'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='summary_until',
+            field=models.DateTimeField(blank=True, help_text='Fecha del último mensaje incluido en el resumen', null=True, verbose_name='Resumen hasta'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.8 on 2026-10-19 00:28
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp', '0010_conversation_context_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboundMessage',
+            fields=[
+                ('message_id', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='ID del mensaje')),
+                ('wa_id', models.CharField(max_length=20, verbose_name='ID de WhatsApp')),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha de recepción')),
+            ],
+            options={
+                'verbose_name': 'Mensaje entrante',
+                'verbose_name_plural': 'Mensajes entrantes',
+                'indexes': [models.Index(fields=['received_at'], name='whatsapp_in_receive_b0d7d6_idx')],
+            },
+        ),
+    ]
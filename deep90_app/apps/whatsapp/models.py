@@ -110,6 +110,10 @@ class Conversation(models.Model):
     created_at = models.DateTimeField(_("Fecha de creación"), default=timezone.now)
     updated_at = models.DateTimeField(_("Fecha de actualización"), auto_now=True)
     last_message_at = models.DateTimeField(_("Último mensaje"), auto_now_add=True)
+    context_summary = models.TextField(_("Resumen del contexto"), blank=True, default="",
+                                       help_text=_("Resumen acumulado de los mensajes anteriores a la ventana enviada al modelo"))
+    summary_until = models.DateTimeField(_("Resumen hasta"), null=True, blank=True,
+                                         help_text=_("Fecha del último mensaje incluido en el resumen"))
 
     class Meta:
         verbose_name = _("Conversación")
@@ -246,3 +250,20 @@ class AssistantConfig(models.Model):
 
     def __str__(self):
         return f"Config de {self.user}"
+
+
+class InboundMessage(models.Model):
+    """Registro de IDs de mensajes entrantes ya aceptados, para descartar reintentos del webhook."""
+    message_id = models.CharField(_("ID del mensaje"), max_length=255, primary_key=True)
+    wa_id = models.CharField(_("ID de WhatsApp"), max_length=20)
+    received_at = models.DateTimeField(_("Fecha de recepción"), default=timezone.now)
+
+    class Meta:
+        verbose_name = _("Mensaje entrante")
+        verbose_name_plural = _("Mensajes entrantes")
+        indexes = [
+            models.Index(fields=['received_at']),
+        ]
+
+    def __str__(self):
+        return self.message_id
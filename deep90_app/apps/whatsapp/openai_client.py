@@ -0,0 +1,143 @@
+"""
+Cliente OpenAI compartido por proceso.
+
+Crear un ``OpenAI`` por cada ``AssistantManager`` implicaba un pool HTTP y una
+sesión TLS nuevos por tarea. Aquí se mantiene un único cliente por proceso con
+un pool de conexiones persistentes. El cliente se crea de forma perezosa y se
+recrea si cambia el PID, de modo que cada hijo de un worker prefork de Celery
+tiene su propio pool (las conexiones no se comparten entre procesos).
+
+Cada petición registra su latencia por endpoint (threads.create, messages.create,
+runs.create, runs.retrieve, ...) en las métricas del asistente.
+"""
+import logging
+import os
+import re
+import threading
+import time
+
+import httpx
+from django.conf import settings
+from openai import AsyncOpenAI, OpenAI
+
+from .metrics import record_latency
+
+logger = logging.getLogger(__name__)
+
+# Segmentos de ruta con IDs de OpenAI (thread_..., run_..., msg_..., asst_..., call_...)
+ID_SEGMENT = re.compile(r'/(thread|run|msg|asst|call|step)_[A-Za-z0-9]+')
+
+ENDPOINT_NAMES = {
+    ('POST', '/threads'): 'threads.create',
+    ('POST', '/threads/runs'): 'threads.create_and_run',
+    ('GET', '/threads/{thread}'): 'threads.retrieve',
+    ('POST', '/threads/{thread}/messages'): 'messages.create',
+    ('GET', '/threads/{thread}/messages'): 'messages.list',
+    ('POST', '/threads/{thread}/runs'): 'runs.create',
+    ('GET', '/threads/{thread}/runs/{run}'): 'runs.retrieve',
+    ('POST', '/threads/{thread}/runs/{run}/submit_tool_outputs'): 'runs.submit_tool_outputs',
+    ('POST', '/threads/{thread}/runs/{run}/cancel'): 'runs.cancel',
+    ('GET', '/assistants/{asst}'): 'assistants.retrieve',
+    ('POST', '/assistants/{asst}'): 'assistants.update',
+}
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def endpoint_name(method: str, path: str) -> str:
+    """
+    Nombre lógico del endpoint de OpenAI de una petición.
+
+    Args:
+        method: Método HTTP
+        path: Ruta de la petición (con o sin prefijo /v1)
+
+    Returns:
+        Nombre del endpoint (p. ej. "runs.retrieve") o "MÉTODO ruta" si no se reconoce
+    """
+    template = ID_SEGMENT.sub(lambda match: '/{' + match.group(1) + '}', path)
+    if template.startswith('/v1/'):
+        template = template[3:]
+    return ENDPOINT_NAMES.get((method, template), f"{method} {template}")
+
+
+def _on_request(request):
+    request.extensions['deep90_started'] = time.perf_counter()
+
+
+def _on_response(response):
+    started = response.request.extensions.get('deep90_started')
+    if started is not None:
+        name = endpoint_name(response.request.method, response.request.url.path)
+        record_latency(f"openai:{name}", time.perf_counter() - started)
+
+
+async def _on_request_async(request):
+    _on_request(request)
+
+
+async def _on_response_async(response):
+    _on_response(response)
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=settings.OPENAI_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.OPENAI_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY,
+    )
+
+
+def _timeout():
+    return httpx.Timeout(settings.OPENAI_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT)
+
+
+def get_openai_client() -> OpenAI:
+    """
+    Obtiene el cliente OpenAI del proceso actual, creándolo si no existe.
+
+    Returns:
+        Cliente OpenAI con pool de conexiones persistentes
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                http_client = httpx.Client(
+                    limits=_limits(),
+                    timeout=_timeout(),
+                    event_hooks={'request': [_on_request], 'response': [_on_response]},
+                )
+                _client = OpenAI(
+                    api_key=settings.OPENAI_API_KEY,
+                    http_client=http_client,
+                    max_retries=settings.OPENAI_MAX_RETRIES,
+                )
+                _client_pid = pid
+                logger.info(f"Cliente OpenAI creado para el proceso {pid}")
+    return _client
+
+
+def create_async_openai_client() -> AsyncOpenAI:
+    """
+    Crea un cliente AsyncOpenAI con los mismos límites e instrumentación.
+
+    Los clientes asíncronos quedan ligados a su event loop, por lo que se crean
+    por ejecución (usar con ``async with``) en lugar de compartirse.
+
+    Returns:
+        Cliente AsyncOpenAI
+    """
+    http_client = httpx.AsyncClient(
+        limits=_limits(),
+        timeout=_timeout(),
+        event_hooks={'request': [_on_request_async], 'response': [_on_response_async]},
+    )
+    return AsyncOpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        http_client=http_client,
+        max_retries=settings.OPENAI_MAX_RETRIES,
+    )
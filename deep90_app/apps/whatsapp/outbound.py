@@ -0,0 +1,84 @@
+"""
+Secuenciador de mensajes salientes con pausas que no bloquean workers.
+
+Varios flujos envían un mensaje y, un momento después, el menú principal u otro
+flujo para que WhatsApp los muestre en orden y el usuario tenga tiempo de leer.
+En lugar de ``time.sleep`` (que deja el worker parado), el paso siguiente se
+programa como tarea de la cola ``outbound`` con un retraso. Cada usuario tiene
+una marca del próximo envío libre, de modo que los pasos de un mismo usuario se
+entregan en orden y espaciados OUTBOUND_STEP_DELAY segundos.
+"""
+import logging
+import time
+from typing import Dict, Any
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .metrics import get_counter, increment
+
+logger = logging.getLogger(__name__)
+
+NEXT_AT_KEY = "outbound:next_at:{phone}"
+
+# Métodos de WhatsAppService que se pueden programar como paso diferido
+OUTBOUND_METHODS = {
+    'send_text_message',
+    'display_main_menu',
+    'send_registration_flow',
+    'send_config_analytics_flow',
+    'send_live_results_flow',
+}
+
+
+def reserve_slot(phone: str) -> float:
+    """
+    Reserva el siguiente instante de envío libre de un usuario.
+
+    Args:
+        phone: Teléfono del usuario
+
+    Returns:
+        Segundos hasta el envío reservado
+    """
+    key = NEXT_AT_KEY.format(phone=phone)
+    now = time.time()
+    due = max(now, cache.get(key) or 0) + settings.OUTBOUND_STEP_DELAY
+    cache.set(key, due, int(due - now) + 60)
+    return due - now
+
+
+def send_paced(phone: str, method: str, *args) -> float:
+    """
+    Programa ``WhatsAppService.<method>(phone, *args)`` tras la pausa de ritmo del usuario.
+
+    Args:
+        phone: Teléfono del usuario
+        method: Método de WhatsAppService (uno de OUTBOUND_METHODS)
+        *args: Argumentos adicionales del método
+
+    Returns:
+        Segundos hasta el envío
+    """
+    if method not in OUTBOUND_METHODS:
+        raise ValueError(f"Método de envío no permitido: {method}")
+    from .tasks import deliver_outbound_step
+
+    countdown = reserve_slot(phone)
+    deliver_outbound_step.apply_async(args=[phone, method, list(args)], countdown=countdown)
+    increment('outbound:paced')
+    return countdown
+
+
+def get_outbound_status() -> Dict[str, Any]:
+    """
+    Métricas del secuenciador.
+
+    Returns:
+        Diccionario con pasos programados, entregados y fallidos
+    """
+    return {
+        'paced': get_counter('outbound:paced'),
+        'delivered': get_counter('outbound:delivered'),
+        'failed': get_counter('outbound:failed'),
+    }
@@ -0,0 +1,227 @@
+"""
+Carriles de prioridad por plan de suscripción para el trabajo del asistente.
+
+Los mensajes entrantes y los runs del asistente se encolan en una cola de Celery
+por plan (``inbound_pro``, ``inbound_premium``, ``inbound_free``), de modo
+que una avalancha de usuarios gratuitos al inicio de un partido no retrasa a los
+de pago. El reparto ponderado se aplica sobre las llamadas a OpenAI: cada plan
+recibe una parte de ASSISTANT_OPENAI_CONCURRENCY proporcional a su peso en
+PLAN_LANE_WEIGHTS y, si su carril está lleno, el run se aplaza unos segundos sin
+ocupar el worker. Esto incluye el inicio de conversaciones nuevas: el mensaje
+que la inicia sigue pendiente (``LaneFull``) y se reintenta. Cada run ocupa su
+propia plaza, identificada por el token que devuelve ``acquire_slot``, de modo
+que cerrar un run reemplazado no libera la plaza del que lo sustituye.
+
+El carril PRO tiene además un worker propio (ver config/celery_app.py), así que
+sus mensajes no esperan detrás de los gratuitos. El tiempo de espera en cola se
+registra por plan (``queue_wait:<plan>``) para verificar el SLO de los usuarios PRO.
+"""
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from django.conf import settings
+
+from deep90_app.utils import redis_store
+
+from . import user_cache
+from .metrics import get_counter, get_latency_summary, increment, record_latency
+from .models import SubscriptionPlan, WhatsAppUser
+
+logger = logging.getLogger(__name__)
+
+SLOTS_KEY = "plan_lanes:slots:{plan}"
+
+# Tareas que se encolan en el carril del plan del usuario
+LANE_TASKS = {
+    'deep90_app.apps.whatsapp.tasks.process_whatsapp_message',
+    'deep90_app.apps.whatsapp.tasks.run_debounced_assistant',
+    'deep90_app.apps.whatsapp.tasks.stream_assistant_run',
+}
+
+
+class LaneFull(Exception):
+    """El carril del plan no tiene plazas libres y el trabajo debe reintentarse más tarde."""
+
+
+def queue_for_plan(plan: str) -> str:
+    """Nombre de la cola de Celery del carril de un plan."""
+    return f"inbound_{plan}"
+
+
+def plan_for_queue(queue: Optional[str]) -> Optional[str]:
+    """Plan de un carril a partir del nombre de su cola (None si no es un carril)."""
+    if queue and queue.startswith('inbound_') and queue[len('inbound_'):] in SubscriptionPlan.values:
+        return queue[len('inbound_'):]
+    return None
+
+
+def effective_plan(whatsapp_user: WhatsAppUser) -> str:
+    """Plan con el que se atiende al usuario: su plan si la suscripción está activa, si no FREE."""
+    if whatsapp_user.is_subscription_active():
+        return whatsapp_user.subscription_plan
+    return SubscriptionPlan.FREE
+
+
+def get_plan(phone: str) -> str:
+    """
+    Plan efectivo de un usuario, leído de la caché de perfiles (ver user_cache.py).
+
+    Args:
+        phone: Teléfono (wa_id) del usuario
+
+    Returns:
+        Plan de suscripción (FREE si el usuario aún no existe)
+    """
+    whatsapp_user = user_cache.find_user(phone)
+    return effective_plan(whatsapp_user) if whatsapp_user else SubscriptionPlan.FREE
+
+
+def _task_phone(name: str, args, kwargs) -> Optional[str]:
+    """Teléfono del usuario al que pertenece una tarea de carril."""
+    args = args or ()
+    if name.endswith('.process_whatsapp_message'):
+        contact = args[0] if args else (kwargs or {}).get('contact_data') or {}
+        return contact.get('wa_id')
+    if args:
+        return args[0]
+    return (kwargs or {}).get('user_phone')
+
+
+def route_to_lane(name, args, kwargs, options, task=None, **kw):
+    """
+    Router de Celery (ver config/celery_app.py): envía los mensajes entrantes y los
+    runs del asistente a la cola del plan de su usuario.
+
+    Returns:
+        Diccionario con la cola o None para dejar la tarea en su ruta por defecto
+    """
+    if name not in LANE_TASKS or options.get('queue'):
+        return None
+    try:
+        phone = _task_phone(name, args, kwargs)
+        plan = get_plan(phone) if phone else SubscriptionPlan.FREE
+    except Exception as e:
+        logger.warning(f"No se pudo determinar el carril de {name}: {str(e)}")
+        plan = SubscriptionPlan.FREE
+    return {'queue': queue_for_plan(plan)}
+
+
+def stamp_enqueued_at(headers: Dict[str, Any], eta: Optional[str] = None) -> None:
+    """
+    Marca en las cabeceras del mensaje el instante a partir del cual la tarea
+    debería ejecutarse (el envío o su ETA).
+    """
+    due = time.time()
+    if eta:
+        try:
+            due = max(due, datetime.fromisoformat(eta).timestamp())
+        except ValueError:
+            pass
+    headers['enqueued_at'] = due
+
+
+def record_queue_wait(queue: Optional[str], enqueued_at: Optional[float]) -> None:
+    """
+    Registra el tiempo que una tarea de carril esperó en cola.
+
+    Args:
+        queue: Cola de la que se consumió la tarea
+        enqueued_at: Instante (epoch) marcado al publicarla
+    """
+    plan = plan_for_queue(queue)
+    if plan and enqueued_at:
+        record_latency(f"queue_wait:{plan}", max(time.time() - enqueued_at, 0))
+
+
+def get_plan_capacity(plan: str) -> int:
+    """Llamadas simultáneas a OpenAI permitidas para un plan según su peso."""
+    weights = settings.PLAN_LANE_WEIGHTS
+    total = sum(weights.values()) or 1
+    return max(1, round(settings.ASSISTANT_OPENAI_CONCURRENCY * weights.get(plan, 1) / total))
+
+
+def _in_flight(plan: str) -> int:
+    """
+    Runs en curso de un plan.
+
+    Las plazas son un conjunto ordenado de Redis (token de la plaza -> inicio del run);
+    las más antiguas que PLAN_SLOT_MAX_AGE se descartan, de modo que un run que
+    terminó sin liberar su plaza no bloquea el carril indefinidamente.
+    """
+    key = SLOTS_KEY.format(plan=plan)
+    redis_store.zset_remove_below(key, time.time() - settings.PLAN_SLOT_MAX_AGE)
+    return redis_store.zset_count(key)
+
+
+def acquire_slot(plan: str) -> Optional[str]:
+    """
+    Reserva una plaza de OpenAI del carril para un run.
+
+    La reserva no usa locks: la plaza se añade y, si con ella se supera la
+    capacidad, se retira (ante carreras puede aplazar de más, nunca admitir de más).
+
+    Args:
+        plan: Plan del usuario
+
+    Returns:
+        Token de la plaza (se pasa a release_slot al terminar el run); None si el
+        carril está lleno y el run debe aplazarse
+    """
+    key = SLOTS_KEY.format(plan=plan)
+    slot = f"{plan}:{uuid.uuid4().hex}"
+    try:
+        _in_flight(plan)  # descarta las plazas caducadas
+        redis_store.zset_add(key, slot, time.time())
+        if redis_store.zset_count(key) > get_plan_capacity(plan):
+            redis_store.zset_remove(key, slot)
+            increment(f"plan_lanes:deferred:{plan}")
+            return None
+    except Exception as e:
+        logger.warning(f"Error al reservar plaza en el carril {plan}: {str(e)}")
+    return slot
+
+
+def require_slot(whatsapp_user: WhatsAppUser) -> str:
+    """
+    Reserva una plaza en el carril del usuario para un run que no puede aplazarse por sí solo.
+
+    Raises:
+        LaneFull: Si el carril está lleno (quien inició el trabajo debe reintentarlo)
+    """
+    slot = acquire_slot(effective_plan(whatsapp_user))
+    if slot is None:
+        raise LaneFull(f"Carril sin plazas libres para {whatsapp_user.phone_number}")
+    return slot
+
+
+def release_slot(slot: Optional[str]) -> None:
+    """Libera la plaza de OpenAI ocupada por un run (None si el run no tenía plaza)."""
+    if not slot:
+        return
+    plan = slot.split(':', 1)[0]
+    try:
+        redis_store.zset_remove(SLOTS_KEY.format(plan=plan), slot)
+    except Exception as e:
+        logger.warning(f"Error al liberar la plaza {slot}: {str(e)}")
+
+
+def get_lane_status() -> Dict[str, Dict[str, Any]]:
+    """
+    Estado de los carriles por plan.
+
+    Returns:
+        Diccionario plan -> {queue, capacity, in_flight, deferred, queue_wait}
+    """
+    status = {}
+    for plan in SubscriptionPlan.values:
+        status[plan] = {
+            'queue': queue_for_plan(plan),
+            'capacity': get_plan_capacity(plan),
+            'in_flight': _in_flight(plan),
+            'deferred': get_counter(f"plan_lanes:deferred:{plan}"),
+            'queue_wait': get_latency_summary(f"queue_wait:{plan}"),
+        }
+    return status
@@ -0,0 +1,213 @@
+"""
+Seguimiento centralizado de runs del asistente.
+
+En lugar de una cadena de tareas ``process_assistant_run`` por run (una tarea en
+el broker por cada sondeo), los runs pendientes se registran en la caché
+compartida y un único proceso (``track_assistant_runs``) los sondea de forma
+concurrente con asyncio. El intervalo de sondeo de cada run crece con el número
+de consultas (rápido al principio, luego más espaciado). Al terminar, requerir
+herramientas o fallar, el run se despacha como evento a ``handle_tracked_run_event``.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Any, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from deep90_app.utils import redis_store
+
+from .metrics import increment
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = "run_tracker:pending"
+RUN_KEY = "run_tracker:run:{run_id}"
+ACTIVE_KEY = "run_tracker:active"
+
+# Segundos de espera entre sondeos de un run según cuántas veces se ha consultado
+POLL_BACKOFF = [0.5, 0.5, 1.0, 1.0, 1.5, 2.0, 3.0, 5.0]
+
+# Estados que generan un evento
+EVENT_STATUSES = {
+    'completed': 'completed',
+    'requires_action': 'requires_action',
+    'failed': 'failed',
+    'cancelled': 'failed',
+    'expired': 'failed',
+    'incomplete': 'failed',
+}
+
+
+def next_poll_delay(polls: int) -> float:
+    """Segundos hasta el siguiente sondeo de un run consultado ``polls`` veces."""
+    return POLL_BACKOFF[min(polls, len(POLL_BACKOFF) - 1)]
+
+
+def _update_index(add: Optional[List[str]] = None, remove: Optional[List[str]] = None) -> None:
+    """
+    Añade o quita runs del índice de pendientes (un conjunto de Redis, sin locks).
+
+    Args:
+        add: IDs de run a añadir
+        remove: IDs de run a quitar
+    """
+    if remove:
+        redis_store.set_remove(PENDING_KEY, *remove)
+    if add:
+        redis_store.set_add(PENDING_KEY, *add)
+
+
+def track_run(user_phone, conversation_id, thread_id, run_id, requested_at=None, slot=None) -> None:
+    """
+    Registra un run para que lo sondee el tracker y se asegura de que el tracker esté activo.
+
+    Args:
+        user_phone: Teléfono del usuario
+        conversation_id: ID de la conversación
+        thread_id: ID del hilo
+        run_id: ID del run
+        requested_at: Instante (epoch) en que se lanzó la ejecución
+        slot: Plaza del carril que ocupa el run (ver plan_lanes.py)
+    """
+    now = time.time()
+    entry = {
+        'user_phone': user_phone,
+        'conversation_id': conversation_id,
+        'thread_id': thread_id,
+        'run_id': run_id,
+        'requested_at': requested_at or now,
+        'slot': slot,
+        'tracked_at': now,
+        'polls': 0,
+        'next_poll_at': now + next_poll_delay(0),
+    }
+    cache.set(RUN_KEY.format(run_id=run_id), entry, settings.RUN_TRACKER_MAX_AGE + 60)
+    _update_index(add=[run_id])
+    increment('run_tracker:tracked')
+    ensure_tracker_running()
+
+
+def ensure_tracker_running() -> None:
+    """Lanza track_assistant_runs si no hay ningún tracker activo."""
+    if cache.add(ACTIVE_KEY, 1, settings.RUN_TRACKER_LIFETIME + 30):
+        from .tasks import track_assistant_runs
+        track_assistant_runs.delay(kicked=True)
+
+
+def get_pending_entries() -> List[Dict[str, Any]]:
+    """Obtiene los runs pendientes, limpiando del índice los que ya expiraron."""
+    run_ids = redis_store.set_members(PENDING_KEY)
+    entries = cache.get_many([RUN_KEY.format(run_id=run_id) for run_id in run_ids])
+    missing = [run_id for run_id in run_ids if RUN_KEY.format(run_id=run_id) not in entries]
+    if missing:
+        _update_index(remove=missing)
+    return list(entries.values())
+
+
+def _dispatch(event: str, entry: Dict[str, Any]) -> None:
+    """Encola el manejo de un evento de run."""
+    from .tasks import handle_tracked_run_event
+    increment(f'run_tracker:events:{event}')
+    handle_tracked_run_event.delay(event, entry)
+
+
+async def poll_tracked_runs_once(client, now: Optional[float] = None) -> Dict[str, int]:
+    """
+    Sondea concurrentemente los runs pendientes cuyo siguiente sondeo ya venció.
+
+    Args:
+        client: Cliente AsyncOpenAI
+        now: Instante de referencia (epoch)
+
+    Returns:
+        Diccionario con el número de runs sondeados y de eventos despachados
+    """
+    now = now or time.time()
+    due = [entry for entry in get_pending_entries() if entry['next_poll_at'] <= now]
+    if not due:
+        return {'polled': 0, 'events': 0}
+
+    semaphore = asyncio.Semaphore(settings.RUN_TRACKER_CONCURRENCY)
+
+    async def retrieve(entry):
+        async with semaphore:
+            try:
+                return await client.beta.threads.runs.retrieve(thread_id=entry['thread_id'], run_id=entry['run_id'])
+            except Exception as e:
+                logger.warning(f"Error al sondear el run {entry['run_id']}: {e}")
+                return None
+
+    runs = await asyncio.gather(*(retrieve(entry) for entry in due))
+    increment('run_tracker:polls', len(due))
+
+    finished = []
+    updated = {}
+    for entry, run in zip(due, runs):
+        entry['polls'] += 1
+        status = run.status if run is not None else None
+        event = EVENT_STATUSES.get(status)
+        if event is None and now - entry['tracked_at'] > settings.RUN_TRACKER_MAX_AGE:
+            event = 'failed'
+            logger.error(f"Run {entry['run_id']} sin terminar tras {settings.RUN_TRACKER_MAX_AGE}s")
+
+        if event:
+            if event == 'completed' and getattr(run, 'usage', None):
+                entry['total_tokens'] = run.usage.total_tokens
+            finished.append(entry['run_id'])
+            _dispatch(event, entry)
+        else:
+            entry['next_poll_at'] = now + next_poll_delay(entry['polls'])
+            updated[RUN_KEY.format(run_id=entry['run_id'])] = entry
+
+    if updated:
+        cache.set_many(updated, settings.RUN_TRACKER_MAX_AGE + 60)
+    if finished:
+        cache.delete_many([RUN_KEY.format(run_id=run_id) for run_id in finished])
+        _update_index(remove=finished)
+
+    return {'polled': len(due), 'events': len(finished)}
+
+
+async def run_tracker_loop(client, lifetime: int) -> Dict[str, int]:
+    """
+    Sondea runs pendientes hasta que no quede ninguno o venza ``lifetime``.
+
+    Args:
+        client: Cliente AsyncOpenAI
+        lifetime: Segundos máximos de ejecución
+
+    Returns:
+        Totales de la ejecución (passes, polled, events)
+    """
+    deadline = time.time() + lifetime
+    totals = {'passes': 0, 'polled': 0, 'events': 0}
+    while time.time() < deadline:
+        if not redis_store.set_members(PENDING_KEY):
+            break
+        result = await poll_tracked_runs_once(client)
+        totals['passes'] += 1
+        totals['polled'] += result['polled']
+        totals['events'] += result['events']
+        await asyncio.sleep(settings.RUN_TRACKER_TICK)
+    return totals
+
+
+def get_tracker_status() -> Dict[str, Any]:
+    """
+    Estado del tracker y contadores de carga.
+
+    Returns:
+        Diccionario con runs pendientes, si hay tracker activo y contadores
+    """
+    from .metrics import get_counter
+    return {
+        'pending': len(redis_store.set_members(PENDING_KEY)),
+        'active': bool(cache.get(ACTIVE_KEY)),
+        'tracked': get_counter('run_tracker:tracked'),
+        'tracker_tasks': get_counter('run_tracker:tasks'),
+        'polls': get_counter('run_tracker:polls'),
+        'events': {event: get_counter(f'run_tracker:events:{event}') for event in ('completed', 'requires_action', 'failed')},
+        'poll_mode_tasks': get_counter('broker_tasks:process_assistant_run'),
+    }
@@ -5,6 +5,7 @@ from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
 from django.conf import settings
 from openai import OpenAI
+from . import user_cache
 from .models import WhatsAppUser, Conversation, Message, SubscriptionPlan, WhatsAppUserStatus, AssistantConfig
 from .assistant_manager import AssistantManager
 
@@ -50,8 +51,8 @@ class WhatsAppService:
             The created Message object or None if creation failed
         """
         try:
-            # Get the user
-            whatsapp_user = WhatsAppUser.objects.get(phone_number=phone_number)
+            # Get the user (from the profile cache)
+            whatsapp_user = user_cache.get_user(phone_number)
             
             # Get or create a conversation for system messages if needed
             conversation, created = Conversation.objects.get_or_create(
@@ -652,7 +653,7 @@ class WhatsAppService:
             
             # Log the interaction
             try:
-                user = WhatsAppUser.objects.get(phone_number=to)
+                user = user_cache.get_user(to)
                 self.log_message(
                     to,
                     "Enviado flujo de actualización de datos",
@@ -1,8 +1,10 @@
-from django.db.models.signals import post_save, pre_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
 
-from .models import WhatsAppUser, Conversation, Message, UserInput
+from . import user_cache
+from .models import WhatsAppUser, Conversation, Message, UserInput, AssistantConfig
 
 
 @receiver(post_save, sender=Message)
@@ -17,9 +19,29 @@ def update_conversation_last_message_time(sender, instance, **kwargs):
 def update_user_last_activity(sender, instance, **kwargs):
     """Actualiza la marca de tiempo de la última actividad del usuario cuando envía un mensaje."""
     if instance.is_from_user:
-        user = instance.conversation.user
-        user.last_activity = instance.created_at
-        user.save(update_fields=['last_activity'])
+        # update() evita leer el usuario de la base de datos en cada mensaje
+        WhatsAppUser.objects.filter(phone_number=instance.conversation.user_id).update(
+            last_activity=instance.created_at
+        )
+
+
+@receiver(post_save, sender=WhatsAppUser)
+@receiver(post_delete, sender=WhatsAppUser)
+def invalidate_cached_user(sender, instance, update_fields=None, **kwargs):
+    """Descarta el perfil cacheado del usuario cuando cambia (salvo la marca de última actividad)."""
+    if update_fields and set(update_fields) <= {'last_activity'}:
+        return
+    # Tras el commit: antes, un worker que no encuentre la entrada volvería a cachear la fila antigua
+    phone_number = instance.phone_number
+    transaction.on_commit(lambda: user_cache.invalidate(phone_number))
+
+
+@receiver(post_save, sender=AssistantConfig)
+@receiver(post_delete, sender=AssistantConfig)
+def invalidate_cached_assistant_config(sender, instance, **kwargs):
+    """Descarta la configuración del asistente cacheada del usuario cuando cambia (tras el commit)."""
+    phone_number = instance.user_id
+    transaction.on_commit(lambda: user_cache.invalidate(phone_number))
 
 
 @receiver(post_save, sender=UserInput)
@@ -1,22 +1,195 @@
+import asyncio
 import logging
 import time
 import json
 from datetime import datetime, timedelta
 from celery import shared_task
+from celery.signals import before_task_publish, task_prerun
 from django.db import transaction
 from django.conf import settings
-from django.utils import timezone
+from django.core.cache import cache
 from .services import WhatsAppService
 from .assistant_manager import AssistantManager
-from .models import WhatsAppUser, Conversation, Message, WhatsAppUserStatus, SubscriptionPlan, ConversationType, AssistantConfig
+from .models import Conversation, Message, WhatsAppUserStatus, SubscriptionPlan, ConversationType, AssistantConfig
 from .sports_service import FootballDataService
+from . import answer_cache, context_manager, daily_limits, dedup, inbound_queue, plan_lanes, user_cache
+from .metrics import StageTimer, increment, record_latency
+from .outbound import OUTBOUND_METHODS, send_paced
+from .openai_client import create_async_openai_client
+from .run_tracker import ACTIVE_KEY, ensure_tracker_running, get_pending_entries, run_tracker_loop, track_run
 
 logger = logging.getLogger(__name__)
 
 
-@shared_task
-def process_whatsapp_message(contact_data, message_data):
-    """Process incoming WhatsApp messages."""
+@before_task_publish.connect
+def stamp_lane_task(sender=None, headers=None, **kwargs):
+    """Marca el instante de encolado de las tareas de carril para medir su espera en cola."""
+    if sender in plan_lanes.LANE_TASKS and headers is not None:
+        plan_lanes.stamp_enqueued_at(headers, headers.get('eta'))
+
+
+@task_prerun.connect
+def record_lane_wait(sender=None, task=None, **kwargs):
+    """Registra la espera en cola por plan al empezar una tarea de carril."""
+    if task is not None and task.name in plan_lanes.LANE_TASKS:
+        delivery_info = task.request.delivery_info or {}
+        plan_lanes.record_queue_wait(delivery_info.get('routing_key'), task.request.get('enqueued_at'))
+
+
+def extract_message_ids(webhook_data):
+    """IDs de los mensajes entrantes de un payload de webhook."""
+    return [
+        message['id']
+        for entry in webhook_data.get('entry') or []
+        for change in entry.get('changes') or []
+        if change.get('field') == 'messages'
+        for message in change.get('value', {}).get('messages', [])
+        if 'id' in message
+    ]
+
+
+@shared_task(ignore_result=True)
+def receive_whatsapp_webhook(body, message_ids=None):
+    """
+    Procesa el payload de un webhook de WhatsApp encolado por la vista sin tocarlo.
+
+    Los estados de entrega se registran en el log y cada mensaje se guarda, en
+    el orden del webhook, en los pendientes de su usuario (ver inbound_queue.py)
+    antes de lanzar process_whatsapp_message en el carril de su plan.
+
+    Args:
+        body: Cuerpo JSON del webhook tal como se recibió
+        message_ids: IDs de mensaje que la vista aceptó como nuevos (None = todos)
+    """
+    try:
+        webhook_data = json.loads(body)
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid webhook payload: {e}")
+        return
+
+    logger.debug(f"Webhook data: {webhook_data}")
+    for entry in webhook_data.get('entry') or []:
+        for change in entry.get('changes') or []:
+            # Verificar si es una notificación de WhatsApp
+            if change.get('field') != 'messages':
+                continue
+            value = change.get('value', {})
+
+            for status in value.get('statuses', []):
+                # Aquí podríamos actualizar el estado de los mensajes en la base de datos
+                logger.info(f"Message {status.get('id')} status: {status.get('status')}")
+
+            messages = value.get('messages', [])
+            # Encontrar el contacto correspondiente
+            contact = next((c for c in value.get('contacts', []) if c.get('wa_id')), None)
+            if messages and not contact:
+                logger.warning("Missing contacts in webhook data")
+                continue
+            for message in messages:
+                # Verificar que tenemos el ID del mensaje y que no es un reintento
+                if 'id' in message and (message_ids is None or message['id'] in message_ids):
+                    enqueue_inbound_message(contact, message)
+
+
+def enqueue_inbound_message(contact_data, message_data):
+    """
+    Guarda un mensaje entrante en los pendientes de su usuario y lanza su procesamiento.
+
+    Los reintentos que pasaron el filtro de la vista se descartan aquí (dedup.py).
+    Si no se puede guardar como pendiente, el mensaje viaja en la propia tarea.
+
+    Args:
+        contact_data: Datos del contacto del webhook
+        message_data: Datos del mensaje del webhook
+    """
+    wa_id = contact_data.get('wa_id')
+    message_id = message_data.get('id')
+    if message_id and not dedup.claim_in_db(message_id, wa_id):
+        logger.info(f"Mensaje duplicado {message_id} de {wa_id} descartado")
+        return
+    if inbound_queue.push(wa_id, contact_data, message_data):
+        process_whatsapp_message.delay(contact_data)
+    else:
+        process_whatsapp_message.delay(contact_data, message_data)
+
+
+def describe_incoming_message(message_data):
+    """
+    Texto con el que se registra un mensaje entrante según su tipo.
+
+    Args:
+        message_data: Datos del mensaje del webhook
+
+    Returns:
+        Contenido legible del mensaje
+    """
+    message_type = message_data.get('type', 'unknown')
+    if message_type == 'text':
+        return message_data.get('text', {}).get('body', '')
+    if message_type == 'interactive':
+        interactive_data = message_data.get('interactive', {})
+        interactive_type = interactive_data.get('type')
+        if interactive_type == 'button_reply':
+            button_id = interactive_data.get('button_reply', {}).get('id')
+            button_title = interactive_data.get('button_reply', {}).get('title', '')
+            return f"Button: {button_title} ({button_id})"
+        if interactive_type == 'list_reply':
+            list_id = interactive_data.get('list_reply', {}).get('id')
+            list_title = interactive_data.get('list_reply', {}).get('title', '')
+            return f"List: {list_title} ({list_id})"
+        return f"Interactive ({interactive_type})"
+    if message_type == 'location':
+        location_data = message_data.get('location', {})
+        return f"Location: {location_data.get('latitude')}, {location_data.get('longitude')}"
+    return f"Message of type {message_type}"
+
+
+@shared_task(ignore_result=True)
+def process_whatsapp_message(contact_data, message_data=None):
+    """
+    Process incoming WhatsApp messages.
+
+    Procesa los mensajes pendientes del usuario de uno en uno y en orden (ver
+    inbound_queue.py); los de usuarios distintos, en paralelo. ``message_data``
+    solo llega cuando el mensaje no pudo guardarse como pendiente, y entonces se
+    procesa directamente.
+
+    Si el carril del plan no tiene plazas para iniciar una conversación, el
+    mensaje sigue pendiente y la tarea se vuelve a programar
+    PLAN_LANE_RETRY_SECONDS más tarde.
+    """
+    wa_id = contact_data.get('wa_id')
+    try:
+        if message_data is not None:
+            handle_whatsapp_message(contact_data, message_data)
+            return 1
+        return inbound_queue.drain(wa_id, handle_whatsapp_message)
+    except plan_lanes.LaneFull:
+        process_whatsapp_message.apply_async(
+            args=[contact_data] if message_data is None else [contact_data, message_data],
+            countdown=settings.PLAN_LANE_RETRY_SECONDS
+        )
+        return 0
+
+
+@shared_task(ignore_result=True)
+def drain_stalled_users():
+    """Retoma los mensajes pendientes de usuarios que ningún worker atiende (p. ej. tras la caída de un worker)."""
+    try:
+        stalled = inbound_queue.get_stalled_users()
+        for wa_id in stalled:
+            process_whatsapp_message.delay({'wa_id': wa_id})
+        if stalled:
+            increment('inbound:recovered', len(stalled))
+            logger.warning(f"Retomados los mensajes pendientes de {len(stalled)} usuarios")
+        return {'success': True, 'recovered': len(stalled)}
+    except Exception as e:
+        logger.error(f"Error al retomar mensajes entrantes pendientes: {e}")
+        return {'success': False, 'error': str(e)}
+
+
+def handle_whatsapp_message(contact_data, message_data):
+    """Process a single incoming WhatsApp message."""
     try:
         wa_id = contact_data.get('wa_id')
         profile_name = contact_data.get('profile', {}).get('name', '')
@@ -24,8 +197,8 @@ def process_whatsapp_message(contact_data, message_data):
         message_id = message_data.get('id')
         
         # Get or create WhatsApp user
-        whatsapp_user, created = WhatsAppUser.objects.get_or_create(
-            phone_number=wa_id,
+        whatsapp_user, created = user_cache.get_or_create_user(
+            wa_id,
             defaults={
                 'profile_name': profile_name,
                 'status': WhatsAppUserStatus.NEW
@@ -36,6 +209,23 @@ def process_whatsapp_message(contact_data, message_data):
         whatsapp_service = WhatsAppService()
         assistant_manager = AssistantManager()
         
+        # Un mensaje aplazado por un carril lleno ya se registró y contó en su primer intento
+        if inbound_queue.is_first_attempt(message_id):
+            # Log the incoming message with complete JSON (we add the contact info for context)
+            whatsapp_service.log_message(
+                wa_id,
+                describe_incoming_message(message_data),
+                message_type or 'unknown',
+                True,  # is_from_user=True
+                message_id,
+                request_json={'message': message_data, 'contact': contact_data},
+                response_json=None  # No response for incoming messages
+            )
+            # Contador diario en Redis (incluye este mensaje)
+            daily_count = daily_limits.record_message(wa_id)
+        else:
+            daily_count = daily_limits.get_count(wa_id)
+        
         # If this is a new user, send welcome message
         if created:
             welcome_message = (
@@ -62,16 +252,11 @@ def process_whatsapp_message(contact_data, message_data):
             
         # Check if FREE user has exceeded daily message limit
         if whatsapp_user.subscription_plan == SubscriptionPlan.FREE:
-            today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            today_messages_count = Message.objects.filter(
-                conversation__user=whatsapp_user,
-                is_from_user=True,
-                created_at__gte=today_start
-            ).count()
+            today_messages_count = daily_count
             
             logger.info(f"########  ######    ######   User {wa_id} has sent {today_messages_count} messages today.")
 
-            if today_messages_count >= settings.DAILY_MESSAGES_LIMIT:
+            if daily_limits.has_reached_limit(today_messages_count):
                 # Get URL from settings
                 pricing_url = getattr(settings, 'URL_PLANS', "https://www.deep90.com/#pricing")
                 
@@ -133,6 +318,8 @@ def process_whatsapp_message(contact_data, message_data):
             
             whatsapp_service.display_main_menu(whatsapp_user.phone_number)
 
+    except plan_lanes.LaneFull:
+        raise
     except Exception as e:
         logger.error(f"Error processing WhatsApp message: {e}")
         raise
@@ -173,15 +360,9 @@ def process_text_message(whatsapp_user, message_id, text):
         # Here we know the user is in assistant mode, so we process the message
             
         # Check if user has exceeded daily message limit
-        today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        today_messages_count = Message.objects.filter(
-            conversation__user=whatsapp_user,
-            is_from_user=True,
-            created_at__gte=today_start
-        ).count()
-
         # Solo limitar a usuarios FREE
-        if whatsapp_user.subscription_plan == SubscriptionPlan.FREE and today_messages_count >= settings.DAILY_MESSAGES_LIMIT:
+        if (whatsapp_user.subscription_plan == SubscriptionPlan.FREE
+                and daily_limits.has_reached_limit(daily_limits.get_count(whatsapp_user.phone_number))):
             pricing_url = getattr(settings, 'URL_PLANS', "https://www.deep90.com/#pricing")
             logger.info(f"User {whatsapp_user.phone_number} has exceeded daily message limit")
             whatsapp_service.send_text_message(
@@ -218,8 +399,7 @@ def process_text_message(whatsapp_user, message_id, text):
             if preserved_conversation:
                 # Validate that the thread still exists in OpenAI
                 try:
-                    messages = assistant_manager.get_assistant_messages(preserved_conversation.thread_id)
-                    thread_exists = len(messages) > 0
+                    thread_exists = assistant_manager.is_thread_alive(preserved_conversation.thread_id)
                     if thread_exists:
                         # Reactivate the conversation
                         preserved_conversation.is_active = True
@@ -232,32 +412,106 @@ def process_text_message(whatsapp_user, message_id, text):
                     logger.error(f"Error validating thread: {e}")
                     preserved_conversation = None
             
-            # If still no valid conversation, create a new one
+            # If still no valid conversation, start a new one: thread, messages and run
+            # are created together with a single call below
             if not preserved_conversation:
-                # Create a new thread
-                thread_id = assistant_manager.create_thread()
-                
-                # Create conversation record as GENERAL type
-                conversation = Conversation.objects.create(
-                    user=whatsapp_user,
-                    thread_id=thread_id,
-                    is_active=True,
-                    preserve_context=True,
-                    conversation_type=ConversationType.GENERAL
+                conversation = None
+        
+        user_info = {
+            'name': whatsapp_user.full_name or whatsapp_user.profile_name or 'Usuario',
+        }
+        
+        # Preguntas repetidas sobre el mismo partido y los mismos datos se responden desde caché
+        answer_key = None
+        if conversation is not None:
+            answer_key = answer_cache.build_key(conversation.conversation_type, conversation.fixture_id, text)
+        
+        # Agregar fecha, hora e instrucción de actualización de datos
+        now_str = datetime.now().strftime('%d/%m/%Y %H:%M')
+        fixture_id = conversation.fixture_id if conversation else None
+        # La respuesta a una pregunta cacheable se sirve a otros usuarios: su prompt no lleva el nombre
+        name_line = "" if answer_key else (
+            f". Nombre: {user_info['name']}. (No es necesario que siempre me llames por mi nombre, pero te lo digo para que lo sepas, en ocasiones peudes hacerlo para sentir mas cercano)\n"
+        )
+        prompt = (
+            f"{text}\n"
+            f"{name_line}"
+            f". Fecha de consulta: {now_str}. "
+            f"Por favor, antes de responder, ejecuta siempre la función consultar_partido_en_vivo({fixture_id}) para obtener los datos más recientes del partido y sus cuotas\n"
+        )
+        
+        if conversation is None:
+            timer = StageTimer('process_text_message:new_conversation')
+            requested_at = time.time()
+            # Sin plaza en el carril el mensaje queda pendiente y se reintenta (LaneFull)
+            slot = plan_lanes.require_slot(whatsapp_user)
+            try:
+                assistant_id = assistant_manager.get_assistant_for_user(whatsapp_user, ConversationType.GENERAL)
+                initial_context = (
+                    f"Nuevo usuario. Su nombre es {user_info['name']}. "
+                    "Preséntate como un asistente experto en fútbol de Deep90."
                 )
+                thread_id, run_id = assistant_manager.create_thread_and_run(assistant_id, [initial_context, prompt], user_info)
+                timer.mark('threads.create_and_run')
                 
-                # Add initial system context message
-                user_info = {
-                    'name': whatsapp_user.full_name or whatsapp_user.profile_name or 'Usuario',
-                }
+                whatsapp_service.send_typing_indicator(message_id)
+                timer.mark('typing_indicator')
                 
-                assistant_manager.add_message_to_thread(
-                    thread_id,
-                    f"Nuevo usuario. Su nombre es {user_info['name']}. " +
-                    "Preséntate como un asistente experto en fútbol de Deep90.",
-                    user_info
-                )
+                # Los registros se guardan después de lanzar el run
+                with transaction.atomic():
+                    conversation = Conversation.objects.create(
+                        user=whatsapp_user,
+                        thread_id=thread_id,
+                        is_active=True,
+                        preserve_context=True,
+                        conversation_type=ConversationType.GENERAL
+                    )
+                    Message.objects.create(
+                        conversation=conversation,
+                        message_id=message_id,
+                        is_from_user=True,
+                        content=text,
+                        message_type='text'
+                    )
+                    conversation.update_last_message_time()
+                timer.mark('db_write')
+            except Exception:
+                plan_lanes.release_slot(slot)
+                raise
+            
+            watch_assistant_run(whatsapp_user.phone_number, conversation.id, thread_id, run_id, requested_at, slot)
+            timer.mark('watch')
+            timer.log()
+            return
+            
+        cached_answer = answer_cache.lookup(answer_key)
+        if cached_answer:
+            Message.objects.create(
+                conversation=conversation,
+                message_id=message_id,
+                is_from_user=True,
+                content=text,
+                message_type='text'
+            )
+            conversation.update_last_message_time()
+            deliver_assistant_reply(whatsapp_user, conversation, cached_answer, conversation.thread_id, 'cache', time.time())
             
+            # Mantener el contexto del hilo (no es posible si hay un run en curso)
+            if context_manager.is_managed(conversation):
+                return
+            try:
+                assistant_manager.add_message_to_thread(conversation.thread_id, prompt, user_info)
+                assistant_manager.add_message_to_thread(conversation.thread_id, cached_answer, role="assistant")
+            except Exception as e:
+                logger.warning(f"No se pudo añadir la respuesta en caché al thread {conversation.thread_id}: {e}")
+            return
+        answer_cache.remember_pending(
+            conversation.id, answer_key, [whatsapp_user.full_name, whatsapp_user.profile_name]
+        )
+        
+        timer = StageTimer('process_text_message:existing_conversation')
+        # Los registros se confirman antes de las llamadas a OpenAI y Meta, que no
+        # deben mantener abierta la transacción ni revertir el mensaje si fallan
         with transaction.atomic():
             # Save user message to database
             Message.objects.create(
@@ -270,55 +524,45 @@ def process_text_message(whatsapp_user, message_id, text):
             
             # Update conversation last message time
             conversation.update_last_message_time()
-            
-            # Add message to OpenAI thread
-            user_info = {
-                'name': whatsapp_user.full_name or whatsapp_user.profile_name or 'Usuario',
-            }
-            
-            # Add the user's prompt to the thread
-            # Agregar fecha, hora e instrucción de actualización de datos
-            now_str = datetime.now().strftime('%d/%m/%Y %H:%M')
-            text = (
-                f"{text}\n"
-                f". Nombre: {user_info['name']}. (No es necesario que siempre me llames por mi nombre, pero te lo digo para que lo sepas, en ocasiones peudes hacerlo para sentir mas cercano)\n"                
-                f". Fecha de consulta: {now_str}. "
-                f"Por favor, antes de responder, ejecuta siempre la función consultar_partido_en_vivo({conversation.fixture_id}) para obtener los datos más recientes del partido y sus cuotas\n"
-            )
-            assistant_manager.add_message_to_thread(conversation.thread_id, text, user_info)
-            
-            # Determine which assistant to use based on conversation type
-            if conversation.conversation_type == ConversationType.PREDICTIONS:
-                assistant_id = settings.ASSISTANT_ID_PREDICTIONS
-            elif conversation.conversation_type == ConversationType.LIVE_ODDS:
-                assistant_id = settings.ASSISTANT_ID_LIVE_ODDS
-            elif conversation.conversation_type == ConversationType.BETTING:
-                assistant_id = settings.ASSISTANT_ID_BETTING
-            else:
-                # Default to general assistant
-                assistant_id = assistant_manager.get_assistant_for_user(whatsapp_user, conversation.conversation_type)
-            
-            # Run the assistant
-            run_id = assistant_manager.run_assistant(conversation.thread_id, assistant_id)
-            
-            # Send typing indicator message usando el message_id recibido
-            whatsapp_service.send_typing_indicator(message_id)
+            timer.mark('db_write')
+        
+        # Un run en curso impide añadir mensajes: se cancela y se relanza con todo el contexto
+        assistant_manager.cancel_active_run(conversation.thread_id)
+        timer.mark('cancel_active_run')
+        
+        # Add the user's prompt to the thread (con contexto gestionado el historial está en Message)
+        if not context_manager.is_managed(conversation):
+            assistant_manager.add_message_to_thread(conversation.thread_id, prompt, user_info)
+            timer.mark('messages.create')
+        
+        # Determine which assistant to use based on conversation type
+        if conversation.conversation_type == ConversationType.PREDICTIONS:
+            assistant_id = settings.ASSISTANT_ID_PREDICTIONS
+        elif conversation.conversation_type == ConversationType.LIVE_ODDS:
+            assistant_id = settings.ASSISTANT_ID_LIVE_ODDS
+        elif conversation.conversation_type == ConversationType.BETTING:
+            assistant_id = settings.ASSISTANT_ID_BETTING
+        else:
+            # Default to general assistant
+            assistant_id = assistant_manager.get_assistant_for_user(whatsapp_user, conversation.conversation_type)
+        
+        # Send typing indicator message usando el message_id recibido
+        whatsapp_service.send_typing_indicator(message_id)
 
-            #time.sleep(1)  # Opcional: simula el tiempo de escritura
-            
-            # whatsapp_service.send_text_message(
-            #    whatsapp_user.phone_number,
-            #    "⏳ Procesando 2..."
-            #)
-            
-            # Queue task to check run completion
-            process_assistant_run.delay(
-                whatsapp_user.phone_number,
-                conversation.id,
-                conversation.thread_id,
-                run_id
-            )
+        #time.sleep(1)  # Opcional: simula el tiempo de escritura
+        
+        # whatsapp_service.send_text_message(
+        #    whatsapp_user.phone_number,
+        #    "⏳ Procesando 2..."
+        #)
+        
+        # Run the assistant once the burst of messages ends (ASSISTANT_DEBOUNCE_SECONDS)
+        schedule_assistant_run(whatsapp_user, conversation, assistant_id, assistant_manager)
+        timer.mark('run_schedule')
+        timer.log()
     
+    except plan_lanes.LaneFull:
+        raise
     except Exception as e:
         logger.error(f"Error processing text message: {e}")
         whatsapp_service.send_text_message(
@@ -345,8 +589,7 @@ def process_flow_reply(whatsapp_user, message_id, nfm_data):
                 whatsapp_user.phone_number,
                 "Lo siento, no he podido procesar tu respuesta del flujo. Por favor intenta nuevamente."
             )
-            time.sleep(1)
-            whatsapp_service.display_main_menu(whatsapp_user.phone_number)
+            send_paced(whatsapp_user.phone_number, 'display_main_menu')
             return
         
         # Parse the response_json
@@ -358,8 +601,7 @@ def process_flow_reply(whatsapp_user, message_id, nfm_data):
                 whatsapp_user.phone_number,
                 "Lo siento, hubo un problema al procesar la información. Por favor intenta nuevamente."
             )
-            time.sleep(1)
-            whatsapp_service.display_main_menu(whatsapp_user.phone_number)
+            send_paced(whatsapp_user.phone_number, 'display_main_menu')
             return
         
         # Check if it's from our live results flow
@@ -376,8 +618,7 @@ def process_flow_reply(whatsapp_user, message_id, nfm_data):
                     whatsapp_user.phone_number,
                     "¡Gracias por consultar los resultados en vivo! ⚽\n\nRecuerda que puedes acceder a esta información en cualquier momento desde el menú principal."
                 )
-                time.sleep(1)
-                whatsapp_service.display_main_menu(whatsapp_user.phone_number)
+                send_paced(whatsapp_user.phone_number, 'display_main_menu')
             
             elif selected_action in ['action_predictions', 'action_live_odds', 'action_betting']:
                 # Map the action to the corresponding assistant ID
@@ -414,8 +655,7 @@ def process_flow_reply(whatsapp_user, message_id, nfm_data):
                     whatsapp_user.phone_number,
                     "No he podido procesar tu selección. Por favor intenta nuevamente desde el menú principal."
                 )
-                time.sleep(1)
-                whatsapp_service.display_main_menu(whatsapp_user.phone_number)
+                send_paced(whatsapp_user.phone_number, 'display_main_menu')
         
         elif flow_id == settings.WHATSAPP_FLOW_CONFIG_ANALYTICS:
             # Procesar la respuesta del flujo de configuración del asistente
@@ -474,8 +714,7 @@ def process_flow_reply(whatsapp_user, message_id, nfm_data):
                 )
                 
                 # Mostrar el menú principal después de unos segundos
-                time.sleep(1)
-                whatsapp_service.display_main_menu(whatsapp_user.phone_number)
+                send_paced(whatsapp_user.phone_number, 'display_main_menu')
             
             except Exception as e:
                 logger.error(f"Error updating assistant configuration: {e}")
@@ -483,8 +722,7 @@ def process_flow_reply(whatsapp_user, message_id, nfm_data):
                     whatsapp_user.phone_number,
                     "Lo siento, ha ocurrido un error al guardar tu configuración. Por favor intenta nuevamente."
                 )
-                time.sleep(1)
-                whatsapp_service.display_main_menu(whatsapp_user.phone_number)  
+                send_paced(whatsapp_user.phone_number, 'display_main_menu')  
 
         elif flow_id == settings.WHATSAPP_FLOW_UPDATE_DATA:
             # Procesar la respuesta del flujo de actualización de datos
@@ -561,8 +799,7 @@ def process_flow_reply(whatsapp_user, message_id, nfm_data):
                 )
                 
                 # Mostrar el menú principal después de unos segundos
-                time.sleep(1)
-                whatsapp_service.display_main_menu(whatsapp_user.phone_number)
+                send_paced(whatsapp_user.phone_number, 'display_main_menu')
                 
             except Exception as e:
                 logger.error(f"Error processing update data flow: {str(e)}")
@@ -570,8 +807,7 @@ def process_flow_reply(whatsapp_user, message_id, nfm_data):
                     whatsapp_user.phone_number,
                     "Lo siento, ha ocurrido un error al actualizar tus datos. Por favor intenta nuevamente más tarde."
                 )
-                time.sleep(1)
-                whatsapp_service.display_main_menu(whatsapp_user.phone_number)
+                send_paced(whatsapp_user.phone_number, 'display_main_menu')
         else:
             # Not from our recognized flows, display main menu
             logger.warning(f"Unknown flow ID: {flow_id}")
@@ -579,17 +815,17 @@ def process_flow_reply(whatsapp_user, message_id, nfm_data):
                 whatsapp_user.phone_number,
                 "No he podido identificar el flujo de interacción. Por favor selecciona una opción desde el menú principal."
             )
-            time.sleep(1)
-            whatsapp_service.display_main_menu(whatsapp_user.phone_number)
+            send_paced(whatsapp_user.phone_number, 'display_main_menu')
     
+    except plan_lanes.LaneFull:
+        raise
     except Exception as e:
         logger.error(f"Error processing flow reply: {e}")
         whatsapp_service.send_text_message(
             whatsapp_user.phone_number,
             "Lo siento, ha ocurrido un error al procesar tu selección. Por favor intenta nuevamente."
         )
-        time.sleep(1)
-        whatsapp_service.display_main_menu(whatsapp_user.phone_number)
+        send_paced(whatsapp_user.phone_number, 'display_main_menu')
 
 
 def start_specialized_assistant_conversation(whatsapp_user, assistant_id, prompt_message, fixture_id=None):
@@ -604,8 +840,12 @@ def start_specialized_assistant_conversation(whatsapp_user, assistant_id, prompt
     """
     whatsapp_service = WhatsAppService()
     assistant_manager = AssistantManager()
+    slot = None
     
     try:
+        # Sin plaza en el carril el mensaje queda pendiente y se reintenta (LaneFull)
+        slot = plan_lanes.require_slot(whatsapp_user)
+        
         # First deactivate any existing conversation
         Conversation.objects.filter(user=whatsapp_user, is_active=True).update(is_active=False)
         
@@ -633,8 +873,7 @@ def start_specialized_assistant_conversation(whatsapp_user, assistant_id, prompt
         thread_exists = False
         if existing_conversation:
             try:
-                messages = assistant_manager.get_assistant_messages(existing_conversation.thread_id)
-                thread_exists = len(messages) > 0
+                thread_exists = assistant_manager.is_thread_alive(existing_conversation.thread_id)
                 logger.info(f"Thread {existing_conversation.thread_id} existe: {thread_exists}")
             except Exception as e:
                 logger.error(f"Error verificando thread: {e}")
@@ -661,18 +900,8 @@ def start_specialized_assistant_conversation(whatsapp_user, assistant_id, prompt
                 user_info
             )
         else:
-            # Create a new thread
-            thread_id = assistant_manager.create_thread()
-            
-            # Create a new conversation record with appropriate type
-            conversation = Conversation.objects.create(
-                user=whatsapp_user,
-                thread_id=thread_id,
-                is_active=True,
-                preserve_context=True,
-                conversation_type=conversation_type,
-                fixture_id=fixture_id
-            )
+            # New conversation: thread, messages and run are created together below
+            conversation = None
         
         # Send a friendly, concise welcome message
         welcome_msg = "*Asistente especializado activado!* 🤖\n\n"
@@ -699,8 +928,20 @@ def start_specialized_assistant_conversation(whatsapp_user, assistant_id, prompt
             'fixture_id': fixture_id  # Include fixture ID in user info
         }
         
-        # Add an initial system message with context if it's a new conversation
-        if not thread_exists:
+        # Agregar fecha, hora e instrucción de actualización de datos
+        now_str = datetime.now().strftime('%d/%m/%Y %H:%M')
+        prompt = (
+            f"{prompt_message}\n"
+            f". Nombre: {user_info['name']}. (No es necesario que siempre me llames por mi nombre, pero te lo digo para que lo sepas, en ocasiones peudes hacerlo para sentir mas cercano)\n"
+            f"|Fecha de consulta: {now_str}. "
+            f"|Por favor, antes de responder, ejecuta siempre la función consultar_partido_en_vivo({fixture_id}) para obtener los datos más recientes del partido y sus cuotas."
+        )
+        
+        if conversation is None:
+            timer = StageTimer('specialized_conversation:new')
+            requested_at = time.time()
+            
+            # Initial system message with context for the new conversation
             system_message = f"El usuario ha seleccionado analizar el partido con ID {fixture_id}. "
             
             if conversation_type == ConversationType.PREDICTIONS:
@@ -710,12 +951,43 @@ def start_specialized_assistant_conversation(whatsapp_user, assistant_id, prompt
             elif conversation_type == ConversationType.BETTING:
                 system_message += "Ofrécele recomendaciones de apuestas para este partido basadas en datos y tendencias."
             
-            assistant_manager.add_message_to_thread(
-                thread_id,
-                system_message,
-                user_info
+            thread_id, run_id = assistant_manager.create_thread_and_run(assistant_id, [system_message, prompt], user_info)
+            timer.mark('threads.create_and_run')
+            
+            # Send typing indicator
+            whatsapp_service.send_text_message(
+                whatsapp_user.phone_number,
+                "⏳ Personalizando tu experiencia..."
             )
+            timer.mark('typing_indicator')
+            
+            # Los registros se guardan después de lanzar el run
+            with transaction.atomic():
+                conversation = Conversation.objects.create(
+                    user=whatsapp_user,
+                    thread_id=thread_id,
+                    is_active=True,
+                    preserve_context=True,
+                    conversation_type=conversation_type,
+                    fixture_id=fixture_id
+                )
+                Message.objects.create(
+                    conversation=conversation,
+                    message_id=None,
+                    is_from_user=True,
+                    content=prompt_message,
+                    message_type='text'
+                )
+                conversation.update_last_message_time()
+            timer.mark('db_write')
+            
+            watch_assistant_run(whatsapp_user.phone_number, conversation.id, thread_id, run_id, requested_at, slot)
+            timer.mark('watch')
+            timer.log()
+            return
         
+        timer = StageTimer('specialized_conversation:existing')
+        # Los registros se confirman antes de las llamadas a OpenAI y Meta
         with transaction.atomic():
             # Save user message to database
             Message.objects.create(
@@ -728,46 +1000,36 @@ def start_specialized_assistant_conversation(whatsapp_user, assistant_id, prompt
             
             # Update conversation last message time
             conversation.update_last_message_time()
-            
-            # Add the user's prompt to the thread
-            # Agregar fecha, hora e instrucción de actualización de datos
-            now_str = datetime.now().strftime('%d/%m/%Y %H:%M')
-            prompt_message = (
-                f"{prompt_message}\n"
-                f". Nombre: {user_info['name']}. (No es necesario que siempre me llames por mi nombre, pero te lo digo para que lo sepas, en ocasiones peudes hacerlo para sentir mas cercano)\n"
-                f"|Fecha de consulta: {now_str}. "
-                f"|Por favor, antes de responder, ejecuta siempre la función consultar_partido_en_vivo({fixture_id}) para obtener los datos más recientes del partido y sus cuotas."
-            )
+            timer.mark('db_write')
 
-            logger.info(f"-----------------------------------> Adding message to thread {thread_id}: {user_info['name']}")
-            
-            assistant_manager.add_message_to_thread(thread_id, prompt_message, user_info)
-            
-            # Run the appropriate assistant
-            run_id = assistant_manager.run_assistant(thread_id, assistant_id)
-            
-            # Send typing indicator
-            whatsapp_service.send_text_message(
-                whatsapp_user.phone_number,
-                "⏳ Personalizando tu experiencia..."
-            )
-            
-            # Queue task to check run completion
-            process_assistant_run.delay(
-                whatsapp_user.phone_number,
-                conversation.id,
-                thread_id,
-                run_id
-            )
+        logger.info(f"-----------------------------------> Adding message to thread {thread_id}: {user_info['name']}")
+        
+        # Add the user's prompt to the thread
+        assistant_manager.add_message_to_thread(thread_id, prompt, user_info)
+        timer.mark('messages.create')
+        
+        # Send typing indicator
+        whatsapp_service.send_text_message(
+            whatsapp_user.phone_number,
+            "⏳ Personalizando tu experiencia..."
+        )
+        timer.mark('typing_indicator')
+        
+        # Run the appropriate assistant
+        dispatch_assistant_run(whatsapp_user, conversation, thread_id, assistant_id, assistant_manager, slot=slot)
+        timer.mark('run_dispatch')
+        timer.log()
     
+    except plan_lanes.LaneFull:
+        raise
     except Exception as e:
         logger.error(f"Error starting specialized assistant conversation: {e}")
+        plan_lanes.release_slot(slot)
         whatsapp_service.send_text_message(
             whatsapp_user.phone_number,
             "Lo siento, ha ocurrido un error al iniciar la conversación con el asistente especializado. Por favor intenta nuevamente."
         )
-        time.sleep(1)
-        whatsapp_service.display_main_menu(whatsapp_user.phone_number)
+        send_paced(whatsapp_user.phone_number, 'display_main_menu')
 
 
 def is_in_assistant_mode(whatsapp_user):
@@ -793,8 +1055,7 @@ def process_button_reply(whatsapp_user, message_id, button_id):
             whatsapp_user.phone_number, 
             "Opción no reconocida. Por favor selecciona una opción válida."
         )
-        time.sleep(1)
-        whatsapp_service.display_main_menu(whatsapp_user.phone_number)
+        send_paced(whatsapp_user.phone_number, 'display_main_menu')
 
 
 def process_list_reply(whatsapp_user, message_id, list_id):
@@ -812,8 +1073,7 @@ def process_list_reply(whatsapp_user, message_id, list_id):
                 whatsapp_user.phone_number,
                 "Para personalizar tu experiencia en Deep90, completa tu perfil a continuación:"
             )
-            time.sleep(1)
-            whatsapp_service.send_registration_flow(whatsapp_user.phone_number)
+            send_paced(whatsapp_user.phone_number, 'send_registration_flow')
         else:
             show_profile(whatsapp_user)
     elif list_id == 'update_data':
@@ -825,8 +1085,9 @@ def process_list_reply(whatsapp_user, message_id, list_id):
         whatsapp_service.send_subscriptions_flow(whatsapp_user.phone_number)
     elif list_id == 'config_analyst':
         # Configurar analista - check if user already has configuration
+        config_shown = False
         try:
-            config = AssistantConfig.objects.filter(user=whatsapp_user).first()
+            config = user_cache.get_assistant_config(whatsapp_user.phone_number)
 
             if config:
                 # Obtener textos para mostrar según los valores guardados desde las mismas fuentes de datos
@@ -866,14 +1127,17 @@ def process_list_reply(whatsapp_user, message_id, list_id):
                 )
                 logger.debug(f"Current configuration message: {config_message}")
                 whatsapp_service.send_text_message(whatsapp_user.phone_number, config_message)
-                time.sleep(1)  # Brief pause before sending the flow
+                config_shown = True
 
         except Exception as e:
             logger.error(f"Error retrieving assistant configuration: {e}")
             # Continue with normal flow if there's an error
 
-        # Send configuration flow regardless
-        whatsapp_service.send_config_analytics_flow(whatsapp_user.phone_number)
+        # Send configuration flow regardless (after a brief pause if the configuration was shown)
+        if config_shown:
+            send_paced(whatsapp_user.phone_number, 'send_config_analytics_flow')
+        else:
+            whatsapp_service.send_config_analytics_flow(whatsapp_user.phone_number)
     elif list_id == 'results':
         # Mostrar resultados en vivo
         whatsapp_service.send_live_results_flow(whatsapp_user.phone_number)
@@ -898,8 +1162,7 @@ def process_list_reply(whatsapp_user, message_id, list_id):
             whatsapp_user.phone_number, 
             "Opción no reconocida. Por favor selecciona una opción válida."
         )
-        time.sleep(1)
-        whatsapp_service.display_main_menu(whatsapp_user.phone_number)
+        send_paced(whatsapp_user.phone_number, 'display_main_menu')
 
 
 def process_location(whatsapp_user, message_id, location_data):
@@ -913,16 +1176,19 @@ def process_location(whatsapp_user, message_id, location_data):
         whatsapp_user.phone_number, 
         f"He recibido tu ubicación (Lat: {latitude}, Long: {longitude}). Esta función estará disponible próximamente."
     )
-    time.sleep(1)
-    whatsapp_service.display_main_menu(whatsapp_user.phone_number)
+    send_paced(whatsapp_user.phone_number, 'display_main_menu')
 
 
 def start_assistant_conversation(whatsapp_user):
     """Start a conversation with the OpenAI Assistant."""
     whatsapp_service = WhatsAppService()
     assistant_manager = AssistantManager()
+    slot = None
     
     try:
+        # Sin plaza en el carril el mensaje queda pendiente y se reintenta (LaneFull)
+        slot = plan_lanes.require_slot(whatsapp_user)
+        
         # Desactivar cualquier conversación activa existente
         Conversation.objects.filter(user=whatsapp_user, is_active=True).update(is_active=False)
         
@@ -940,9 +1206,7 @@ def start_assistant_conversation(whatsapp_user):
         if preserved_conversation:
             # Verificar que el thread aún existe en OpenAI
             try:
-                # Intenta obtener mensajes del thread para verificar que existe
-                messages = assistant_manager.get_assistant_messages(preserved_conversation.thread_id)
-                thread_exists = len(messages) > 0
+                thread_exists = assistant_manager.is_thread_alive(preserved_conversation.thread_id)
                 logger.info(f"Thread {preserved_conversation.thread_id} existe: {thread_exists}")
             except Exception as e:
                 logger.error(f"Error verificando thread: {e}")
@@ -975,50 +1239,46 @@ def start_assistant_conversation(whatsapp_user):
                 
                 # Ejecutar el asistente
                 assistant_id = assistant_manager.get_assistant_for_user(whatsapp_user, ConversationType.GENERAL)
-                run_id = assistant_manager.run_assistant(preserved_conversation.thread_id, assistant_id)
-                
-                # Encolar tarea para verificar la finalización de la ejecución
-                process_assistant_run.delay(
-                    whatsapp_user.phone_number,
-                    preserved_conversation.id,
+                dispatch_assistant_run(
+                    whatsapp_user,
+                    preserved_conversation,
                     preserved_conversation.thread_id,
-                    run_id
+                    assistant_id,
+                    assistant_manager,
+                    slot=slot
                 )
             except Exception as e:
                 logger.error(f"Error al reactivar thread existente: {e}")
-                # Si falla, creamos una nueva conversación en lugar de mostrar error
+                # Si falla, creamos una nueva conversación (con su propia plaza) en lugar de mostrar error
+                plan_lanes.release_slot(slot)
                 preserved_conversation.is_active = False
                 preserved_conversation.save()
                 create_new_conversation(whatsapp_user, assistant_manager, whatsapp_service)
         else:
             # No hay conversación preservada válida, crear una nueva
-            create_new_conversation(whatsapp_user, assistant_manager, whatsapp_service)
+            create_new_conversation(whatsapp_user, assistant_manager, whatsapp_service, slot)
         
+    except plan_lanes.LaneFull:
+        raise
     except Exception as e:
         logger.error(f"Error starting assistant conversation: {e}")
+        plan_lanes.release_slot(slot)
         whatsapp_service.send_text_message(
             whatsapp_user.phone_number,
             "Lo siento, hubo un error al iniciar la conversación con el asistente. Por favor intenta nuevamente más tarde."
         )
-        time.sleep(1)
-        whatsapp_service.display_main_menu(whatsapp_user.phone_number)
+        send_paced(whatsapp_user.phone_number, 'display_main_menu')
+
 
+def create_new_conversation(whatsapp_user, assistant_manager, whatsapp_service, slot=None):
+    """
+    Helper function to create a new conversation with the assistant.
 
-def create_new_conversation(whatsapp_user, assistant_manager, whatsapp_service):
-    """Helper function to create a new conversation with the assistant."""
+    ``slot`` es la plaza del carril ya reservada por quien llama; si no se indica,
+    se reserva aquí (LaneFull si el carril está lleno).
+    """
+    slot = slot or plan_lanes.require_slot(whatsapp_user)
     try:
-        # Crear un nuevo thread para la conversación
-        thread_id = assistant_manager.create_thread()
-        
-        # Crear un nuevo registro de conversación
-        conversation = Conversation.objects.create(
-            user=whatsapp_user,
-            thread_id=thread_id,
-            is_active=True,
-            preserve_context=True,  # Always preserve context
-            conversation_type=ConversationType.GENERAL
-        )
-        
         # Enviar mensaje de bienvenida para el modo asistente
         whatsapp_service.send_text_message(
             whatsapp_user.phone_number,
@@ -1028,35 +1288,39 @@ def create_new_conversation(whatsapp_user, assistant_manager, whatsapp_service):
             "Para salir, escribe 'salir' o 'exit'."
         )
         
-        # Añadir mensaje inicial al thread
         user_info = {
             'name': whatsapp_user.full_name or whatsapp_user.profile_name or 'Usuario',
         }
         
-        assistant_manager.add_message_to_thread(
-            thread_id,
-            "El usuario acaba de activar el modo asistente en WhatsApp. " +
-            f"Su nombre es {user_info['name']}. " +
-            "Salúdalo como un asistente experto en fútbol y preséntate. " +
-            "Ofrece tu ayuda para responder preguntas sobre fútbol, como resultados, próximos partidos, " +
-            "clasificaciones, estadísticas de equipos o jugadores, etc.",
+        # Hilo, mensaje inicial y run se crean con una sola llamada
+        requested_at = time.time()
+        assistant_id = assistant_manager.get_assistant_for_user(whatsapp_user, ConversationType.GENERAL)
+        thread_id, run_id = assistant_manager.create_thread_and_run(
+            assistant_id,
+            [
+                "El usuario acaba de activar el modo asistente en WhatsApp. " +
+                f"Su nombre es {user_info['name']}. " +
+                "Salúdalo como un asistente experto en fútbol y preséntate. " +
+                "Ofrece tu ayuda para responder preguntas sobre fútbol, como resultados, próximos partidos, " +
+                "clasificaciones, estadísticas de equipos o jugadores, etc."
+            ],
             user_info
         )
         
-        # Ejecutar el asistente
-        assistant_id = assistant_manager.get_assistant_for_user(whatsapp_user, ConversationType.GENERAL)
-        run_id = assistant_manager.run_assistant(thread_id, assistant_id)
-        
-        # Encolar tarea para verificar la finalización de la ejecución
-        process_assistant_run.delay(
-            whatsapp_user.phone_number,
-            conversation.id,
-            thread_id,
-            run_id
+        # Crear un nuevo registro de conversación
+        conversation = Conversation.objects.create(
+            user=whatsapp_user,
+            thread_id=thread_id,
+            is_active=True,
+            preserve_context=True,  # Always preserve context
+            conversation_type=ConversationType.GENERAL
         )
+        
+        watch_assistant_run(whatsapp_user.phone_number, conversation.id, thread_id, run_id, requested_at, slot)
         return conversation
     except Exception as e:
         logger.error(f"Error creating new conversation: {e}")
+        plan_lanes.release_slot(slot)
         raise
 
 
@@ -1076,8 +1340,7 @@ def end_assistant_conversation(whatsapp_user):
         whatsapp_user.phone_number,
         "Has salido del modo asistente."
     )
-    time.sleep(1)
-    whatsapp_service.display_main_menu(whatsapp_user.phone_number)
+    send_paced(whatsapp_user.phone_number, 'display_main_menu')
 
 
 def show_fixtures(whatsapp_user):
@@ -1090,8 +1353,7 @@ def show_fixtures(whatsapp_user):
     message = service.format_fixtures_message(fixtures)
     
     whatsapp_service.send_text_message(whatsapp_user.phone_number, message)
-    time.sleep(1)
-    whatsapp_service.display_main_menu(whatsapp_user.phone_number)
+    send_paced(whatsapp_user.phone_number, 'display_main_menu')
 
 
 def show_results(whatsapp_user):
@@ -1132,8 +1394,7 @@ def show_profile(whatsapp_user):
     )
     
     whatsapp_service.send_text_message(whatsapp_user.phone_number, profile_message)
-    time.sleep(1)
-    whatsapp_service.display_main_menu(whatsapp_user.phone_number)
+    send_paced(whatsapp_user.phone_number, 'display_main_menu')
 
 
 def show_subscription_options(whatsapp_user):
@@ -1180,7 +1441,8 @@ def process_subscription_change(whatsapp_user, new_plan):
     # Simple mock implementation - in a real scenario, you would process payment, etc.
     whatsapp_user.subscription_plan = new_plan
     whatsapp_user.subscription_expiry = datetime.now().replace(year=datetime.now().year + 1)
-    whatsapp_user.save()
+    # Solo los campos modificados: la instancia puede venir de la caché de perfiles
+    whatsapp_user.save(update_fields=['subscription_plan', 'subscription_expiry', 'updated_at'])
     
     # Notify user of the change
     plan_name = "Premium" if new_plan == SubscriptionPlan.PREMIUM else "Profesional"
@@ -1193,8 +1455,7 @@ def process_subscription_change(whatsapp_user, new_plan):
         "Ahora tienes acceso a todas las funciones premium de nuestro asistente."
     )
     
-    time.sleep(1)
-    whatsapp_service.display_main_menu(whatsapp_user.phone_number)
+    send_paced(whatsapp_user.phone_number, 'display_main_menu')
 
 
 def show_help(whatsapp_user):
@@ -1211,18 +1472,304 @@ def show_help(whatsapp_user):
     )
     
     whatsapp_service.send_text_message(whatsapp_user.phone_number, help_message)
-    time.sleep(1)
-    whatsapp_service.display_main_menu(whatsapp_user.phone_number)
+    send_paced(whatsapp_user.phone_number, 'display_main_menu')
+
+
+
+# Token de la ventana de agrupación de mensajes por conversación
+DEBOUNCE_KEY = "assistant_debounce:{conversation_id}"
+
+EXIT_ASSISTANT_BUTTONS = [
+    {
+        "type": "reply",
+        "reply": {
+            "id": "exit_assistant",
+            "title": "Volver al menú"
+        }
+    }
+]
+
 
+def schedule_assistant_run(whatsapp_user, conversation, assistant_id, assistant_manager):
+    """
+    Programa la ejecución del asistente tras la ventana de agrupación de mensajes.
+
+    Cada mensaje nuevo de la conversación renueva el token de la ventana; solo la
+    última tarea programada (la que conserva el token vigente) lanza el run, de
+    modo que una ráfaga de mensajes produce una única ejecución.
+
+    Sin agrupación (ASSISTANT_DEBOUNCE_SECONDS <= 0 o error de Redis) el run se
+    lanza en el acto si el carril del plan tiene plazas; si no, se aplaza con
+    run_debounced_assistant como un run agrupado.
+
+    Args:
+        whatsapp_user: Usuario de WhatsApp
+        conversation: Conversación asociada
+        assistant_id: ID del asistente
+        assistant_manager: Instancia de AssistantManager
+    """
+    token = None
+    if settings.ASSISTANT_DEBOUNCE_SECONDS > 0:
+        key = DEBOUNCE_KEY.format(conversation_id=conversation.id)
+        try:
+            cache.add(key, 0, 60 * 60)
+            token = cache.incr(key)
+        except Exception as e:
+            logger.warning(f"No se pudo agrupar mensajes de la conversación {conversation.id}: {e}")
+
+    if token is None:
+        slot = plan_lanes.acquire_slot(plan_lanes.effective_plan(whatsapp_user))
+        if slot:
+            dispatch_assistant_run(whatsapp_user, conversation, conversation.thread_id, assistant_id, assistant_manager, slot=slot)
+            return
+
+    # El hilo queda marcado como ocupado desde ya: los mensajes siguientes cancelarán el run si llega a lanzarse
+    assistant_manager.mark_run_active(conversation.thread_id)
+    run_debounced_assistant.apply_async(
+        args=[whatsapp_user.phone_number, conversation.id, assistant_id, token, time.time()],
+        countdown=settings.ASSISTANT_DEBOUNCE_SECONDS if token is not None else settings.PLAN_LANE_RETRY_SECONDS
+    )
+
+
+@shared_task(ignore_result=True)
+def run_debounced_assistant(user_phone, conversation_id, assistant_id, token, requested_at):
+    """
+    Lanza el run de una conversación si no llegaron mensajes nuevos durante la ventana.
+
+    Si el carril del plan del usuario no tiene plazas de OpenAI libres, la tarea se
+    vuelve a programar PLAN_LANE_RETRY_SECONDS más tarde en lugar de esperar.
+
+    Args:
+        user_phone: Teléfono del usuario
+        conversation_id: ID de la conversación
+        assistant_id: ID del asistente
+        token: Token de la ventana con el que se programó la tarea (None si el run
+            no se agrupó y solo esperaba plaza en el carril)
+        requested_at: Instante (epoch) del mensaje que programó la tarea
+    """
+    if token is not None and cache.get(DEBOUNCE_KEY.format(conversation_id=conversation_id)) != token:
+        increment('debounce:coalesced')
+        return {'success': True, 'message': 'Agrupado con mensajes posteriores'}
+
+    slot = None
+    try:
+        whatsapp_user = user_cache.get_user(user_phone)
+        conversation = Conversation.objects.get(id=conversation_id)
+        slot = plan_lanes.acquire_slot(plan_lanes.effective_plan(whatsapp_user))
+        if not slot:
+            run_debounced_assistant.apply_async(
+                args=[user_phone, conversation_id, assistant_id, token, requested_at],
+                countdown=settings.PLAN_LANE_RETRY_SECONDS
+            )
+            return {'success': True, 'message': 'Aplazado: carril sin plazas libres'}
+        increment('debounce:runs')
+        dispatch_assistant_run(whatsapp_user, conversation, conversation.thread_id, assistant_id, AssistantManager(), requested_at, slot)
+        return {'success': True}
+    except Exception as e:
+        logger.error(f"Error launching debounced assistant run: {e}")
+        abandon_assistant_run(slot, user_phone, "Lo siento, ocurrió un error al procesar tu solicitud. Por favor intenta nuevamente.")
+        return {'success': False, 'error': str(e)}
 
 
-@shared_task
-def process_assistant_run(user_phone, conversation_id, thread_id, run_id):
+def dispatch_assistant_run(whatsapp_user, conversation, thread_id, assistant_id, assistant_manager, requested_at=None, slot=None):
+    """
+    Lanza la ejecución del asistente según ASSISTANT_RUN_MODE.
+
+    En modo "stream" el run se crea y se consume dentro de stream_assistant_run;
+    en modo "tracker" se crea aquí y lo sondea el tracker central (run_tracker.py);
+    en modo "poll" se crea aquí y process_assistant_run sondea su estado.
+
+    Args:
+        whatsapp_user: Usuario de WhatsApp
+        conversation: Conversación asociada
+        thread_id: ID del hilo
+        assistant_id: ID del asistente
+        assistant_manager: Instancia de AssistantManager
+        requested_at: Instante (epoch) de la petición del usuario (por defecto ahora)
+        slot: Plaza del carril reservada para el run (ver plan_lanes.py)
+    """
+    requested_at = requested_at or time.time()
+    try:
+        if context_manager.is_managed(conversation):
+            # Cada turno usa un hilo nuevo con instrucciones, resumen y ventana acotada de historial
+            user_name = whatsapp_user.full_name or whatsapp_user.profile_name or 'Usuario'
+            messages = context_manager.build_context_messages(conversation, user_name)
+            thread_id, run_id = assistant_manager.create_thread_and_run(assistant_id, messages)
+            conversation.thread_id = thread_id
+            conversation.save(update_fields=['thread_id'])
+            watch_assistant_run(whatsapp_user.phone_number, conversation.id, thread_id, run_id, requested_at, slot)
+            return
+
+        assistant_manager.mark_run_active(thread_id)
+        if settings.ASSISTANT_RUN_MODE == 'stream':
+            stream_assistant_run.delay(
+                whatsapp_user.phone_number,
+                conversation.id,
+                thread_id,
+                assistant_id,
+                requested_at,
+                slot
+            )
+            return
+
+        run_id = assistant_manager.run_assistant(thread_id, assistant_id)
+        watch_assistant_run(whatsapp_user.phone_number, conversation.id, thread_id, run_id, requested_at, slot)
+    except Exception:
+        # La plaza tomada para este run no debe quedar retenida si el run no llega a lanzarse
+        abandon_assistant_run(slot)
+        raise
+
+
+def watch_assistant_run(user_phone, conversation_id, thread_id, run_id, requested_at=None, slot=None):
+    """
+    Sigue un run ya creado hasta su finalización.
+
+    En modo "poll" se sondea con process_assistant_run; en los demás modos con el
+    tracker central (un run ya creado no puede consumirse como stream).
+
+    Args:
+        user_phone: Teléfono del usuario
+        conversation_id: ID de la conversación
+        thread_id: ID del hilo
+        run_id: ID del run
+        requested_at: Instante (epoch) en que se lanzó la ejecución
+        slot: Plaza del carril que ocupa el run
+    """
+    try:
+        AssistantManager().mark_run_active(thread_id)
+        if settings.ASSISTANT_RUN_MODE == 'poll':
+            process_assistant_run.delay(user_phone, conversation_id, thread_id, run_id, requested_at, slot)
+        else:
+            track_run(user_phone, conversation_id, thread_id, run_id, requested_at, slot)
+    except Exception:
+        abandon_assistant_run(slot)
+        raise
+
+
+def deliver_assistant_reply(whatsapp_user, conversation, message_content, thread_id, mode, requested_at=None, total_tokens=None, slot=None):
+    """
+    Guarda y envía la respuesta del asistente, registrando el tiempo hasta la respuesta.
+
+    Args:
+        whatsapp_user: Usuario de WhatsApp
+        conversation: Conversación asociada
+        message_content: Texto de la respuesta (None si el asistente no generó mensaje)
+        thread_id: ID del hilo
+        mode: Modo de ejecución ("stream", "tracker", "poll" o "cache") para las métricas
+        requested_at: Instante (epoch) en que se lanzó la ejecución
+        total_tokens: Tokens consumidos por el run (para la caché de respuestas)
+        slot: Plaza del carril que ocupaba el run
+    """
+    whatsapp_service = WhatsAppService()
+    if mode != 'cache':
+        AssistantManager().clear_run_active(thread_id)
+        plan_lanes.release_slot(slot)
+
+    if not message_content:
+        whatsapp_service.send_button_template(
+            whatsapp_user.phone_number,
+            "Lo siento, parece que el asistente no ha podido generar una respuesta. Por favor intenta nuevamente.",
+            EXIT_ASSISTANT_BUTTONS
+        )
+        logger.warning(f"No se encontraron mensajes del asistente para el thread {thread_id}")
+        return
+
+    # Save message to database
+    Message.objects.create(
+        conversation=conversation,
+        is_from_user=False,
+        content=message_content,
+        message_type='text'
+    )
+
+    # Send the assistant's response with buttons in one message
+    whatsapp_service.send_button_template(
+        whatsapp_user.phone_number,
+        message_content,
+        EXIT_ASSISTANT_BUTTONS
+    )
+
+    if mode != 'cache':
+        answer_cache.store_pending(conversation.id, message_content, total_tokens)
+        context_manager.maybe_refresh_summary(conversation)
+    if requested_at:
+        record_latency(f"time_to_reply:{mode}", time.time() - requested_at)
+    logger.info(f"Respuesta del asistente enviada a {whatsapp_user.phone_number}: {message_content[:50]}...")
+
+
+def notify_assistant_failure(user_phone, text="Lo siento, hubo un problema al procesar tu mensaje. Por favor intenta nuevamente."):
+    """Informa al usuario de un fallo del asistente con el botón para volver al menú."""
+    WhatsAppService().send_button_template(user_phone, text, EXIT_ASSISTANT_BUTTONS)
+
+
+def abandon_assistant_run(slot, user_phone=None, text=None):
+    """
+    Cierra un run que termina sin respuesta: fallido, cancelado, expirado,
+    reemplazado por mensajes nuevos o interrumpido por un error.
+
+    Libera la plaza del carril del plan (ver plan_lanes.py) para no retenerla
+    hasta PLAN_SLOT_MAX_AGE y, si se indica ``user_phone``, avisa al usuario.
+    La plaza es la del propio run: la del run que lo reemplaza no se toca.
+
+    Args:
+        slot: Plaza del carril que ocupaba el run (None si no tenía)
+        user_phone: Teléfono del usuario a avisar (None para no avisar)
+        text: Texto del aviso (por defecto el de notify_assistant_failure)
+    """
+    plan_lanes.release_slot(slot)
+    if not user_phone:
+        return
+    try:
+        if text:
+            notify_assistant_failure(user_phone, text)
+        else:
+            notify_assistant_failure(user_phone)
+    except Exception:
+        logger.error("Could not notify user of error")
+
+
+@shared_task(ignore_result=True)
+def stream_assistant_run(user_phone, conversation_id, thread_id, assistant_id, requested_at=None, slot=None):
+    """
+    Ejecuta el asistente en modo streaming y envía la respuesta en cuanto el run termina.
+
+    Si el stream se interrumpe después de crear el run, se continúa por sondeo con
+    process_assistant_run.
+    """
+    assistant_manager = AssistantManager()
+    result = {'run_id': None, 'status': None, 'content': None, 'total_tokens': None}
+    try:
+        whatsapp_user = user_cache.get_user(user_phone)
+        conversation = Conversation.objects.get(id=conversation_id)
+
+        result = assistant_manager.stream_run(thread_id, assistant_id)
+
+        if result['status'] == 'completed':
+            deliver_assistant_reply(whatsapp_user, conversation, result['content'], thread_id, 'stream', requested_at, result['total_tokens'], slot)
+        elif assistant_manager.is_run_superseded(result['run_id']):
+            logger.info(f"Run {result['run_id']} reemplazado por mensajes nuevos")
+            abandon_assistant_run(slot)
+        else:
+            abandon_assistant_run(slot, user_phone)
+            logger.error(f"Run {result['run_id']} terminó con estado: {result['status']} para el thread {thread_id}")
+
+    except Exception as e:
+        if result['run_id']:
+            logger.warning(f"Stream interrumpido para el run {result['run_id']}, se continúa por sondeo: {e}")
+            process_assistant_run.delay(user_phone, conversation_id, thread_id, result['run_id'], requested_at, slot)
+            return
+
+        logger.error(f"Error processing assistant stream: {e}")
+        abandon_assistant_run(slot, user_phone, "Lo siento, ocurrió un error al procesar tu solicitud. Por favor intenta nuevamente.")
+
+
+@shared_task(ignore_result=True)
+def process_assistant_run(user_phone, conversation_id, thread_id, run_id, requested_at=None, slot=None):
     """Process an assistant run and send the response when complete."""
+    increment('broker_tasks:process_assistant_run')
     try:
-        whatsapp_user = WhatsAppUser.objects.get(phone_number=user_phone)
+        whatsapp_user = user_cache.get_user(user_phone)
         conversation = Conversation.objects.get(id=conversation_id)
-        whatsapp_service = WhatsAppService()
         assistant_manager = AssistantManager()
         
         # Check run status
@@ -1231,59 +1778,9 @@ def process_assistant_run(user_phone, conversation_id, thread_id, run_id):
         
         if status == 'completed':
             # Get the latest messages from the assistant
-            messages = assistant_manager.get_assistant_messages(thread_id)
-            
-            if messages:
-                # Get the most recent message
-                latest_message = messages[0]
-                message_content = latest_message['content']
-                
-                # Save message to database
-                Message.objects.create(
-                    conversation=conversation,
-                    is_from_user=False,
-                    content=message_content,
-                    message_type='text'
-                )
-                
-                # Define buttons for continuing or exiting
-                buttons = [
-                    {
-                        "type": "reply",
-                        "reply": {
-                            "id": "exit_assistant",
-                            "title": "Volver al menú"
-                        }
-                    }
-                ]
-                
-                # Send the assistant's response with buttons in one message
-                whatsapp_service.send_button_template(
-                    whatsapp_user.phone_number,
-                    message_content,
-                    buttons
-                )
-                
-                logger.info(f"Respuesta del asistente enviada a {whatsapp_user.phone_number}: {message_content[:50]}...")
-            else:
-                # No se encontraron mensajes del asistente
-                # Add button to return to main menu
-                buttons = [
-                    {
-                        "type": "reply",
-                        "reply": {
-                            "id": "exit_assistant",
-                            "title": "Volver al menú"
-                        }
-                    }
-                ]
-                
-                whatsapp_service.send_button_template(
-                    whatsapp_user.phone_number,
-                    "Lo siento, parece que el asistente no ha podido generar una respuesta. Por favor intenta nuevamente.",
-                    buttons
-                )
-                logger.warning(f"No se encontraron mensajes del asistente para el thread {thread_id}")
+            message_content = assistant_manager.get_latest_assistant_message(thread_id, run_id)
+            total_tokens = run.usage.total_tokens if getattr(run, 'usage', None) else None
+            deliver_assistant_reply(whatsapp_user, conversation, message_content, thread_id, 'poll', requested_at, total_tokens, slot)
         
         elif status == 'requires_action':
             # Assistant is requesting action through tools
@@ -1297,64 +1794,161 @@ def process_assistant_run(user_phone, conversation_id, thread_id, run_id):
             )
             
             # Re-check status after tool execution
-            process_assistant_run.delay(user_phone, conversation_id, thread_id, updated_run.id)
+            process_assistant_run.delay(user_phone, conversation_id, thread_id, updated_run.id, requested_at, slot)
             
+        elif status == 'cancelled' and assistant_manager.is_run_superseded(run_id):
+            logger.info(f"Run {run_id} reemplazado por mensajes nuevos")
+            abandon_assistant_run(slot)
+        
         elif status in ['failed', 'cancelled', 'expired']:
             # Run failed
-            # Add button to return to main menu
-            buttons = [
-                {
-                    "type": "reply",
-                    "reply": {
-                        "id": "exit_assistant",
-                        "title": "Volver al menú"
-                    }
-                }
-            ]
-            
-            whatsapp_service.send_button_template(
-                whatsapp_user.phone_number,
-                "Lo siento, hubo un problema al procesar tu mensaje. Por favor intenta nuevamente.",
-                buttons
-            )
+            abandon_assistant_run(slot, whatsapp_user.phone_number)
             logger.error(f"Run falló con estado: {status} para el thread {thread_id}")
         
         elif status in ['queued', 'in_progress']:
             # Still processing, check again in a few seconds
             process_assistant_run.apply_async(
-                args=[user_phone, conversation_id, thread_id, run_id],
-                countdown=3  # Check again in 3 seconds
+                args=[user_phone, conversation_id, thread_id, run_id, requested_at, slot],
+                countdown=settings.ASSISTANT_POLL_INTERVAL
             )
         
     except Exception as e:
         logger.error(f"Error processing assistant run: {e}")
         
         # Try to notify user of the error
-        try:
-            whatsapp_user = WhatsAppUser.objects.get(phone_number=user_phone)
-            whatsapp_service = WhatsAppService()
-            
-            # Add button to return to main menu
-            buttons = [
-                {
-                    "type": "reply",
-                    "reply": {
-                        "id": "exit_assistant",
-                        "title": "Volver al menú"
-                    }
-                }
-            ]
-            
-            whatsapp_service.send_button_template(
-                whatsapp_user.phone_number,
-                "Lo siento, ocurrió un error al procesar tu solicitud. Por favor intenta nuevamente.",
-                buttons
+        abandon_assistant_run(slot, user_phone, "Lo siento, ocurrió un error al procesar tu solicitud. Por favor intenta nuevamente.")
+
+
+@shared_task(ignore_result=True)
+def track_assistant_runs(kicked=False):
+    """
+    Sondea todos los runs pendientes del tracker central en un único proceso asyncio.
+
+    Se lanza bajo demanda al registrar un run (kicked=True) y periódicamente desde
+    beat como red de seguridad; solo puede haber un tracker activo.
+    """
+    if not kicked and not cache.add(ACTIVE_KEY, 1, settings.RUN_TRACKER_LIFETIME + 30):
+        return {'success': True, 'message': 'Tracker ya activo'}
+
+    async def _track():
+        async with create_async_openai_client() as client:
+            return await run_tracker_loop(client, settings.RUN_TRACKER_LIFETIME)
+
+    increment('run_tracker:tasks')
+    try:
+        totals = asyncio.run(_track())
+    except Exception as e:
+        logger.error(f"Error en el tracker de runs: {e}")
+        totals = {}
+    finally:
+        cache.delete(ACTIVE_KEY)
+
+    # Runs registrados mientras el tracker terminaba
+    if get_pending_entries():
+        ensure_tracker_running()
+
+    logger.info(f"Tracker de runs finalizado: {totals}")
+    return {'success': True, **totals}
+
+
+@shared_task(ignore_result=True)
+def handle_tracked_run_event(event, entry):
+    """
+    Maneja un evento del tracker central: respuesta completada, tool calls o fallo.
+
+    Args:
+        event: "completed", "requires_action" o "failed"
+        entry: Datos del run registrados en el tracker
+    """
+    user_phone = entry['user_phone']
+    try:
+        whatsapp_user = user_cache.get_user(user_phone)
+        conversation = Conversation.objects.get(id=entry['conversation_id'])
+        assistant_manager = AssistantManager()
+
+        if event == 'completed':
+            message_content = assistant_manager.get_latest_assistant_message(entry['thread_id'], entry['run_id'])
+            deliver_assistant_reply(
+                whatsapp_user, conversation, message_content, entry['thread_id'], 'tracker',
+                entry['requested_at'], entry.get('total_tokens'), entry.get('slot')
             )
-        except Exception:
-            logger.error("Could not notify user of error")
+
+        elif event == 'requires_action':
+            run = assistant_manager.check_run_status(entry['thread_id'], entry['run_id'])
+            assistant_manager.process_tool_calls(entry['thread_id'], entry['run_id'], run.required_action)
+            track_run(user_phone, conversation.id, entry['thread_id'], entry['run_id'], entry['requested_at'], entry.get('slot'))
+
+        elif assistant_manager.is_run_superseded(entry['run_id']):
+            logger.info(f"Run {entry['run_id']} reemplazado por mensajes nuevos")
+            abandon_assistant_run(entry.get('slot'))
+
+        else:
+            abandon_assistant_run(entry.get('slot'), user_phone)
+            logger.error(f"Run {entry['run_id']} falló para el thread {entry['thread_id']}")
+
+    except Exception as e:
+        logger.error(f"Error handling tracked run event {event}: {e}")
+        abandon_assistant_run(entry.get('slot'), user_phone, "Lo siento, ocurrió un error al procesar tu solicitud. Por favor intenta nuevamente.")
+
+
+@shared_task(ignore_result=True)
+def deliver_outbound_step(user_phone, method, args):
+    """
+    Envía un paso diferido del secuenciador de mensajes salientes (ver outbound.py).
+
+    Args:
+        user_phone: Teléfono del usuario
+        method: Método de WhatsAppService a invocar
+        args: Argumentos adicionales del método
+    """
+    if method not in OUTBOUND_METHODS:
+        logger.error(f"Paso de envío con método no permitido: {method}")
+        return
+    try:
+        getattr(WhatsAppService(), method)(user_phone, *args)
+        increment('outbound:delivered')
+    except Exception as e:
+        increment('outbound:failed')
+        logger.error(f"Error al enviar el paso {method} a {user_phone}: {e}")
+
+
+@shared_task(ignore_result=True)
+def refresh_conversation_summary(conversation_id):
+    """Incorpora al resumen de una conversación con contexto gestionado los mensajes fuera de la ventana."""
+    try:
+        conversation = Conversation.objects.get(id=conversation_id)
+        summarized = context_manager.refresh_summary(conversation)
+        if summarized:
+            logger.info(f"Resumen de la conversación {conversation_id} actualizado con {summarized} mensajes")
+        return {'success': True, 'summarized': summarized or 0}
+    except Exception as e:
+        logger.error(f"Error al actualizar el resumen de la conversación {conversation_id}: {e}")
+        return {'success': False, 'error': str(e)}
+
+
+@shared_task(ignore_result=True)
+def purge_inbound_messages():
+    """Elimina los IDs de mensajes entrantes antiguos usados para descartar duplicados."""
+    try:
+        deleted = dedup.purge_inbound_messages()
+        return {'success': True, 'deleted': deleted}
+    except Exception as e:
+        logger.error(f"Error al purgar mensajes entrantes: {e}")
+        return {'success': False, 'error': str(e)}
+
+
+@shared_task(ignore_result=True)
+def reconcile_daily_message_counters():
+    """Ajusta los contadores diarios de mensajes en Redis a los mensajes registrados en la base de datos."""
+    try:
+        fixed = daily_limits.reconcile()
+        return {'success': True, 'fixed': fixed}
+    except Exception as e:
+        logger.error(f"Error al reconciliar los contadores diarios de mensajes: {e}")
+        return {'success': False, 'error': str(e)}
 
 
-@shared_task
+@shared_task(ignore_result=True)
 def process_assistant_response(thread_id, run_id):
     """Process response from Assistant API after completion via webhook."""
     try:
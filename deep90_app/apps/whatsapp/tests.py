@@ -1,3 +1,811 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import hmac
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from types import SimpleNamespace
 
-# Create your tests here.
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+
+from deep90_app.apps.sports_data.models import FixtureData
+from deep90_app.apps.whatsapp.assistant_manager import AssistantManager
+from deep90_app.apps.whatsapp.management.commands import benchmark_webhook
+from deep90_app.apps.whatsapp.metrics import get_counter
+from deep90_app.apps.whatsapp.metrics import LATENCY_WINDOW
+from deep90_app.apps.whatsapp.metrics import get_latency_summary
+from deep90_app.apps.whatsapp.metrics import record_latency
+from deep90_app.apps.whatsapp import answer_cache
+from deep90_app.apps.whatsapp.admin import WhatsAppUserAdmin
+from deep90_app.apps.whatsapp import context_manager
+from deep90_app.apps.whatsapp import daily_limits
+from deep90_app.apps.whatsapp import dedup
+from deep90_app.apps.whatsapp import inbound_queue
+from deep90_app.apps.whatsapp import openai_client
+from deep90_app.apps.whatsapp import outbound
+from deep90_app.apps.whatsapp import plan_lanes
+from deep90_app.apps.whatsapp import run_tracker
+from deep90_app.apps.whatsapp import tasks
+from deep90_app.apps.whatsapp import tools
+from deep90_app.apps.whatsapp import user_cache
+from deep90_app.apps.whatsapp.models import AssistantConfig
+from deep90_app.apps.whatsapp.models import Conversation
+from deep90_app.apps.whatsapp.models import Message
+from deep90_app.apps.whatsapp.models import WhatsAppUser
+from deep90_app.apps.whatsapp.services import WhatsAppService
+from deep90_app.apps.whatsapp.tools import TOOL_REGISTRY
+from deep90_app.apps.whatsapp.tools import execute_tool
+from deep90_app.apps.whatsapp.tools import execute_tool_calls
+from deep90_app.apps.whatsapp.tools import get_tool_metrics
+from deep90_app.utils import redis_store
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def _clear_user_cache():
+    # El LRU en memoria sobrevive entre tests aunque la base de datos se revierta
+    user_cache.clear_local()
+
+
+def _finished_fixture(fixture_id, home_id, away_id, home_goals, away_goals, days_ago):
+    kickoff = timezone.now() - timezone.timedelta(days=days_ago)
+    return FixtureData.objects.create(
+        fixture_id=fixture_id, date=kickoff, timestamp=int(kickoff.timestamp()),
+        status_long="Match Finished", status_short="FT",
+        league_id=39, league_name="Premier League", league_country="England", league_season=2026,
+        home_team_id=home_id, home_team_name=f"Equipo {home_id}",
+        away_team_id=away_id, away_team_name=f"Equipo {away_id}",
+        home_goals=home_goals, away_goals=away_goals,
+    )
+
+
+def _tool_call(call_id, name, arguments):
+    return SimpleNamespace(id=call_id, function=SimpleNamespace(name=name, arguments=arguments))
+
+
+def test_tool_registry_validates_and_caches_results():
+    cache.clear()
+    assert execute_tool("no_existe", {}) == "Error: Función 'no_existe' no implementada."
+    assert "Faltan argumentos requeridos: team_id" in execute_tool("get_team_form", {})
+
+    _finished_fixture(1, 10, 20, 2, 0, days_ago=7)
+    first = execute_tool("get_team_form", {"team_id": "10"})
+    _finished_fixture(2, 20, 10, 1, 1, days_ago=1)
+    assert execute_tool("get_team_form", {"team_id": 10}) == first
+
+    metrics = get_tool_metrics()["get_team_form"]
+    assert metrics["calls"] == 3
+    assert metrics["cache_hits"] == 1
+    assert TOOL_REGISTRY["get_team_form"].as_openai_tool()["function"]["parameters"]["required"] == ["team_id"]
+
+
+# Los hilos del pool usan su propia conexión: los datos deben estar confirmados
+@pytest.mark.django_db(transaction=True)
+def test_tool_calls_keep_order_when_executed_in_parallel():
+    cache.clear()
+    _finished_fixture(1, 10, 20, 2, 0, days_ago=7)
+    _finished_fixture(2, 20, 10, 1, 1, days_ago=1)
+
+    outputs = execute_tool_calls([
+        _tool_call("a", "get_head_to_head", '{"team_a_id": 10, "team_b_id": 20}'),
+        _tool_call("b", "get_team_form", '{"team_id": 20, "last": 1}'),
+    ])
+
+    assert [output["tool_call_id"] for output in outputs] == ["a", "b"]
+    assert '"team_a_wins": 1' in outputs[0]["output"]
+    assert '"draws": 1' in outputs[0]["output"]
+    assert '"form": "E"' in outputs[1]["output"]
+
+
+def test_tool_metrics_count_every_concurrent_call():
+    cache.clear()
+
+    def record_many():
+        for _ in range(50):
+            tools._record_latency("get_team_form", 2.0, cached=False)
+
+    # Cambios de hilo muy frecuentes para que las escrituras se intercalen
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for _ in range(8):
+                executor.submit(record_many)
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    metrics = get_tool_metrics()["get_team_form"]
+    assert metrics["calls"] == 400
+    assert metrics["cache_hits"] == 0
+    assert metrics["avg_ms"] == 2.0
+    assert metrics["max_ms"] == 2.0
+
+
+class _FakeStream:
+    def __init__(self, events):
+        self.events = events
+
+    def __enter__(self):
+        return iter(self.events)
+
+    def __exit__(self, *args):
+        return False
+
+
+def _event(name, **data):
+    return SimpleNamespace(event=name, data=SimpleNamespace(**data))
+
+
+def test_stream_run_resolves_tool_calls_inline():
+    cache.clear()
+    tool_calls = [_tool_call("call_1", "get_standings", '{"league_id": 39}')]
+    submitted = {}
+
+    def submit_tool_outputs_stream(thread_id, run_id, tool_outputs):
+        submitted[run_id] = tool_outputs
+        text = SimpleNamespace(type="text", text=SimpleNamespace(value="Respuesta"))
+        return _FakeStream([
+            _event("thread.message.completed", content=[text]),
+            _event("thread.run.completed", id=run_id, status="completed", usage=SimpleNamespace(total_tokens=321)),
+        ])
+
+    manager = AssistantManager.__new__(AssistantManager)
+    manager.client = SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(runs=SimpleNamespace(
+        stream=lambda thread_id, assistant_id: _FakeStream([
+            _event("thread.run.created", id="run_1"),
+            _event("thread.run.requires_action", id="run_1", required_action=SimpleNamespace(
+                submit_tool_outputs=SimpleNamespace(tool_calls=tool_calls))),
+        ]),
+        submit_tool_outputs_stream=submit_tool_outputs_stream,
+    ))))
+
+    result = manager.stream_run("thread_1", "asst_1")
+
+    assert result == {"run_id": "run_1", "status": "completed", "content": "Respuesta", "total_tokens": 321}
+    assert submitted["run_1"] == [{"tool_call_id": "call_1", "output": "[]"}]
+
+
+def test_time_to_reply_median():
+    cache.clear()
+    for seconds in (4.0, 1.0, 2.0):
+        record_latency("time_to_reply:stream", seconds)
+
+    assert get_latency_summary("time_to_reply:stream")["median"] == 2.0
+    assert get_latency_summary("time_to_reply:poll") is None
+
+
+def test_latency_window_keeps_concurrent_samples_up_to_its_size():
+    cache.clear()
+
+    def record_many():
+        for _ in range(40):
+            record_latency("openai_request", 0.5)
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for _ in range(8):
+                executor.submit(record_many)
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert get_latency_summary("openai_request")["samples"] == 320
+
+    for _ in range(LATENCY_WINDOW):
+        record_latency("openai_request", 1.5)
+    summary = get_latency_summary("openai_request")
+    assert summary["samples"] == LATENCY_WINDOW
+    assert summary["median"] == 1.5
+
+
+def test_run_tracker_polls_due_runs_and_dispatches_events(monkeypatch):
+    cache.clear()
+    kicked, events = [], []
+    monkeypatch.setattr(tasks.track_assistant_runs, "delay", lambda **kwargs: kicked.append(kwargs))
+    monkeypatch.setattr(tasks.handle_tracked_run_event, "delay", lambda event, entry: events.append((event, entry["run_id"])))
+
+    run_tracker.track_run("573000000001", 1, "thread_1", "run_1")
+    run_tracker.track_run("573000000002", 2, "thread_2", "run_2")
+    assert kicked == [{"kicked": True}]
+
+    statuses = {"run_1": "completed", "run_2": "in_progress"}
+
+    async def retrieve(thread_id, run_id):
+        return SimpleNamespace(status=statuses[run_id])
+
+    client = SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(runs=SimpleNamespace(retrieve=retrieve))))
+    now = max(entry["next_poll_at"] for entry in run_tracker.get_pending_entries())
+
+    assert asyncio.run(run_tracker.poll_tracked_runs_once(client, now=now)) == {"polled": 2, "events": 1}
+    assert events == [("completed", "run_1")]
+    pending = run_tracker.get_pending_entries()
+    assert [entry["run_id"] for entry in pending] == ["run_2"]
+    assert pending[0]["next_poll_at"] == now + run_tracker.next_poll_delay(1)
+
+    # Aún no le toca sondear de nuevo
+    assert asyncio.run(run_tracker.poll_tracked_runs_once(client, now=now))["polled"] == 0
+    assert run_tracker.get_tracker_status()["polls"] == 2
+
+
+def test_openai_client_is_shared_per_process(settings, monkeypatch):
+    settings.OPENAI_API_KEY = "sk-test"
+    monkeypatch.setattr(openai_client, "_client", None)
+
+    client = openai_client.get_openai_client()
+    assert AssistantManager().client is client
+
+    # Un hijo prefork (otro PID) obtiene su propio cliente
+    monkeypatch.setattr(openai_client, "_client_pid", -1)
+    assert openai_client.get_openai_client() is not client
+
+    assert openai_client.endpoint_name("GET", "/v1/threads/thread_abc/runs/run_123") == "runs.retrieve"
+    assert openai_client.endpoint_name("POST", "/v1/threads/thread_abc/messages") == "messages.create"
+    assert openai_client.endpoint_name("POST", "/v1/threads") == "threads.create"
+
+
+def test_create_thread_and_run_sends_messages_in_one_call():
+    calls = []
+
+    def create_and_run(**kwargs):
+        calls.append(kwargs)
+        return SimpleNamespace(id="run_1", thread_id="thread_1")
+
+    manager = AssistantManager.__new__(AssistantManager)
+    manager.client = SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(create_and_run=create_and_run)))
+
+    assert manager.create_thread_and_run("asst_1", ["contexto", "pregunta"]) == ("thread_1", "run_1")
+    assert len(calls) == 1
+    assert [message["content"] for message in calls[0]["thread"]["messages"]] == ["contexto", "pregunta"]
+
+
+def test_thread_liveness_is_cached_and_latest_reply_reads_one_message():
+    cache.clear()
+    retrieved, listed = [], []
+    text = SimpleNamespace(type="text", text=SimpleNamespace(value="Última respuesta"))
+
+    def retrieve(thread_id):
+        retrieved.append(thread_id)
+        if thread_id == "thread_borrado":
+            raise Exception("No thread found")
+        return SimpleNamespace(id=thread_id)
+
+    def list_messages(**kwargs):
+        listed.append(kwargs)
+        return SimpleNamespace(data=[SimpleNamespace(id="msg_1", role="assistant", content=[text], created_at=0)])
+
+    manager = AssistantManager.__new__(AssistantManager)
+    manager.client = SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(
+        retrieve=retrieve, messages=SimpleNamespace(list=list_messages))))
+
+    assert manager.is_thread_alive("thread_1")
+    assert manager.is_thread_alive("thread_1")
+    assert not manager.is_thread_alive("thread_borrado")
+    assert retrieved == ["thread_1", "thread_borrado"]
+
+    assert manager.get_latest_assistant_message("thread_1", "run_1") == "Última respuesta"
+    assert listed == [{"thread_id": "thread_1", "order": "desc", "limit": 1, "run_id": "run_1"}]
+
+
+def test_message_burst_triggers_a_single_run(monkeypatch):
+    cache.clear()
+    user = WhatsAppUser.objects.create(phone_number="573000000003")
+    conversation = Conversation.objects.create(user=user, thread_id="thread_1")
+    scheduled, dispatched = [], []
+    monkeypatch.setattr(tasks.run_debounced_assistant, "apply_async", lambda args, countdown: scheduled.append(args))
+    monkeypatch.setattr(tasks, "dispatch_assistant_run", lambda *args: dispatched.append(args))
+    manager = SimpleNamespace(mark_run_active=lambda thread_id: None)
+
+    for _ in range(3):
+        tasks.schedule_assistant_run(user, conversation, "asst_1", manager)
+
+    for args in scheduled:
+        tasks.run_debounced_assistant(*args)
+
+    assert len(scheduled) == 3
+    assert len(dispatched) == 1
+    assert get_counter("debounce:coalesced") == 2
+
+
+def test_cancel_active_run_marks_run_as_superseded():
+    cache.clear()
+    statuses = iter(["cancelling", "cancelled"])
+    cancelled = []
+    runs = SimpleNamespace(
+        list=lambda **kwargs: SimpleNamespace(data=[SimpleNamespace(id="run_1", status="in_progress")]),
+        cancel=lambda thread_id, run_id: cancelled.append(run_id),
+        retrieve=lambda thread_id, run_id: SimpleNamespace(status=next(statuses)),
+    )
+    manager = AssistantManager.__new__(AssistantManager)
+    manager.client = SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(runs=runs)))
+
+    # Sin run marcado como activo no se consulta OpenAI
+    assert manager.cancel_active_run("thread_1") is None
+
+    manager.mark_run_active("thread_1")
+    assert manager.cancel_active_run("thread_1") == "run_1"
+    assert cancelled == ["run_1"]
+    assert AssistantManager.is_run_superseded("run_1")
+    assert manager.cancel_active_run("thread_1") is None
+
+
+def test_answer_cache_keys_on_intent_and_data_version(settings):
+    cache.clear()
+    settings.ANSWER_CACHE_TYPES = ["PREDICTIONS"]
+    assert answer_cache.normalize_intent("¿Quién gana el partido?") == answer_cache.normalize_intent("quien gana partido")
+
+    key = answer_cache.build_key("PREDICTIONS", "2002", "¿Quién gana el partido?")
+    assert answer_cache.build_key("GENERAL", "2002", "¿Quién gana el partido?") is None
+    assert answer_cache.lookup(key) is None
+
+    # Respuestas a una ráfaga de mensajes o con el nombre de quien preguntó no se guardan
+    answer_cache.remember_pending(1, key, ["Camilo Andrés"])
+    answer_cache.remember_pending(1, None, ["Camilo Andrés"])
+    answer_cache.store_pending(1, "Gana el local", total_tokens=900)
+    answer_cache.remember_pending(1, key, ["Camilo Andrés", None])
+    answer_cache.store_pending(1, "Andres, gana el local", total_tokens=900)
+    assert answer_cache.lookup(key) is None
+
+    answer_cache.remember_pending(1, key, ["Camilo Andrés"])
+    answer_cache.store_pending(1, "Gana el local", total_tokens=900)
+    assert answer_cache.lookup(answer_cache.build_key("PREDICTIONS", "2002", "quien gana partido")) == "Gana el local"
+
+    # Nuevos datos del partido invalidan la respuesta
+    cache.set("live_payload:compact:2002", '{"score": [1, 0]}')
+    assert answer_cache.lookup(answer_cache.build_key("PREDICTIONS", "2002", "quien gana partido")) is None
+
+    status = answer_cache.get_answer_cache_status()
+    assert (status["hits"], status["misses"], status["tokens_saved"], status["personalized"]) == (1, 3, 900, 1)
+
+
+def _history(conversation, count):
+    start = timezone.now() - timedelta(minutes=count)
+    for index in range(count):
+        Message.objects.create(
+            conversation=conversation, is_from_user=index % 2 == 0, content=f"mensaje {index}",
+            created_at=start + timedelta(minutes=index),
+        )
+
+
+def test_managed_context_sends_summary_and_bounded_window(settings):
+    settings.MANAGED_CONTEXT_TYPES = ["PREDICTIONS"]
+    settings.CONTEXT_WINDOW_MESSAGES = 4
+    user = WhatsAppUser.objects.create(phone_number="573000000004")
+    conversation = Conversation.objects.create(
+        user=user, thread_id="thread_1", fixture_id="2002", conversation_type="PREDICTIONS",
+        context_summary="Le interesa el Medellín.",
+    )
+    _history(conversation, 9)
+    # El resumen ya incluye los mensajes 0 a 4
+    conversation.summary_until = conversation.messages.get(content="mensaje 4").created_at
+
+    messages = context_manager.build_context_messages(conversation, "Ana")
+
+    assert context_manager.is_managed(conversation)
+    assert "consultar_partido_en_vivo(2002)" in messages[0]["content"]
+    assert "Le interesa el Medellín." in messages[0]["content"]
+    # Cabecera + últimos 4 mensajes (el primero de la ventana es del asistente)
+    assert [message["role"] for message in messages] == ["user", "assistant", "user", "assistant", "user"]
+    assert messages[-1]["content"] == "mensaje 8"
+    assert all("Fecha de consulta" not in message["content"] for message in messages[1:])
+
+
+def test_messages_outside_the_window_are_sent_until_summarized(settings):
+    settings.MANAGED_CONTEXT_TYPES = ["PREDICTIONS"]
+    settings.CONTEXT_WINDOW_MESSAGES = 4
+    settings.CONTEXT_SUMMARY_BATCH = 3
+    user = WhatsAppUser.objects.create(phone_number="573000000006")
+    conversation = Conversation.objects.create(
+        user=user, thread_id="thread_1", conversation_type="PREDICTIONS", context_summary="Resumen",
+    )
+    _history(conversation, 9)
+    conversation.summary_until = conversation.messages.get(content="mensaje 2").created_at
+
+    # La ventana avanzó (mensajes 5 a 8) pero 3 y 4 aún no están resumidos: se envían también
+    assert context_manager.messages_pending_summary(conversation).count() == 2
+    history = "\n".join(message["content"] for message in context_manager.build_context_messages(conversation, "Ana"))
+    assert [f"mensaje {index}" in history for index in range(9)] == [False] * 3 + [True] * 6
+
+    # Sin resumen, el historial enviado se limita a ventana + lote
+    conversation.summary_until = None
+    history = "\n".join(message["content"] for message in context_manager.build_context_messages(conversation, "Ana"))
+    assert [f"mensaje {index}" in history for index in range(9)] == [False] * 2 + [True] * 7
+
+
+def test_summary_refresh_consumes_messages_outside_window(settings):
+    settings.MANAGED_CONTEXT_TYPES = ["PREDICTIONS"]
+    settings.CONTEXT_WINDOW_MESSAGES = 4
+    settings.CONTEXT_SUMMARY_BATCH = 3
+    user = WhatsAppUser.objects.create(phone_number="573000000005")
+    conversation = Conversation.objects.create(user=user, thread_id="thread_1", conversation_type="PREDICTIONS")
+    _history(conversation, 9)
+    prompts = []
+
+    def create(**kwargs):
+        prompts.append(kwargs["messages"][1]["content"])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=" Resumen nuevo "))])
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    assert context_manager.messages_pending_summary(conversation).count() == 5
+    assert context_manager.refresh_summary(conversation, client) == 5
+    assert "mensaje 0" in prompts[0] and "mensaje 5" not in prompts[0]
+    conversation.refresh_from_db()
+    assert conversation.context_summary == "Resumen nuevo"
+    assert context_manager.refresh_summary(conversation, client) is None
+
+
+def test_plan_lanes_route_by_plan_and_cap_openai_slots(settings):
+    cache.clear()
+    settings.ASSISTANT_OPENAI_CONCURRENCY = 6
+    settings.PLAN_LANE_WEIGHTS = {"pro": 3, "premium": 2, "free": 1}
+    WhatsAppUser.objects.create(
+        phone_number="573000000006", subscription_plan="pro",
+        subscription_expiry=timezone.now() + timedelta(days=30),
+    )
+    WhatsAppUser.objects.create(phone_number="573000000007", subscription_plan="pro")
+
+    route = plan_lanes.route_to_lane
+    assert route("deep90_app.apps.whatsapp.tasks.process_whatsapp_message", [{"wa_id": "573000000006"}, {}], {}, {}) == {"queue": "inbound_pro"}
+    # Suscripción vencida y usuarios desconocidos van al carril gratuito
+    assert route("deep90_app.apps.whatsapp.tasks.stream_assistant_run", ["573000000007", 1, "t", "a"], {}, {}) == {"queue": "inbound_free"}
+    assert route("deep90_app.apps.whatsapp.tasks.run_debounced_assistant", ["573009999999", 1, "a", 1, 0], {}, {}) == {"queue": "inbound_free"}
+    assert route("deep90_app.apps.whatsapp.tasks.process_assistant_run", ["573000000007", 1, "t", "r"], {}, {}) is None
+
+    assert [plan_lanes.get_plan_capacity(plan) for plan in ("pro", "premium", "free")] == [3, 2, 1]
+    free_slot = plan_lanes.acquire_slot("free")
+    assert free_slot
+    assert plan_lanes.acquire_slot("free") is None
+    assert plan_lanes.acquire_slot("pro")
+    plan_lanes.release_slot(free_slot)
+    assert plan_lanes.acquire_slot("free")
+
+    plan_lanes.record_queue_wait("inbound_pro", time.time() - 0.5)
+    status = plan_lanes.get_lane_status()
+    assert status["free"]["deferred"] == 1
+    assert status["pro"]["in_flight"] == 1
+    assert status["pro"]["queue_wait"]["samples"] == 1
+
+
+def test_runs_ending_without_reply_release_their_lane_slot(settings, monkeypatch):
+    cache.clear()
+    settings.ASSISTANT_OPENAI_CONCURRENCY = 3
+    settings.PLAN_LANE_WEIGHTS = {"pro": 1, "premium": 1, "free": 1}
+    user = WhatsAppUser.objects.create(phone_number="573000000009")
+    conversation = Conversation.objects.create(user=user, thread_id="thread_9")
+    notified = []
+    superseded = {"run_old"}
+    monkeypatch.setattr(tasks, "notify_assistant_failure", lambda phone, *args: notified.append(phone))
+    monkeypatch.setattr(tasks, "AssistantManager", lambda: SimpleNamespace(
+        is_run_superseded=lambda run_id: run_id in superseded,
+        check_run_status=lambda thread_id, run_id: SimpleNamespace(status="cancelled"),
+    ))
+    entry = {"user_phone": user.phone_number, "conversation_id": conversation.id, "thread_id": "thread_9", "requested_at": 0}
+
+    def assert_slot_released():
+        # El carril gratuito tiene una sola plaza: otro run solo entra si se liberó
+        other = plan_lanes.acquire_slot("free")
+        assert other
+        plan_lanes.release_slot(other)
+
+    slot = plan_lanes.acquire_slot("free")
+    assert plan_lanes.acquire_slot("free") is None
+    tasks.handle_tracked_run_event("failed", {**entry, "run_id": "run_failed", "slot": slot})
+    assert_slot_released()
+
+    slot = plan_lanes.acquire_slot("free")
+    tasks.process_assistant_run(user.phone_number, conversation.id, "thread_9", "run_old", 0, slot)
+    assert_slot_released()
+
+    monkeypatch.setattr(tasks, "dispatch_assistant_run", lambda *args: 1 / 0)
+    cache.set(tasks.DEBOUNCE_KEY.format(conversation_id=conversation.id), 1)
+    assert not tasks.run_debounced_assistant(user.phone_number, conversation.id, "asst_1", 1, 0)["success"]
+    assert_slot_released()
+    assert notified == [user.phone_number, user.phone_number]
+
+
+def test_superseded_run_does_not_release_the_slot_of_its_replacement(settings, monkeypatch):
+    cache.clear()
+    settings.ASSISTANT_OPENAI_CONCURRENCY = 2
+    settings.PLAN_LANE_WEIGHTS = {"pro": 0, "premium": 0, "free": 1}
+    user = WhatsAppUser.objects.create(phone_number="573000000051")
+    conversation = Conversation.objects.create(user=user, thread_id="thread_51")
+    monkeypatch.setattr(tasks, "AssistantManager", lambda: SimpleNamespace(is_run_superseded=lambda run_id: run_id == "run_old"))
+
+    # El tracker detecta la cancelación del run viejo cuando el de reemplazo ya ocupa su plaza
+    old_slot = plan_lanes.acquire_slot("free")
+    new_slot = plan_lanes.acquire_slot("free")
+    tasks.handle_tracked_run_event("failed", {
+        "user_phone": user.phone_number, "conversation_id": conversation.id, "thread_id": "thread_51",
+        "run_id": "run_old", "requested_at": 0, "slot": old_slot,
+    })
+    assert plan_lanes.acquire_slot("free")
+    assert plan_lanes.acquire_slot("free") is None
+    plan_lanes.release_slot(new_slot)
+    assert plan_lanes.acquire_slot("free")
+
+
+def test_new_conversation_waits_for_a_free_lane_slot(settings, monkeypatch):
+    cache.clear()
+    settings.ASSISTANT_OPENAI_CONCURRENCY = 3
+    settings.PLAN_LANE_WEIGHTS = {"pro": 1, "premium": 1, "free": 1}
+    WhatsAppUser.objects.create(phone_number="573000000052")
+    logged, retried, started = [], [], []
+    monkeypatch.setattr(tasks, "WhatsAppService", lambda: SimpleNamespace(log_message=lambda *args, **kwargs: logged.append(args[4])))
+    monkeypatch.setattr(tasks, "AssistantManager", lambda: SimpleNamespace())
+    monkeypatch.setattr(tasks, "create_new_conversation", lambda user, manager, service, slot=None: started.append(slot))
+    monkeypatch.setattr(tasks.process_whatsapp_message, "apply_async", lambda args, countdown: retried.append(args))
+    contact = {"wa_id": "573000000052", "profile": {"name": "Ana"}}
+    message = {
+        "id": "wamid.52", "type": "interactive", "timestamp": "1700000000",
+        "interactive": {"type": "list_reply", "list_reply": {"id": "assistant"}},
+    }
+    inbound_queue.push("573000000052", contact, message)
+
+    # Con el carril gratuito lleno el mensaje sigue pendiente y se reintenta
+    busy = plan_lanes.acquire_slot("free")
+    assert tasks.process_whatsapp_message(contact) == 0
+    assert retried == [[contact]]
+    assert inbound_queue.has_pending("573000000052")
+    assert started == []
+
+    plan_lanes.release_slot(busy)
+    assert tasks.process_whatsapp_message(contact) == 1
+    assert len(started) == 1 and started[0]
+    assert not inbound_queue.has_pending("573000000052")
+    # El reintento no vuelve a registrar ni a contar el mensaje
+    assert logged == ["wamid.52"]
+    assert daily_limits.get_count("573000000052") == 1
+
+
+def test_outbound_sequencer_paces_steps_without_sleeping(settings, monkeypatch):
+    cache.clear()
+    settings.OUTBOUND_STEP_DELAY = 1.0
+    scheduled, sent = [], []
+    monkeypatch.setattr(tasks.deliver_outbound_step, "apply_async", lambda args, countdown: scheduled.append((args, countdown)))
+    monkeypatch.setattr(tasks, "WhatsAppService", lambda: SimpleNamespace(display_main_menu=lambda phone: sent.append(phone)))
+
+    outbound.send_paced("573000000008", "display_main_menu")
+    outbound.send_paced("573000000008", "send_text_message", "Hola")
+    outbound.send_paced("573000000009", "display_main_menu")
+    with pytest.raises(ValueError):
+        outbound.send_paced("573000000008", "delete_account")
+
+    countdowns = [round(countdown) for _, countdown in scheduled]
+    # Los pasos de un mismo usuario se espacian; los de otro usuario no esperan
+    assert countdowns == [1, 2, 1]
+    assert scheduled[1][0] == ["573000000008", "send_text_message", ["Hola"]]
+
+    tasks.deliver_outbound_step(*scheduled[0][0])
+    assert sent == ["573000000008"]
+    assert outbound.get_outbound_status() == {"paced": 3, "delivered": 1, "failed": 0}
+
+
+def test_inbound_messages_of_a_user_are_processed_in_order_by_one_worker():
+    cache.clear()
+    contact = {"wa_id": "573000000010"}
+    handled = []
+
+    def handler(contact_data, message_data):
+        handled.append(message_data["id"])
+        if message_data["id"] == "m1":
+            # Mientras el primer worker procesa m1 llegan m3 y m2 (desordenados) a otros workers
+            for message in ({"id": "m3", "timestamp": "103"}, {"id": "m2", "timestamp": "102"}):
+                inbound_queue.push("573000000010", contact, message)
+                assert inbound_queue.drain("573000000010", handler) == 0
+            # Otro usuario no espera
+            inbound_queue.push("573000000011", {"wa_id": "573000000011"}, {"id": "x1"})
+            assert inbound_queue.drain("573000000011", handler) == 1
+
+    inbound_queue.push("573000000010", contact, {"id": "m1", "timestamp": "101"})
+    assert inbound_queue.drain("573000000010", handler) == 3
+    assert handled == ["m1", "x1", "m2", "m3"]
+    assert not inbound_queue.has_pending("573000000010")
+    assert not inbound_queue.is_being_processed("573000000010")
+    assert inbound_queue.get_inbound_status() == {"handed_off": 2, "recovered": 0}
+
+
+def test_inbound_burst_in_the_same_second_keeps_arrival_order():
+    cache.clear()
+    contact = {"wa_id": "573000000013"}
+    for wamid in ("wamid.ZZZ", "wamid.AAA", "wamid.MMM"):
+        inbound_queue.push("573000000013", contact, {"id": wamid, "timestamp": "1700000000"})
+    # Un mensaje de un segundo anterior entregado después sigue yendo primero
+    inbound_queue.push("573000000013", contact, {"id": "wamid.OLD", "timestamp": "1699999999"})
+
+    handled = []
+    inbound_queue.drain("573000000013", lambda contact_data, message_data: handled.append(message_data["id"]))
+    assert handled == ["wamid.OLD", "wamid.ZZZ", "wamid.AAA", "wamid.MMM"]
+
+
+def test_inbound_message_survives_a_worker_crash_and_is_recovered(monkeypatch):
+    cache.clear()
+    contact = {"wa_id": "573000000012"}
+    inbound_queue.push("573000000012", contact, {"id": "c1", "timestamp": "101"})
+
+    def crash(contact_data, message_data):
+        raise SystemExit("worker muerto")
+
+    with pytest.raises(SystemExit):
+        inbound_queue.drain("573000000012", crash)
+    assert inbound_queue.has_pending("573000000012")
+
+    # Un lock ajeno no se libera con otro token
+    token = redis_store.acquire_lock(inbound_queue.PROCESSING_KEY.format(wa_id="573000000012"), 60)
+    assert not redis_store.release_lock(inbound_queue.PROCESSING_KEY.format(wa_id="573000000012"), "otro")
+    assert inbound_queue.get_stalled_users() == []
+    redis_store.release_lock(inbound_queue.PROCESSING_KEY.format(wa_id="573000000012"), token)
+
+    handled = []
+    monkeypatch.setattr(tasks, "handle_whatsapp_message", lambda contact_data, message_data: handled.append(message_data["id"]))
+    monkeypatch.setattr(tasks.process_whatsapp_message, "delay", lambda contact_data: tasks.process_whatsapp_message(contact_data))
+    assert tasks.drain_stalled_users() == {"success": True, "recovered": 1}
+    assert handled == ["c1"]
+    assert inbound_queue.get_stalled_users() == []
+    assert inbound_queue.get_inbound_status()["recovered"] == 1
+
+
+def test_webhook_fast_path_validates_signature_and_enqueues_raw_payload(client, settings, monkeypatch):
+    settings.WHATSAPP_APP_SECRET = "secreto"
+    enqueued, dispatched = [], []
+    monkeypatch.setattr(tasks.receive_whatsapp_webhook, "delay", lambda *args: enqueued.append(args))
+    monkeypatch.setattr(tasks.process_whatsapp_message, "delay", lambda contact: dispatched.append(inbound_queue.peek(contact["wa_id"])[2]["id"]))
+    body = json.dumps(benchmark_webhook.build_payload(1)).encode("utf-8")
+    signature = hmac.new(b"secreto", body, hashlib.sha256).hexdigest()
+
+    url = reverse("whatsapp:webhook")
+    assert client.post(url, data=body, content_type="application/json", HTTP_X_HUB_SIGNATURE_256="sha256=malo").status_code == 403
+    response = client.post(url, data=body, content_type="application/json", HTTP_X_HUB_SIGNATURE_256=f"sha256={signature}")
+    assert response.status_code == 200
+    message_id = json.loads(body)["entry"][0]["changes"][0]["value"]["messages"][0]["id"]
+    assert enqueued == [(body.decode("utf-8"), [message_id])]
+    # La vista no toca la base de datos: el usuario y el registro del mensaje se crean en el worker
+    assert not WhatsAppUser.objects.exists()
+
+    tasks.receive_whatsapp_webhook(*enqueued[0])
+    assert dispatched == [message_id]
+
+
+def test_webhook_retries_are_dropped_at_the_edge_and_in_the_worker(client, settings, monkeypatch):
+    cache.clear()
+    settings.WHATSAPP_APP_SECRET = ""
+    enqueued, handled = [], []
+    monkeypatch.setattr(tasks.receive_whatsapp_webhook, "delay", lambda *args: enqueued.append(args))
+    monkeypatch.setattr(tasks, "handle_whatsapp_message", lambda contact, message: handled.append(message["id"]))
+    payload = benchmark_webhook.build_payload(2)
+    body = json.dumps(payload)
+
+    for _ in range(3):
+        assert client.post(reverse("whatsapp:webhook"), data=body, content_type="application/json").status_code == 200
+    assert len(enqueued) == 1
+
+    # Un reintento que llega cuando Redis ya olvidó el ID se descarta por la clave única
+    contact = payload["entry"][0]["changes"][0]["value"]["contacts"][0]
+    message = payload["entry"][0]["changes"][0]["value"]["messages"][0]
+    monkeypatch.setattr(tasks.process_whatsapp_message, "delay", lambda contact_data: tasks.process_whatsapp_message(contact_data))
+    tasks.enqueue_inbound_message(contact, message)
+    tasks.enqueue_inbound_message(contact, message)
+    assert handled == [message["id"]]
+    assert dedup.get_dedup_status() == {"edge_hits": 2, "db_hits": 1}
+
+
+def test_daily_counter_counts_in_redis_and_reconciles_with_database(settings):
+    cache.clear()
+    settings.DAILY_MESSAGES_LIMIT = 3
+    WhatsAppUser.objects.create(phone_number="573000000020")
+    for index in range(3):
+        WhatsAppService().log_message("573000000020", f"hola {index}", "text", True, f"wamid.{index}")
+        count = daily_limits.record_message("573000000020")
+    assert count == 3
+    assert daily_limits.has_reached_limit(daily_limits.get_count("573000000020"))
+    assert daily_limits.get_count("573000000021") == 0
+    # La clave es del día local y expira a la medianoche de TIME_ZONE
+    assert 0 < daily_limits._ttl() <= 24 * 3600 + 60
+
+    # Si Redis pierde el contador, la reconciliación lo recupera de los mensajes registrados
+    cache.clear()
+    assert daily_limits.get_count("573000000020") == 0
+    assert daily_limits.reconcile() == 1
+    assert daily_limits.get_count("573000000020") == 3
+    assert daily_limits.reconcile() == 0
+
+
+def test_user_profile_cache_skips_database_and_is_invalidated_on_changes(
+    django_assert_num_queries, django_capture_on_commit_callbacks,
+):
+    cache.clear()
+    whatsapp_user, created = user_cache.get_or_create_user("573000000030", defaults={"profile_name": "Ana"})
+    assert created
+    user_cache.get_assistant_config("573000000030")
+
+    with django_assert_num_queries(0):
+        whatsapp_user, created = user_cache.get_or_create_user("573000000030")
+        assert not created and whatsapp_user.profile_name == "Ana"
+        assert user_cache.get_assistant_config("573000000030") is None
+        # Otro proceso sin la entrada en memoria la encuentra en Redis
+        user_cache.clear_local()
+        assert plan_lanes.get_plan("573000000030") == "free"
+    # La marca de última actividad no invalida el perfil
+    whatsapp_user.update_last_activity()
+    with django_assert_num_queries(0):
+        user_cache.get_user("573000000030")
+
+    # Las acciones del admin usan update() y descartan el perfil explícitamente al hacer commit
+    user_admin = WhatsAppUserAdmin(WhatsAppUser, None)
+    with django_capture_on_commit_callbacks(execute=True):
+        user_admin.set_subscription_pro(None, WhatsAppUser.objects.filter(phone_number="573000000030"))
+        user_admin.mark_as_banned(None, WhatsAppUser.objects.filter(phone_number="573000000030"))
+    cached = user_cache.get_user("573000000030")
+    assert cached.is_blacklisted and cached.subscription_plan == "pro"
+
+    # Guardar la configuración del asistente (vistas de Flow) invalida la entrada al hacer commit
+    assert user_cache.get_assistant_config("573000000030") is None
+    with django_capture_on_commit_callbacks(execute=True):
+        AssistantConfig.objects.create(user=cached, assistant_name="Messi")
+        assert user_cache.get_assistant_config("573000000030") is None
+    assert user_cache.get_assistant_config("573000000030").assistant_name == "Messi"
+    with pytest.raises(WhatsAppUser.DoesNotExist):
+        user_cache.get_user("573000000031")
+
+
+def test_webhook_releases_claimed_ids_when_the_enqueue_fails(client, settings, monkeypatch):
+    cache.clear()
+    settings.WHATSAPP_APP_SECRET = ""
+    enqueued = []
+
+    def broker_down(*args):
+        raise ConnectionError("broker no disponible")
+
+    monkeypatch.setattr(tasks.receive_whatsapp_webhook, "delay", broker_down)
+    body = json.dumps(benchmark_webhook.build_payload(3))
+    url = reverse("whatsapp:webhook")
+    assert client.post(url, data=body, content_type="application/json").status_code == 503
+
+    # El reintento de Meta no se descarta como duplicado
+    monkeypatch.setattr(tasks.receive_whatsapp_webhook, "delay", lambda *args: enqueued.append(args))
+    assert client.post(url, data=body, content_type="application/json").status_code == 200
+    assert len(enqueued) == 1
+    assert dedup.get_dedup_status()["edge_hits"] == 0
+
+
+def test_new_assistant_conversation_starts_with_one_create_and_run_call(monkeypatch):
+    cache.clear()
+    whatsapp_user = WhatsAppUser.objects.create(phone_number="573000000040", profile_name="Luis")
+    calls, watched, sent = [], [], []
+    manager = SimpleNamespace(
+        get_assistant_for_user=lambda user, conversation_type: "asst_general",
+        create_thread_and_run=lambda assistant_id, messages, user_info: calls.append(messages) or ("thread_9", "run_9"),
+    )
+    monkeypatch.setattr(tasks, "watch_assistant_run", lambda *args: watched.append(args[:4]))
+
+    conversation = tasks.create_new_conversation(
+        whatsapp_user, manager, SimpleNamespace(send_text_message=lambda phone, text: sent.append(phone))
+    )
+    assert len(calls) == 1 and "Luis" in calls[0][0]
+    assert conversation.thread_id == "thread_9"
+    assert watched == [("573000000040", conversation.id, "thread_9", "run_9")]
+    assert sent == ["573000000040"]
+
+
+def test_user_message_is_committed_before_openai_calls(monkeypatch):
+    cache.clear()
+    whatsapp_user = WhatsAppUser.objects.create(phone_number="573000000041")
+    conversation = Conversation.objects.create(user=whatsapp_user, thread_id="thread_41", is_active=True)
+    sent = []
+
+    def openai_down(thread_id):
+        raise ConnectionError("OpenAI no disponible")
+
+    monkeypatch.setattr(tasks, "AssistantManager", lambda: SimpleNamespace(cancel_active_run=openai_down))
+    monkeypatch.setattr(tasks, "WhatsAppService", lambda: SimpleNamespace(send_text_message=lambda phone, text: sent.append(phone)))
+
+    with pytest.raises(ConnectionError):
+        tasks.process_text_message(whatsapp_user, "wamid.41", "¿Cómo va el partido?")
+    # El fallo de OpenAI no revierte el mensaje ya guardado
+    assert Message.objects.filter(conversation=conversation, message_id="wamid.41").exists()
+    assert sent == ["573000000041"]
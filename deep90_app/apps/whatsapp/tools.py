@@ -0,0 +1,420 @@
+"""
+Registro de herramientas (function calling) del asistente.
+
+Cada herramienta declara su esquema de argumentos (JSON Schema, el mismo que se
+registra en OpenAI), el tiempo de vida de su caché de resultados y la función
+que la implementa. Las llamadas independientes de un mismo ``requires_action``
+se ejecutan en paralelo y se registra la latencia de cada herramienta.
+"""
+import hashlib
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from deep90_app.apps.sports_data.models import FixtureData, LiveFixtureData, StandingData
+
+from .metrics import get_counter, get_latency_summary, increment, record_latency
+
+logger = logging.getLogger(__name__)
+
+# Estados de partido finalizado
+FINISHED_STATUSES = ['FT', 'AET', 'PEN', 'AWD', 'WO']
+
+# Claves de caché de resultados y nombres de las métricas (contadores y latencias de metrics.py)
+TOOL_RESULT_KEY = "assistant_tool:{name}:{digest}"
+TOOL_METRIC = "tools:{name}:{metric}"
+
+JSON_TYPES = {
+    'integer': int,
+    'number': (int, float),
+    'string': str,
+    'boolean': bool,
+}
+
+
+@dataclass
+class Tool:
+    """Definición de una herramienta del asistente."""
+    name: str
+    description: str
+    func: Callable[..., Any]
+    parameters: Dict[str, Any] = field(default_factory=lambda: {'type': 'object', 'properties': {}})
+    cache_ttl: int = 0
+
+    def validate(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Valida y normaliza los argumentos según el esquema declarado.
+
+        Convierte cadenas numéricas a enteros cuando el esquema lo pide (el modelo
+        a veces envía "1234" en lugar de 1234) y descarta argumentos desconocidos.
+
+        Args:
+            arguments: Argumentos recibidos del modelo
+
+        Returns:
+            Argumentos validados
+
+        Raises:
+            ValueError: Si falta un argumento requerido o su tipo no es válido
+        """
+        properties = self.parameters.get('properties', {})
+        missing = [name for name in self.parameters.get('required', []) if arguments.get(name) is None]
+        if missing:
+            raise ValueError(f"Faltan argumentos requeridos: {', '.join(missing)}")
+
+        validated = {}
+        for name, value in arguments.items():
+            if name not in properties or value is None:
+                continue
+            expected = properties[name].get('type')
+            if expected in ('integer', 'number') and isinstance(value, str):
+                try:
+                    value = int(value) if expected == 'integer' else float(value)
+                except ValueError as e:
+                    raise ValueError(f"El argumento '{name}' debe ser numérico") from e
+            if expected in JSON_TYPES and not isinstance(value, JSON_TYPES[expected]):
+                raise ValueError(f"El argumento '{name}' debe ser de tipo {expected}")
+            validated[name] = value
+        return validated
+
+    def as_openai_tool(self) -> Dict[str, Any]:
+        """Definición de la herramienta en el formato de OpenAI."""
+        return {
+            'type': 'function',
+            'function': {
+                'name': self.name,
+                'description': self.description,
+                'parameters': self.parameters,
+            }
+        }
+
+
+TOOL_REGISTRY: Dict[str, Tool] = {}
+
+
+def register_tool(name: str, description: str, parameters: Optional[Dict[str, Any]] = None, cache_ttl: int = 0):
+    """
+    Decorador para registrar una función como herramienta del asistente.
+
+    Args:
+        name: Nombre de la función expuesto al modelo
+        description: Descripción para el modelo
+        parameters: JSON Schema de los argumentos
+        cache_ttl: Segundos que se reutiliza el resultado para los mismos argumentos (0 = sin caché)
+    """
+    def decorator(func):
+        TOOL_REGISTRY[name] = Tool(
+            name=name,
+            description=description,
+            func=func,
+            parameters=parameters or {'type': 'object', 'properties': {}},
+            cache_ttl=cache_ttl,
+        )
+        return func
+    return decorator
+
+
+def _record_latency(name: str, elapsed_ms: float, cached: bool) -> None:
+    """
+    Registra una llamada a una herramienta.
+
+    Las llamadas paralelas de un mismo ``requires_action`` escriben a la vez, así
+    que cada valor es un contador atómico (``cache.incr``) y la latencia una
+    muestra de la ventana de metrics.py, sin leer y reescribir un diccionario.
+    """
+    increment(TOOL_METRIC.format(name=name, metric='calls'))
+    if cached:
+        increment(TOOL_METRIC.format(name=name, metric='cache_hits'))
+    # Microsegundos: los contadores son enteros
+    increment(TOOL_METRIC.format(name=name, metric='total_us'), int(elapsed_ms * 1000))
+    record_latency(TOOL_METRIC.format(name=name, metric='latency'), elapsed_ms / 1000)
+
+
+def get_tool_metrics() -> Dict[str, Dict[str, Any]]:
+    """
+    Obtiene las métricas de latencia por herramienta.
+
+    Returns:
+        Diccionario {herramienta: {calls, cache_hits, avg_ms, max_ms}} (max_ms sobre
+        las últimas muestras)
+    """
+    metrics = {}
+    for name in TOOL_REGISTRY:
+        calls = get_counter(TOOL_METRIC.format(name=name, metric='calls'))
+        if not calls:
+            continue
+        latency = get_latency_summary(TOOL_METRIC.format(name=name, metric='latency')) or {}
+        metrics[name] = {
+            'calls': calls,
+            'cache_hits': get_counter(TOOL_METRIC.format(name=name, metric='cache_hits')),
+            'avg_ms': round(get_counter(TOOL_METRIC.format(name=name, metric='total_us')) / calls / 1000, 2),
+            'max_ms': round(latency.get('max', 0) * 1000, 2),
+        }
+    return metrics
+
+
+def execute_tool(name: str, arguments: Dict[str, Any]) -> str:
+    """
+    Ejecuta una herramienta registrada con validación, caché y medición de latencia.
+
+    Args:
+        name: Nombre de la herramienta
+        arguments: Argumentos enviados por el modelo
+
+    Returns:
+        Resultado como string (los errores se devuelven como texto para el modelo)
+    """
+    tool = TOOL_REGISTRY.get(name)
+    if tool is None:
+        return f"Error: Función '{name}' no implementada."
+
+    start = time.perf_counter()
+    cached = False
+    try:
+        arguments = tool.validate(arguments or {})
+        digest = hashlib.sha1(json.dumps(arguments, sort_keys=True, default=str).encode()).hexdigest()
+        key = TOOL_RESULT_KEY.format(name=name, digest=digest)
+
+        result = cache.get(key) if tool.cache_ttl else None
+        if result is not None:
+            cached = True
+        else:
+            result = tool.func(**arguments)
+            if not isinstance(result, str):
+                result = json.dumps(result, ensure_ascii=False, default=str)
+            if tool.cache_ttl:
+                cache.set(key, result, tool.cache_ttl)
+        return result
+    except Exception as e:
+        logger.error(f"Error al ejecutar función {name}: {e}")
+        return f"Error al ejecutar {name}: {str(e)}"
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        _record_latency(name, elapsed_ms, cached)
+        logger.info(f"Herramienta {name} ejecutada en {elapsed_ms:.1f} ms{' (caché)' if cached else ''}")
+
+
+def _execute_in_thread(name: str, arguments: Dict[str, Any]) -> str:
+    """Ejecuta una herramienta en un hilo del pool cerrando su conexión a la base de datos al final."""
+    try:
+        return execute_tool(name, arguments)
+    finally:
+        close_old_connections()
+
+
+def execute_tool_calls(tool_calls) -> List[Dict[str, str]]:
+    """
+    Ejecuta en paralelo las llamadas a herramientas de un ``requires_action``.
+
+    Args:
+        tool_calls: Lista de tool calls de OpenAI
+
+    Returns:
+        Lista de tool outputs ({tool_call_id, output}) en el mismo orden
+    """
+    calls = []
+    for tool_call in tool_calls:
+        try:
+            arguments = json.loads(tool_call.function.arguments or '{}')
+        except json.JSONDecodeError:
+            arguments = {}
+        calls.append((tool_call.id, tool_call.function.name, arguments))
+
+    if len(calls) == 1:
+        outputs = [execute_tool(calls[0][1], calls[0][2])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(len(calls), settings.ASSISTANT_TOOL_WORKERS)) as executor:
+            outputs = list(executor.map(lambda call: _execute_in_thread(call[1], call[2]), calls))
+
+    return [
+        {"tool_call_id": tool_call_id, "output": output}
+        for (tool_call_id, _, _), output in zip(calls, outputs)
+    ]
+
+
+def get_openai_tool_definitions() -> List[Dict[str, Any]]:
+    """Definiciones de todas las herramientas registradas en el formato de OpenAI."""
+    return [tool.as_openai_tool() for tool in TOOL_REGISTRY.values()]
+
+
+def _fixture_summary(fixture) -> Dict[str, Any]:
+    """Resumen compacto de un partido (FixtureData o LiveFixtureData)."""
+    return {
+        'fixture_id': fixture.fixture_id,
+        'date': fixture.date.isoformat() if fixture.date else None,
+        'league': fixture.league_name,
+        'country': fixture.league_country,
+        'home': fixture.home_team_name,
+        'away': fixture.away_team_name,
+        'score': [fixture.home_goals, fixture.away_goals],
+        'status': fixture.status_short,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Herramientas
+# ---------------------------------------------------------------------------
+
+@register_tool(
+    name="consultar_partido_en_vivo",
+    description="Consulta el estado en tiempo real de un partido en vivo y sus cuotas.",
+    parameters={
+        'type': 'object',
+        'properties': {'fixture_id': {'type': 'integer', 'description': 'ID del partido'}},
+        'required': ['fixture_id'],
+    },
+    cache_ttl=5,
+)
+def consultar_partido_en_vivo_tool(fixture_id):
+    from .sports_service import consultar_partido_en_vivo
+    return consultar_partido_en_vivo(fixture_id)
+
+
+@register_tool(
+    name="get_live_match_results",
+    description="Lista los partidos que se están jugando ahora con su marcador y minuto.",
+    parameters={
+        'type': 'object',
+        'properties': {
+            'limit': {'type': 'integer', 'description': 'Máximo de partidos (por defecto 20)'},
+            'league_id': {'type': 'integer', 'description': 'Filtrar por liga'},
+        },
+    },
+    cache_ttl=30,
+)
+def get_live_match_results(limit=20, league_id=None):
+    fixtures = LiveFixtureData.objects.order_by('league_country', 'league_name')
+    if league_id:
+        fixtures = fixtures.filter(league_id=league_id)
+    return [
+        dict(_fixture_summary(fixture), elapsed=fixture.elapsed)
+        for fixture in fixtures[:limit]
+    ]
+
+
+@register_tool(
+    name="get_upcoming_fixtures",
+    description="Lista los próximos partidos programados, opcionalmente de una liga o equipo.",
+    parameters={
+        'type': 'object',
+        'properties': {
+            'days': {'type': 'integer', 'description': 'Días hacia adelante (por defecto 3)'},
+            'limit': {'type': 'integer', 'description': 'Máximo de partidos (por defecto 10)'},
+            'league_id': {'type': 'integer', 'description': 'Filtrar por liga'},
+            'team_id': {'type': 'integer', 'description': 'Filtrar por equipo'},
+        },
+    },
+    cache_ttl=300,
+)
+def get_upcoming_fixtures(days=3, limit=10, league_id=None, team_id=None):
+    now = timezone.now()
+    fixtures = FixtureData.objects.filter(date__gte=now, date__lte=now + timedelta(days=days)).order_by('date')
+    if league_id:
+        fixtures = fixtures.filter(league_id=league_id)
+    if team_id:
+        fixtures = fixtures.filter(Q(home_team_id=team_id) | Q(away_team_id=team_id))
+    return [_fixture_summary(fixture) for fixture in fixtures[:limit]]
+
+
+@register_tool(
+    name="get_standings",
+    description="Devuelve la tabla de posiciones de una liga.",
+    parameters={
+        'type': 'object',
+        'properties': {
+            'league_id': {'type': 'integer', 'description': 'ID de la liga'},
+            'season': {'type': 'integer', 'description': 'Temporada (por defecto la más reciente)'},
+        },
+        'required': ['league_id'],
+    },
+    cache_ttl=1800,
+)
+def get_standings(league_id, season=None):
+    standings = StandingData.objects.filter(league_id=league_id)
+    season = season or standings.order_by('-season').values_list('season', flat=True).first()
+    return [
+        {
+            'rank': row.rank, 'team_id': row.team_id, 'team': row.team_name, 'group': row.group,
+            'played': row.played, 'win': row.win, 'draw': row.draw, 'lose': row.lose,
+            'goals_diff': row.goals_diff, 'points': row.points, 'form': row.form,
+        }
+        for row in standings.filter(season=season).order_by('group', 'rank')
+    ]
+
+
+@register_tool(
+    name="get_team_form",
+    description="Devuelve la racha reciente de un equipo (G/E/P) con sus últimos resultados.",
+    parameters={
+        'type': 'object',
+        'properties': {
+            'team_id': {'type': 'integer', 'description': 'ID del equipo'},
+            'last': {'type': 'integer', 'description': 'Número de partidos (por defecto 5)'},
+        },
+        'required': ['team_id'],
+    },
+    cache_ttl=900,
+)
+def get_team_form(team_id, last=5):
+    fixtures = FixtureData.objects.filter(
+        Q(home_team_id=team_id) | Q(away_team_id=team_id),
+        status_short__in=FINISHED_STATUSES,
+    ).order_by('-date')[:last]
+
+    form = []
+    results = []
+    for fixture in fixtures:
+        is_home = fixture.home_team_id == team_id
+        scored, conceded = (fixture.home_goals, fixture.away_goals) if is_home else (fixture.away_goals, fixture.home_goals)
+        if scored is None or conceded is None:
+            continue
+        form.append('G' if scored > conceded else 'E' if scored == conceded else 'P')
+        results.append(_fixture_summary(fixture))
+
+    standing_form = StandingData.objects.filter(team_id=team_id).order_by('-season').values_list('form', flat=True).first()
+    return {'team_id': team_id, 'form': ''.join(form), 'standings_form': standing_form, 'results': results}
+
+
+@register_tool(
+    name="get_head_to_head",
+    description="Devuelve los enfrentamientos directos recientes entre dos equipos.",
+    parameters={
+        'type': 'object',
+        'properties': {
+            'team_a_id': {'type': 'integer', 'description': 'ID del primer equipo'},
+            'team_b_id': {'type': 'integer', 'description': 'ID del segundo equipo'},
+            'last': {'type': 'integer', 'description': 'Número de partidos (por defecto 5)'},
+        },
+        'required': ['team_a_id', 'team_b_id'],
+    },
+    cache_ttl=3600,
+)
+def get_head_to_head(team_a_id, team_b_id, last=5):
+    fixtures = FixtureData.objects.filter(
+        Q(home_team_id=team_a_id, away_team_id=team_b_id) | Q(home_team_id=team_b_id, away_team_id=team_a_id),
+        status_short__in=FINISHED_STATUSES,
+    ).order_by('-date')[:last]
+
+    summary = {'team_a_wins': 0, 'team_b_wins': 0, 'draws': 0}
+    results = []
+    for fixture in fixtures:
+        if fixture.home_goals is None or fixture.away_goals is None:
+            continue
+        if fixture.home_goals == fixture.away_goals:
+            summary['draws'] += 1
+        elif (fixture.home_goals > fixture.away_goals) == (fixture.home_team_id == team_a_id):
+            summary['team_a_wins'] += 1
+        else:
+            summary['team_b_wins'] += 1
+        results.append(_fixture_summary(fixture))
+    return dict(summary, results=results)
@@ -0,0 +1,181 @@
+"""
+Caché del perfil y los derechos (plan, expiración, lista negra) de cada usuario.
+
+Cada mensaje entrante necesita el ``WhatsAppUser`` y, en algunos flujos, su
+``AssistantConfig``. En lugar de consultarlos en la base de datos cada vez, se
+guarda una copia de sus campos en Redis (USER_CACHE_TTL) y, delante, en un LRU
+en memoria del proceso (USER_CACHE_LOCAL_TTL, USER_CACHE_LOCAL_SIZE), de modo
+que el camino habitual no lee el estado del usuario de la base de datos.
+
+Las entradas se descartan, una vez hecho el commit, al guardar el usuario o su
+configuración (señales en signals.py) y en las acciones del admin que usan
+``queryset.update``. La copia en memoria de otros procesos caduca como mucho
+USER_CACHE_LOCAL_TTL segundos después.
+"""
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import AssistantConfig, WhatsAppUser
+
+logger = logging.getLogger(__name__)
+
+PROFILE_KEY = "user_cache:profile:{phone}"
+CONFIG_KEY = "user_cache:config:{phone}"
+
+# Valor guardado para los usuarios sin AssistantConfig (None equivale a "no está en caché")
+NO_CONFIG = {}
+
+_local: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def _local_get(key: str) -> Optional[Any]:
+    with _local_lock:
+        entry = _local.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del _local[key]
+            return None
+        _local.move_to_end(key)
+        return value
+
+
+def _local_set(key: str, value: Any) -> None:
+    with _local_lock:
+        _local[key] = (time.monotonic() + settings.USER_CACHE_LOCAL_TTL, value)
+        _local.move_to_end(key)
+        while len(_local) > settings.USER_CACHE_LOCAL_SIZE:
+            _local.popitem(last=False)
+
+
+def _lookup(key: str) -> Optional[Any]:
+    """Busca una entrada primero en memoria y después en Redis."""
+    value = _local_get(key)
+    if value is not None:
+        return value
+    try:
+        value = cache.get(key)
+    except Exception as e:
+        logger.warning(f"No se pudo leer {key} de la caché: {str(e)}")
+        return None
+    if value is not None:
+        _local_set(key, value)
+    return value
+
+
+def _store(key: str, value: Any) -> None:
+    _local_set(key, value)
+    try:
+        cache.set(key, value, settings.USER_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"No se pudo guardar {key} en la caché: {str(e)}")
+
+
+def _snapshot(instance) -> Dict[str, Any]:
+    """Valores de los campos de una instancia, en el orden de sus columnas."""
+    return {field.attname: getattr(instance, field.attname) for field in instance._meta.concrete_fields}
+
+
+def _build(model, snapshot: Dict[str, Any]):
+    """Instancia del modelo a partir de una copia de sus campos (sin consultar la base de datos)."""
+    values = copy.deepcopy(snapshot)
+    return model.from_db(DEFAULT_DB_ALIAS, list(values), list(values.values()))
+
+
+def find_user(phone: str) -> Optional[WhatsAppUser]:
+    """
+    Usuario de WhatsApp desde la caché o, si no está, desde la base de datos.
+
+    Args:
+        phone: Teléfono (wa_id) del usuario
+
+    Returns:
+        WhatsAppUser o None si el usuario no existe
+    """
+    key = PROFILE_KEY.format(phone=phone)
+    snapshot = _lookup(key)
+    if snapshot is not None:
+        return _build(WhatsAppUser, snapshot)
+    whatsapp_user = WhatsAppUser.objects.filter(phone_number=phone).first()
+    if whatsapp_user:
+        _store(key, _snapshot(whatsapp_user))
+    return whatsapp_user
+
+
+def get_user(phone: str) -> WhatsAppUser:
+    """Como ``find_user``, pero lanza ``WhatsAppUser.DoesNotExist`` si el usuario no existe."""
+    whatsapp_user = find_user(phone)
+    if whatsapp_user is None:
+        raise WhatsAppUser.DoesNotExist(f"WhatsAppUser {phone} no existe")
+    return whatsapp_user
+
+
+def get_or_create_user(phone: str, defaults: Optional[Dict[str, Any]] = None) -> Tuple[WhatsAppUser, bool]:
+    """
+    Equivalente cacheado de ``WhatsAppUser.objects.get_or_create``.
+
+    Args:
+        phone: Teléfono (wa_id) del usuario
+        defaults: Valores para crear el usuario si no existe
+
+    Returns:
+        Tupla (usuario, creado)
+    """
+    whatsapp_user = find_user(phone)
+    if whatsapp_user is not None:
+        return whatsapp_user, False
+    whatsapp_user, created = WhatsAppUser.objects.get_or_create(phone_number=phone, defaults=defaults or {})
+    _store(PROFILE_KEY.format(phone=phone), _snapshot(whatsapp_user))
+    return whatsapp_user, created
+
+
+def get_assistant_config(phone: str) -> Optional[AssistantConfig]:
+    """
+    Configuración del asistente del usuario, cacheada también cuando no existe.
+
+    Args:
+        phone: Teléfono (wa_id) del usuario
+
+    Returns:
+        AssistantConfig o None si el usuario no la ha configurado
+    """
+    key = CONFIG_KEY.format(phone=phone)
+    snapshot = _lookup(key)
+    if snapshot is None:
+        config = AssistantConfig.objects.filter(user_id=phone).first()
+        snapshot = _snapshot(config) if config else NO_CONFIG
+        _store(key, snapshot)
+    return _build(AssistantConfig, snapshot) if snapshot else None
+
+
+def invalidate(phone: str) -> None:
+    """Descarta el perfil y la configuración cacheados de un usuario."""
+    invalidate_many([phone])
+
+
+def invalidate_many(phones: Iterable[str]) -> None:
+    """Descarta el perfil y la configuración cacheados de varios usuarios."""
+    keys = [key.format(phone=phone) for phone in phones for key in (PROFILE_KEY, CONFIG_KEY)]
+    with _local_lock:
+        for key in keys:
+            _local.pop(key, None)
+    try:
+        cache.delete_many(keys)
+    except Exception as e:
+        logger.warning(f"No se pudo invalidar la caché de usuarios: {str(e)}")
+
+
+def clear_local() -> None:
+    """Vacía el LRU en memoria del proceso."""
+    with _local_lock:
+        _local.clear()
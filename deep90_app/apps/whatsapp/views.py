@@ -9,12 +9,14 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils.decorators import method_decorator
 from django.conf import settings
+from django.db import transaction
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from .services import WhatsAppService, OpenAIAssistantService
 from .models import WhatsAppUser, Conversation, Message, WhatsAppUserStatus, UserInput, AssistantConfig
-from .tasks import process_whatsapp_message, process_assistant_response
+from .dedup import claim_at_edge, release_at_edge
+from .tasks import extract_message_ids, receive_whatsapp_webhook, process_assistant_response
 from ..sports_data.models import LiveFixtureData
 from .flows import FootballDataFlow
 from .flows_config import ASSISTANT_CONFIG_FLOW_JSON, UPDATE_DATA_FLOW_JSON
@@ -23,6 +25,7 @@ logger = logging.getLogger(__name__)
 
 
 @method_decorator(csrf_exempt, name='dispatch')
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
 class WhatsAppWebhookView(View):
     """
     Vista para manejar el webhook de WhatsApp.
@@ -64,143 +67,39 @@ class WhatsAppWebhookView(View):
     def post(self, request, *args, **kwargs):
         """
         Maneja eventos y mensajes entrantes de WhatsApp.
+
+        Ruta rápida: solo se valida la firma, se descartan los reintentos de
+        mensajes ya recibidos y se encola el payload sin procesar; el registro de
+        mensajes y el alta del usuario se hacen en el worker
+        (receive_whatsapp_webhook), de modo que Meta recibe el 200 de inmediato.
+        Si no se puede encolar, los IDs reclamados se liberan y se responde 503
+        para que Meta reintente la entrega.
         """
+        if not verify_signature(request):
+            logger.warning("Webhook de WhatsApp con firma inválida")
+            return HttpResponse("Invalid signature", status=403)
+
         try:
-            # Parsear el cuerpo de la solicitud
-            body_unicode = request.body.decode('utf-8')
-            webhook_data = json.loads(body_unicode)
-            
-            logger.debug(f"Webhook data: {webhook_data}")
-            
-            # Verificar si son datos de mensajería de WhatsApp
-            if 'entry' in webhook_data and webhook_data['entry']:
-                # Procesar cada entrada (puede haber varias)
-                for entry in webhook_data['entry']:
-                    # Verificar si hay cambios en mensajería
-                    if 'changes' in entry and entry['changes']:
-                        for change in entry['changes']:
-                            # Verificar si es una notificación de WhatsApp
-                            if change.get('field') == 'messages':
-                                value = change.get('value', {})
-                                
-                                # Manejar diferentes tipos de eventos
-                                if 'messages' in value:
-                                    # Evento de mensajes
-                                    self._handle_messages(value)
-                                elif 'statuses' in value:
-                                    # Evento de estado de mensaje
-                                    self._handle_statuses(value)
-                                elif 'contacts' in value:
-                                    # Información de contacto sin mensaje
-                                    pass
-                                
-            # Responder exitosamente al webhook
+            body = request.body.decode('utf-8')
+            message_ids = extract_message_ids(json.loads(body))
+        except (ValueError, AttributeError, TypeError) as e:
+            # Un payload ilegible no se arregla reintentando: respondemos OK para que Meta no insista
+            logger.error(f"Webhook de WhatsApp con payload inválido: {e}")
             return HttpResponse("EVENT_RECEIVED", status=200)
-        
+
+        new_ids = claim_at_edge(message_ids)
+        if message_ids and not new_ids:
+            # Reintento de Meta: todos los mensajes ya se aceptaron
+            return HttpResponse("EVENT_RECEIVED", status=200)
+        try:
+            receive_whatsapp_webhook.delay(body, new_ids if message_ids else None)
         except Exception as e:
-            logger.error(f"Error processing webhook: {e}")
+            logger.error(f"Error enqueuing webhook: {e}")
             logger.error(traceback.format_exc())
-            # Aún respondemos OK para que WhatsApp no reintente continuamente
-            return HttpResponse("EVENT_RECEIVED", status=200)
-    
-    def _handle_messages(self, value):
-        """
-        Maneja mensajes entrantes de WhatsApp.
-        
-        Args:
-            value: Diccionario con los datos del mensaje
-        """
-        messages = value.get('messages', [])
-        contacts = value.get('contacts', [])
-        
-        if not messages or not contacts:
-            logger.warning("Missing messages or contacts in webhook data")
-            return
-        
-        for message in messages:
-            # Verificar que tenemos el ID del mensaje
-            if 'id' not in message:
-                continue
-            
-            # Encontrar el contacto correspondiente
-            contact = next((c for c in contacts if c.get('wa_id')), None)
-            if not contact:
-                logger.warning(f"Contact not found for message {message.get('id')}")
-                continue
-
-            # Log the message directly to ensure it's stored even if async processing fails
-            try:
-                wa_id = contact.get('wa_id')
-                message_id = message.get('id')
-                message_type = message.get('type', 'unknown')
-                
-                # Get message content based on type
-                content = ""
-                if message_type == 'text':
-                    content = message.get('text', {}).get('body', '')
-                elif message_type == 'interactive':
-                    interactive_data = message.get('interactive', {})
-                    interactive_type = interactive_data.get('type')
-                    if interactive_type == 'button_reply':
-                        button_id = interactive_data.get('button_reply', {}).get('id')
-                        button_title = interactive_data.get('button_reply', {}).get('title', '')
-                        content = f"Button: {button_title} ({button_id})"
-                    elif interactive_type == 'list_reply':
-                        list_id = interactive_data.get('list_reply', {}).get('id')
-                        list_title = interactive_data.get('list_reply', {}).get('title', '')
-                        content = f"List: {list_title} ({list_id})"
-                    else:
-                        content = f"Interactive ({interactive_type})"
-                elif message_type == 'location':
-                    location_data = message.get('location', {})
-                    latitude = location_data.get('latitude')
-                    longitude = location_data.get('longitude')
-                    content = f"Location: {latitude}, {longitude}"
-                else:
-                    content = f"Message of type {message_type}"
-                
-                # Prepare the complete webhook data for storage
-                # We use the full message and add the contact info for context
-                webhook_data = {
-                    'message': message,
-                    'contact': contact
-                }
-                
-                # Log the incoming message with complete JSON
-                self.whatsapp_service.log_message(
-                    wa_id, 
-                    content, 
-                    message_type, 
-                    True,  # is_from_user=True
-                    message_id,
-                    request_json=webhook_data,  # Store complete webhook data
-                    response_json=None  # No response for incoming messages
-                )
-            except Exception as e:
-                logger.error(f"Error logging incoming message: {e}")
-            
-            # Encolar tarea para procesar el mensaje en background con Celery
-            process_whatsapp_message.delay(contact, message)
-    
-    def _handle_statuses(self, value):
-        """
-        Maneja actualizaciones de estado de mensajes enviados.
-        
-        Args:
-            value: Diccionario con los datos de estado
-        """
-        statuses = value.get('statuses', [])
-        
-        if not statuses:
-            return
-        
-        for status in statuses:
-            status_type = status.get('status')
-            message_id = status.get('id')
-            
-            # Aquí podríamos actualizar el estado de los mensajes en la base de datos
-            # Por ahora solo registramos en log
-            logger.info(f"Message {message_id} status: {status_type}")
+            # Sin encolar, el mensaje solo sobrevive si Meta lo reintenta: liberamos los IDs y pedimos el reintento
+            release_at_edge(new_ids)
+            return HttpResponse("Error", status=503)
+        return HttpResponse("EVENT_RECEIVED", status=200)
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -1422,7 +1321,10 @@ class UpdateDataSaveView(View):
 
 def verify_signature(request):
     """
-    Verifica la firma de las solicitudes de WhatsApp usando HMAC.
+    Verifica la firma X-Hub-Signature-256 de las solicitudes de WhatsApp.
+
+    Meta firma el cuerpo con HMAC-SHA256 usando el secreto de la aplicación
+    (WHATSAPP_APP_SECRET). Si el secreto no está configurado la verificación se omite.
     
     Args:
         request: La solicitud HTTP
@@ -1430,6 +1332,8 @@ def verify_signature(request):
     Returns:
         bool: True si la firma es válida, False en caso contrario
     """
+    if not settings.WHATSAPP_APP_SECRET:
+        return True
     try:
         # Obtener la firma del encabezado
         signature = request.headers.get('X-Hub-Signature-256', '')
@@ -1439,14 +1343,10 @@ def verify_signature(request):
             
         # Extraer el hash
         signature = signature.replace('sha256=', '')
-        
-        # Cargar la clave privada
-        with open(settings.WHATSAPP_PRIVATE_KEY_PATH, 'rb') as f:
-            private_key = f.read()
             
-        # Calcular el HMAC-SHA256 con la clave privada
+        # Calcular el HMAC-SHA256 con el secreto de la aplicación
         mac = hmac.new(
-            private_key, 
+            settings.WHATSAPP_APP_SECRET.encode('utf-8'),
             msg=request.body, 
             digestmod=hashlib.sha256
         )
@@ -0,0 +1,324 @@
+"""
+Estructuras compartidas y atómicas sobre la caché (Redis).
+
+Varios módulos coordinan workers a través de la caché: runs pendientes, plazas
+de OpenAI por plan, mensajes entrantes por usuario, muestras de latencia y el
+liderazgo de la ingesta en vivo. Con django-redis (producción) cada operación
+es un comando nativo de Redis (listas, conjuntos, conjuntos ordenados, SET NX y
+scripts Lua de comparar y borrar), atómico en el servidor: sin locks de
+aplicación ni leer y reescribir el valor completo. Con otros backends
+(LocMemCache en desarrollo y tests, de un solo proceso) se emulan sobre la
+caché bajo un lock del proceso.
+
+Los valores son cadenas y las claves llevan el prefijo y la versión de la
+caché. Una clave gestionada con este módulo no debe leerse con ``cache.get``.
+"""
+import threading
+import uuid
+from typing import Dict, List, Optional, Set, Tuple
+
+from django.core.cache import caches
+
+# Serializa las operaciones emuladas (backends sin Redis, un solo proceso)
+_fallback_lock = threading.RLock()
+
+# KEYS[1]: clave; ARGV[1]: valor esperado
+COMPARE_AND_DELETE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+# KEYS[1]: clave; ARGV[1]: valor esperado; ARGV[2]: nueva expiración en milisegundos
+COMPARE_AND_EXPIRE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def _backend():
+    return caches['default']
+
+
+def get_client():
+    """Cliente de Redis del backend de caché, o None si el backend no es django-redis."""
+    client = getattr(_backend(), 'client', None)
+    if client is None or not hasattr(client, 'get_client'):
+        return None
+    return client.get_client(write=True)
+
+
+def _key(key: str) -> str:
+    return _backend().make_key(key)
+
+
+def _decode(value) -> Optional[str]:
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def _ms(seconds: float) -> int:
+    return max(1, int(seconds * 1000))
+
+
+# Valores simples ---------------------------------------------------------------
+
+def set_if_absent(key: str, value: str, ttl: float) -> bool:
+    """Guarda ``value`` solo si la clave no existe (SET NX PX). Devuelve True si se guardó."""
+    client = get_client()
+    if client is not None:
+        return bool(client.set(_key(key), value, nx=True, px=_ms(ttl)))
+    with _fallback_lock:
+        return _backend().add(key, value, ttl)
+
+
+def get_value(key: str) -> Optional[str]:
+    """Valor de una clave simple (None si no existe)."""
+    client = get_client()
+    if client is not None:
+        return _decode(client.get(_key(key)))
+    return _backend().get(key)
+
+
+def compare_and_delete(key: str, expected: str) -> bool:
+    """Borra la clave solo si aún contiene ``expected``. Devuelve True si se borró."""
+    client = get_client()
+    if client is not None:
+        return bool(client.eval(COMPARE_AND_DELETE, 1, _key(key), expected))
+    with _fallback_lock:
+        if _backend().get(key) != expected:
+            return False
+        _backend().delete(key)
+        return True
+
+
+def compare_and_expire(key: str, expected: str, ttl: float) -> bool:
+    """Renueva la expiración de la clave solo si aún contiene ``expected``. Devuelve True si se renovó."""
+    client = get_client()
+    if client is not None:
+        return bool(client.eval(COMPARE_AND_EXPIRE, 1, _key(key), expected, _ms(ttl)))
+    with _fallback_lock:
+        if _backend().get(key) != expected:
+            return False
+        _backend().set(key, expected, ttl)
+        return True
+
+
+def increment(key: str) -> int:
+    """Incrementa un contador (INCR), creándolo a 0 si no existe. Devuelve el nuevo valor."""
+    client = get_client()
+    if client is not None:
+        return client.incr(_key(key))
+    with _fallback_lock:
+        value = int(_backend().get(key) or 0) + 1
+        _backend().set(key, value, None)
+        return value
+
+
+def delete(*keys: str) -> None:
+    """Borra claves gestionadas con este módulo."""
+    client = get_client()
+    if client is not None:
+        client.delete(*[_key(key) for key in keys])
+        return
+    _backend().delete_many(keys)
+
+
+# Locks con dueño ---------------------------------------------------------------
+
+def acquire_lock(key: str, ttl: float) -> Optional[str]:
+    """
+    Intenta tomar un lock sin esperar.
+
+    Args:
+        key: Clave del lock
+        ttl: Segundos tras los que el lock expira si su dueño no lo libera
+
+    Returns:
+        Token del dueño (necesario para renovar y liberar) o None si el lock está tomado
+    """
+    token = uuid.uuid4().hex
+    return token if set_if_absent(key, token, ttl) else None
+
+
+def extend_lock(key: str, token: str, ttl: float) -> bool:
+    """Renueva un lock propio. Devuelve False si el lock expiró o ya es de otro."""
+    return compare_and_expire(key, token, ttl)
+
+
+def release_lock(key: str, token: str) -> bool:
+    """Libera un lock solo si sigue siendo del dueño del token."""
+    return compare_and_delete(key, token)
+
+
+# Listas ------------------------------------------------------------------------
+
+def list_push(key: str, *values: str) -> int:
+    """Añade valores al final de la lista (RPUSH). Devuelve la nueva longitud."""
+    client = get_client()
+    if client is not None:
+        return client.rpush(_key(key), *values)
+    with _fallback_lock:
+        items = _backend().get(key) or []
+        items.extend(values)
+        _backend().set(key, items, None)
+        return len(items)
+
+
+def list_push_capped(key: str, value: str, max_length: int) -> None:
+    """Añade un valor al principio de la lista y la recorta a ``max_length`` elementos (LPUSH + LTRIM)."""
+    client = get_client()
+    if client is not None:
+        pipe = client.pipeline()
+        pipe.lpush(_key(key), value)
+        pipe.ltrim(_key(key), 0, max_length - 1)
+        pipe.execute()
+        return
+    with _fallback_lock:
+        items = [value] + (_backend().get(key) or [])
+        _backend().set(key, items[:max_length], None)
+
+
+def list_pop(key: str) -> Optional[str]:
+    """Saca el primer valor de la lista (LPOP), o None si está vacía."""
+    client = get_client()
+    if client is not None:
+        return _decode(client.lpop(_key(key)))
+    with _fallback_lock:
+        items = _backend().get(key) or []
+        if not items:
+            return None
+        value = items.pop(0)
+        _backend().set(key, items, None)
+        return value
+
+
+def list_items(key: str) -> List[str]:
+    """Todos los valores de la lista, en orden."""
+    client = get_client()
+    if client is not None:
+        return [_decode(value) for value in client.lrange(_key(key), 0, -1)]
+    return list(_backend().get(key) or [])
+
+
+def list_length(key: str) -> int:
+    """Número de valores de la lista."""
+    client = get_client()
+    if client is not None:
+        return client.llen(_key(key))
+    return len(_backend().get(key) or [])
+
+
+# Conjuntos ---------------------------------------------------------------------
+
+def set_add(key: str, *members: str) -> None:
+    """Añade miembros al conjunto (SADD)."""
+    client = get_client()
+    if client is not None:
+        client.sadd(_key(key), *members)
+        return
+    with _fallback_lock:
+        _backend().set(key, (_backend().get(key) or set()) | set(members), None)
+
+
+def set_remove(key: str, *members: str) -> None:
+    """Quita miembros del conjunto (SREM)."""
+    client = get_client()
+    if client is not None:
+        client.srem(_key(key), *members)
+        return
+    with _fallback_lock:
+        _backend().set(key, (_backend().get(key) or set()) - set(members), None)
+
+
+def set_members(key: str) -> Set[str]:
+    """Miembros del conjunto."""
+    client = get_client()
+    if client is not None:
+        return {_decode(member) for member in client.smembers(_key(key))}
+    return set(_backend().get(key) or set())
+
+
+# Conjuntos ordenados -----------------------------------------------------------
+
+def _fallback_zset(key: str) -> Dict[str, float]:
+    return dict(_backend().get(key) or {})
+
+
+def zset_add(key: str, member: str, score: float, only_new: bool = False) -> bool:
+    """
+    Añade un miembro con su puntuación (ZADD), o actualiza la de uno existente.
+
+    Args:
+        key: Clave del conjunto
+        member: Miembro
+        score: Puntuación
+        only_new: No modificar miembros ya presentes (ZADD NX)
+
+    Returns:
+        True si el miembro es nuevo
+    """
+    client = get_client()
+    if client is not None:
+        return bool(client.zadd(_key(key), {member: score}, nx=only_new))
+    with _fallback_lock:
+        members = _fallback_zset(key)
+        is_new = member not in members
+        if is_new or not only_new:
+            members[member] = score
+            _backend().set(key, members, None)
+        return is_new
+
+
+def zset_remove(key: str, *members: str) -> int:
+    """Quita miembros (ZREM). Devuelve cuántos se quitaron."""
+    client = get_client()
+    if client is not None:
+        return client.zrem(_key(key), *members)
+    with _fallback_lock:
+        current = _fallback_zset(key)
+        removed = sum(1 for member in members if current.pop(member, None) is not None)
+        _backend().set(key, current, None)
+        return removed
+
+
+def zset_remove_below(key: str, max_score: float) -> int:
+    """Quita los miembros con puntuación menor que ``max_score``. Devuelve cuántos se quitaron."""
+    client = get_client()
+    if client is not None:
+        return client.zremrangebyscore(_key(key), '-inf', f"({max_score}")
+    with _fallback_lock:
+        current = _fallback_zset(key)
+        kept = {member: score for member, score in current.items() if score >= max_score}
+        _backend().set(key, kept, None)
+        return len(current) - len(kept)
+
+
+def zset_score(key: str, member: str) -> Optional[float]:
+    """Puntuación de un miembro (None si no está)."""
+    client = get_client()
+    if client is not None:
+        return client.zscore(_key(key), member)
+    return _fallback_zset(key).get(member)
+
+
+def zset_count(key: str) -> int:
+    """Número de miembros del conjunto."""
+    client = get_client()
+    if client is not None:
+        return client.zcard(_key(key))
+    return len(_fallback_zset(key))
+
+
+def zset_first(key: str) -> Optional[Tuple[str, float]]:
+    """Miembro de menor puntuación con su puntuación, sin quitarlo (None si el conjunto está vacío)."""
+    client = get_client()
+    if client is not None:
+        first = client.zrange(_key(key), 0, 0, withscores=True)
+        return (_decode(first[0][0]), first[0][1]) if first else None
+    members = _fallback_zset(key)
+    if not members:
+        return None
+    member = min(members, key=lambda name: (members[name], name))
+    return member, members[member]
@@ -0,0 +1,5 @@
+;document.addEventListener('DOMContentLoaded',function(){const sidebarToggleBtn=document.getElementById('sidebar-toggle');const themeToggleBtn=document.getElementById('theme-toggle');const body=document.body;if(localStorage.getItem('darkMode')==='enabled'){body.classList.add('dark-theme');updateThemeIcon(true);}
+if(localStorage.getItem('sidebarCollapsed')==='true'){body.classList.add('sidebar-collapsed');updateSidebarIcon(true);}
+sidebarToggleBtn.addEventListener('click',function(){const isCollapsed=body.classList.toggle('sidebar-collapsed');localStorage.setItem('sidebarCollapsed',isCollapsed);updateSidebarIcon(isCollapsed);});themeToggleBtn.addEventListener('click',function(){const isDarkMode=body.classList.toggle('dark-theme');localStorage.setItem('darkMode',isDarkMode?'enabled':'disabled');updateThemeIcon(isDarkMode);});function updateThemeIcon(isDarkMode){const icon=themeToggleBtn.querySelector('i');if(isDarkMode){icon.classList.replace('fa-moon','fa-sun');themeToggleBtn.setAttribute('title','Cambiar a modo claro');}else{icon.classList.replace('fa-sun','fa-moon');themeToggleBtn.setAttribute('title','Cambiar a modo oscuro');}}
+function updateSidebarIcon(isCollapsed){const icon=sidebarToggleBtn.querySelector('i');if(isCollapsed){icon.classList.replace('fa-times','fa-bars');sidebarToggleBtn.setAttribute('title','Expandir menú lateral');}else{icon.classList.replace('fa-bars','fa-times');sidebarToggleBtn.setAttribute('title','Colapsar menú lateral');}}
+document.addEventListener('click',function(event){const windowWidth=window.innerWidth;if(windowWidth<=768&&!event.target.closest('.sidebar')&&!event.target.closest('#sidebar-toggle')&&body.classList.contains('sidebar-visible')){body.classList.remove('sidebar-visible');}});if(window.innerWidth<=768){sidebarToggleBtn.addEventListener('click',function(event){event.stopPropagation();body.classList.toggle('sidebar-visible');});}});;
\ No newline at end of file